@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+
+from common.config import settings
+from common.llm import LLMClient
+
+from .ollama import OllamaBackend, build_chat_body
+from .scheduler import Gateway, ModelScheduler, QueueFullError
+
+
+class ChatMessage(BaseModel):
+    role: Literal["system", "user", "assistant"]
+    content: str
+
+
+class ChatRequest(BaseModel):
+    persona: Dict[str, Any] = Field(default_factory=dict)
+    system: str = ""
+    messages: List[ChatMessage] = Field(default_factory=list)
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    model: Optional[str] = None
+    stream: bool = False
+
+
+async def _ndjson(chunks: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    parts: List[str] = []
+    try:
+        async for delta in chunks:
+            parts.append(delta)
+            yield (json.dumps({"delta": delta}, ensure_ascii=False) + "\n").encode("utf-8")
+    except httpx.HTTPError:
+        yield (json.dumps({"error": "ollama_unavailable"}) + "\n").encode("utf-8")
+        return
+    yield (json.dumps({"done": True, "reply": "".join(parts).strip()}, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def create_app(ollama_transport: Optional[httpx.AsyncBaseTransport] = None) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        client = LLMClient(
+            str(settings.ollama_base_url),
+            max_connections=settings.llm_pool_max_connections,
+            max_keepalive_connections=settings.llm_pool_max_keepalive,
+            keepalive_expiry=settings.llm_keepalive_expiry_seconds,
+            connect_timeout=settings.llm_connect_timeout_seconds,
+            read_timeout=settings.ollama_timeout_seconds,
+            max_in_flight=settings.llm_pool_max_connections,
+            transport=ollama_transport,
+        )
+        app.state.gateway = Gateway(
+            OllamaBackend(client),
+            workers=settings.gateway_workers_per_model,
+            queue_size=settings.gateway_queue_size,
+            retry_after_max=settings.gateway_retry_after_max_seconds,
+        )
+        app.state.ollama_client = client
+        try:
+            yield
+        finally:
+            await app.state.gateway.close()
+            await client.aclose()
+
+    app = FastAPI(title="CISEC Nexus API", lifespan=lifespan)
+
+    def _scheduler(request: Request, model: str) -> ModelScheduler:
+        return request.app.state.gateway.scheduler(model)
+
+    @app.post("/llm/chat")
+    async def llm_chat(payload: ChatRequest, request: Request):
+        model = payload.model or settings.ollama_model
+        body = build_chat_body(
+            model,
+            payload.system,
+            payload.persona,
+            [message.model_dump() for message in payload.messages],
+            payload.temperature,
+            payload.max_tokens,
+        )
+        scheduler = _scheduler(request, model)
+        try:
+            if payload.stream:
+                chunks = scheduler.open_stream(body)
+                return StreamingResponse(_ndjson(chunks), media_type="application/x-ndjson")
+            reply = await scheduler.submit(body)
+        except QueueFullError as exc:
+            raise HTTPException(
+                status_code=503,
+                detail="Servicio saturado, intenta nuevamente en unos segundos.",
+                headers={"Retry-After": str(exc.retry_after)},
+            )
+        except httpx.HTTPError:
+            raise HTTPException(status_code=502, detail="Ollama no disponible.")
+        return {"reply": reply, "model": model}
+
+    @app.get("/metrics")
+    async def metrics(request: Request) -> Dict[str, Any]:
+        return {
+            "models": request.app.state.gateway.snapshot(),
+            "ollama": request.app.state.ollama_client.stats(),
+        }
+
+    @app.get("/health")
+    async def health() -> Dict[str, str]:
+        return {"status": "ok"}
+
+    return app
+
+
+app = create_app()
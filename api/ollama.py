@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from common.config import settings
+from common.llm import LLMClient
+
+
+def build_chat_body(
+    model: str,
+    system: str,
+    persona: Dict[str, Any],
+    messages: List[Dict[str, str]],
+    temperature: Optional[float],
+    max_tokens: Optional[int],
+) -> Dict[str, Any]:
+    if not system and persona:
+        system = "Actúa como el paciente descrito:\n" + json.dumps(persona, ensure_ascii=False)
+    chat: List[Dict[str, str]] = []
+    if system:
+        chat.append({"role": "system", "content": system})
+    chat.extend(messages)
+    return {
+        "model": model,
+        "messages": chat,
+        "options": {
+            "temperature": settings.ollama_temperature if temperature is None else temperature,
+            "num_predict": max_tokens or settings.ollama_max_tokens,
+        },
+    }
+
+
+class OllamaBackend:
+    def __init__(self, client: LLMClient) -> None:
+        self._client = client
+
+    async def chat(self, body: Dict[str, Any]) -> str:
+        data = await self._client.post_json("/api/chat", {**body, "stream": False})
+        message = data.get("message") or {}
+        return str(message.get("content", "")).strip()
+
+    async def stream_chat(self, body: Dict[str, Any]) -> AsyncIterator[str]:
+        async for chunk in self._client.stream_json("/api/chat", {**body, "stream": True}):
+            content = (chunk.get("message") or {}).get("content")
+            if content:
+                yield content
+            if chunk.get("done"):
+                break
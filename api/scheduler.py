@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Protocol
+
+from common.metrics import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+_END_OF_STREAM = object()
+
+
+class ChatBackend(Protocol):
+    async def chat(self, body: Dict[str, Any]) -> str: ...
+
+    def stream_chat(self, body: Dict[str, Any]) -> AsyncIterator[str]: ...
+
+
+class QueueFullError(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__(f"Cola llena, reintentar en {retry_after}s")
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Job:
+    body: Dict[str, Any]
+    enqueued_at: float
+    key: Optional[str] = None
+    future: Optional[asyncio.Future[str]] = None
+    chunks: Optional[asyncio.Queue[object]] = None
+    cancelled: bool = False
+
+
+@dataclass
+class _Counters:
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    coalesced: int = 0
+
+
+def _job_key(body: Dict[str, Any]) -> str:
+    canonical = json.dumps(body, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ModelScheduler:
+    def __init__(self, model: str, backend: ChatBackend, *, workers: int, queue_size: int, retry_after_max: int) -> None:
+        self.model = model
+        self.workers = workers
+        self.retry_after_max = retry_after_max
+        self._backend = backend
+        self._queue: asyncio.Queue[_Job] = asyncio.Queue(maxsize=queue_size)
+        self._pending: Dict[str, asyncio.Future[str]] = {}
+        self._tasks: List[asyncio.Task[None]] = []
+        self.active = 0
+        self.counters = _Counters()
+        self.latency = LatencyRecorder()
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"llm-{self.model}-{index}") for index in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def retry_after(self) -> int:
+        service = self.latency.snapshot().get("service")
+        mean_seconds = service["mean_ms"] / 1000 if service else 5.0
+        backlog = self._queue.qsize() + self.active
+        estimate = math.ceil(backlog * mean_seconds / max(1, self.workers))
+        return max(1, min(self.retry_after_max, estimate))
+
+    def _enqueue(self, job: _Job) -> None:
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.counters.rejected += 1
+            raise QueueFullError(self.retry_after()) from None
+
+    async def submit(self, body: Dict[str, Any]) -> str:
+        key = _job_key(body)
+        shared = self._pending.get(key)
+        if shared is not None:
+            self.counters.coalesced += 1
+            return await asyncio.shield(shared)
+
+        future: asyncio.Future[str] = asyncio.get_running_loop().create_future()
+        self._enqueue(_Job(body=body, enqueued_at=time.perf_counter(), key=key, future=future))
+        self._pending[key] = future
+        return await asyncio.shield(future)
+
+    def open_stream(self, body: Dict[str, Any]) -> AsyncIterator[str]:
+        job = _Job(body=body, enqueued_at=time.perf_counter(), chunks=asyncio.Queue())
+        self._enqueue(job)
+        return self._consume(job)
+
+    async def _consume(self, job: _Job) -> AsyncIterator[str]:
+        assert job.chunks is not None
+        try:
+            while True:
+                item = await job.chunks.get()
+                if item is _END_OF_STREAM:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield str(item)
+        finally:
+            job.cancelled = True
+
+    async def _run(self, job: _Job) -> None:
+        if job.chunks is not None:
+            try:
+                async for delta in self._backend.stream_chat(job.body):
+                    if job.cancelled:
+                        break
+                    job.chunks.put_nowait(delta)
+            except Exception as exc:
+                job.chunks.put_nowait(exc)
+                raise
+            job.chunks.put_nowait(_END_OF_STREAM)
+            return
+
+        assert job.future is not None
+        try:
+            reply = await self._backend.chat(job.body)
+        except Exception as exc:
+            if not job.future.done():
+                job.future.set_exception(exc)
+            raise
+        if not job.future.done():
+            job.future.set_result(reply)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            started = time.perf_counter()
+            self.latency.observe("queue_wait", started - job.enqueued_at)
+            self.active += 1
+            try:
+                await self._run(job)
+                self.counters.completed += 1
+            except Exception:
+                self.counters.failed += 1
+                logger.exception("Fallo la llamada a %s", self.model)
+            finally:
+                self.active -= 1
+                self.latency.observe("service", time.perf_counter() - started)
+                if job.key is not None:
+                    self._pending.pop(job.key, None)
+                self._queue.task_done()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "workers": self.workers,
+            "active": self.active,
+            "queue_depth": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "completed": self.counters.completed,
+            "failed": self.counters.failed,
+            "rejected": self.counters.rejected,
+            "coalesced": self.counters.coalesced,
+            "latency": self.latency.snapshot(),
+        }
+
+
+class Gateway:
+    def __init__(self, backend: ChatBackend, *, workers: int, queue_size: int, retry_after_max: int) -> None:
+        self._backend = backend
+        self._workers = workers
+        self._queue_size = queue_size
+        self._retry_after_max = retry_after_max
+        self._schedulers: Dict[str, ModelScheduler] = {}
+
+    def scheduler(self, model: str) -> ModelScheduler:
+        scheduler = self._schedulers.get(model)
+        if scheduler is None:
+            scheduler = ModelScheduler(
+                model,
+                self._backend,
+                workers=self._workers,
+                queue_size=self._queue_size,
+                retry_after_max=self._retry_after_max,
+            )
+            scheduler.start()
+            self._schedulers[model] = scheduler
+        return scheduler
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {model: scheduler.snapshot() for model, scheduler in self._schedulers.items()}
+
+    async def close(self) -> None:
+        for scheduler in self._schedulers.values():
+            await scheduler.stop()
+        self._schedulers.clear()
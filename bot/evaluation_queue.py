@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import AsyncContextManager, Awaitable, Callable, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from common.config import settings
+from common.db import EvaluationJob, get_session
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[EvaluationJob, bool], Awaitable[None]]
+
+RETRY_BASE_SECONDS = 10
+LEASE_SECONDS = 60.0
+
+
+class EvaluationWorker:
+    def __init__(
+        self,
+        handler: JobHandler,
+        *,
+        workers: int,
+        max_attempts: int,
+        poll_interval: float = 5.0,
+        lease_seconds: float = LEASE_SECONDS,
+        session_factory: Callable[[], AsyncContextManager[AsyncSession]] = get_session,
+    ) -> None:
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._last_sweep = 0.0
+        self._handler = handler
+        self._session_factory = session_factory
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task[None]] = []
+        self.processed = 0
+
+    async def start(self) -> None:
+        await self.requeue_stale()
+        self._tasks = [
+            asyncio.create_task(self._run(), name=f"evaluation-worker-{index}") for index in range(self.workers)
+        ]
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def requeue_stale(self) -> int:
+        self._last_sweep = time.monotonic()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        async with self._session_factory() as session:
+            result = await session.execute(
+                update(EvaluationJob)
+                .where(EvaluationJob.status == "running", EvaluationJob.updated_at < cutoff)
+                .values(status="queued", updated_at=datetime.utcnow())
+            )
+            await session.commit()
+        return result.rowcount or 0
+
+    async def claim(self) -> Optional[EvaluationJob]:
+        now = datetime.utcnow()
+        async with self._session_factory() as session:
+            candidates = await session.scalars(
+                select(EvaluationJob.id)
+                .where(EvaluationJob.status == "queued", EvaluationJob.next_attempt_at <= now)
+                .order_by(EvaluationJob.id)
+                .limit(self.workers * 2)
+            )
+            for job_id in candidates.all():
+                result = await session.execute(
+                    update(EvaluationJob)
+                    .where(EvaluationJob.id == job_id, EvaluationJob.status == "queued")
+                    .values(status="running", attempts=EvaluationJob.attempts + 1, updated_at=now)
+                )
+                if result.rowcount == 1:
+                    await session.commit()
+                    return await session.get(EvaluationJob, job_id, populate_existing=True)
+            await session.rollback()
+        return None
+
+    async def _finish(self, job: EvaluationJob, error: Optional[str]) -> None:
+        now = datetime.utcnow()
+        if error is None:
+            values = {"status": "done", "last_error": None, "updated_at": now}
+        elif job.attempts >= self.max_attempts:
+            values = {"status": "failed", "last_error": error, "updated_at": now}
+        else:
+            delay = RETRY_BASE_SECONDS * 2 ** (job.attempts - 1)
+            values = {
+                "status": "queued",
+                "last_error": error,
+                "next_attempt_at": now + timedelta(seconds=delay),
+                "updated_at": now,
+            }
+        async with self._session_factory() as session:
+            await session.execute(
+                update(EvaluationJob)
+                .where(
+                    EvaluationJob.id == job.id,
+                    EvaluationJob.status == "running",
+                    EvaluationJob.attempts == job.attempts,
+                )
+                .values(**values)
+            )
+            await session.commit()
+
+    async def _heartbeat(self, job_id: int) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                async with self._session_factory() as session:
+                    await session.execute(
+                        update(EvaluationJob)
+                        .where(EvaluationJob.id == job_id, EvaluationJob.status == "running")
+                        .values(updated_at=datetime.utcnow())
+                    )
+                    await session.commit()
+            except SQLAlchemyError:
+                logger.warning("No se pudo renovar la evaluación %s", job_id, exc_info=True)
+
+    async def run_once(self) -> bool:
+        if time.monotonic() - self._last_sweep >= self.lease_seconds / 3:
+            await self.requeue_stale()
+        job = await self.claim()
+        if job is None:
+            return False
+        heartbeat = asyncio.create_task(self._heartbeat(job.id), name=f"evaluation-lease-{job.id}")
+        try:
+            await self._handler(job, job.attempts >= self.max_attempts)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.warning("Evaluación %s falló (intento %d)", job.id, job.attempts, exc_info=True)
+            await self._finish(job, repr(exc))
+        else:
+            await self._finish(job, None)
+            self.processed += 1
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if await self.run_once():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error en el worker de evaluaciones")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+_worker: Optional[EvaluationWorker] = None
+
+
+async def start_evaluation_worker(handler: JobHandler) -> EvaluationWorker:
+    global _worker
+    if _worker is None:
+        _worker = EvaluationWorker(
+            handler,
+            workers=settings.evaluation_workers,
+            max_attempts=settings.evaluation_max_attempts,
+        )
+        await _worker.start()
+    return _worker
+
+
+def notify_evaluation_worker() -> None:
+    if _worker is not None:
+        _worker.notify()
+
+
+async def stop_evaluation_worker() -> None:
+    global _worker
+    if _worker is not None:
+        await _worker.stop()
+        _worker = None
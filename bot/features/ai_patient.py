@@ -1,24 +1,49 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
+import time
 from datetime import datetime, timezone
-from typing import Dict, List, Optional
+from typing import AsyncIterator, Dict, List, Optional
 
 import httpx
+from redis.exceptions import RedisError
 from sqlalchemy import select
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Message, Update
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import ContextTypes
 
 from common.config import settings
-from common.db import Patient, SimLog, SimSession, get_session
-
+from common.db import (
+    EvaluationJob,
+    Patient,
+    SimLog,
+    SimSession,
+    after_commit,
+    get_session,
+    release_connection,
+)
+from common.invalidation import get_patient_version
+from common.llm import get_llm_client
+from common.redis_client import get_redis
+from common.retrieval import PassageIndex
+from common.text import CHARS_PER_TOKEN
+
+from ..evaluation_queue import notify_evaluation_worker
+from ..history import ConversationSummary, HistoryBuffer, HistoryEntry, split_by_tokens
 from ..i18n_es import STRINGS
-from ..menus import build_back_to_menu_button
+from ..log_sink import get_log_sink
+from ..menus import PATIENT_TERMINATE, SESSION_KEY, build_back_to_menu_button
+from ..throttle import TokenBucket
+from .patient_cache import get_persona_cache
+from .response_cache import get_response_cache
+
+logger = logging.getLogger(__name__)
 
 PATIENT_PANEL_LABS = "PATIENT_LABS"
 PATIENT_PANEL_IMAGES = "PATIENT_IMAGES"
 PATIENT_PANEL_EXAM = "PATIENT_EXAM"
-PATIENT_TERMINATE = "PATIENT_END"
 
 PATIENT_PANELS = {
     PATIENT_PANEL_LABS: STRINGS.PATIENT_PANEL_LABELS["labs"],
@@ -27,11 +52,13 @@ PATIENT_PANELS = {
     PATIENT_TERMINATE: STRINGS.PATIENT_PANEL_LABELS["end"],
 }
 
-SESSION_KEY = "patient_session_id"
-PATIENT_CACHE_KEY = "patient_cache"
-MAX_HISTORY_MESSAGES = 12
+MAX_HISTORY_MESSAGES = 40
+MAX_RECENT_MESSAGES = MAX_HISTORY_MESSAGES // 2
 RUBRIC_DIMENSIONS = STRINGS.PATIENT_EVAL_DIMENSIONS
 
+_history_buffer = HistoryBuffer(MAX_HISTORY_MESSAGES, max_sessions=settings.history_buffer_sessions)
+_fold_tasks: Dict[int, asyncio.Task[ConversationSummary]] = {}
+
 
 def _build_patient_keyboard() -> InlineKeyboardMarkup:
     rows = [
@@ -44,10 +71,16 @@ def _build_patient_keyboard() -> InlineKeyboardMarkup:
 
 
 async def _fetch_patient(context: ContextTypes.DEFAULT_TYPE) -> Optional[Dict[str, object]]:
-    cache: Dict[str, Dict[str, object]] = context.application_data.setdefault(PATIENT_CACHE_KEY, {})
-    slug = settings.default_patient_slug
-    if slug in cache:
-        return cache[slug]
+    slug = context.user_data.get("patient_slug") or settings.default_patient_slug
+    cache = get_persona_cache()
+    entry = cache.get(slug)
+    if entry is not None:
+        return entry.data
+
+    try:
+        version = await get_patient_version(get_redis(), slug)
+    except RedisError:
+        version = 0
 
     async with get_session() as session:
         patient = await session.scalar(select(Patient).where(Patient.slug == slug))
@@ -59,9 +92,11 @@ async def _fetch_patient(context: ContextTypes.DEFAULT_TYPE) -> Optional[Dict[st
             "display_name": patient.display_name,
             "summary": patient.summary or "Caso clínico en simulación.",
             "persona": patient.persona or {},
+            "retriever": PassageIndex.from_payload(patient.retrieval) if patient.retrieval else None,
+            "version": version,
         }
-        cache[slug] = data
-        return data
+    cache.put(slug, data, version)
+    return data
 
 
 async def _get_or_create_session(user_id: int, patient_id: int) -> SimSession:
@@ -85,22 +120,126 @@ async def _get_or_create_session(user_id: int, patient_id: int) -> SimSession:
 
 
 async def _append_log(session_id: int, role: str, message: str, metadata: Optional[Dict[str, object]] = None) -> None:
-    async with get_session() as session:
-        log = SimLog(session_id=session_id, role=role, message=message, extra=metadata or {})
-        session.add(log)
-        await session.commit()
+    row = get_log_sink().append(session_id, role, message, metadata)
+    _history_buffer.append(session_id, HistoryEntry(role, message, row["created_at"]))
+
 
+async def _load_history(session_id: int) -> List[HistoryEntry]:
+    cached = _history_buffer.get(session_id)
+    if cached is not None:
+        return cached
 
-async def _load_history(session_id: int) -> List[SimLog]:
+    sink = get_log_sink()
+    if sink.has_pending(session_id):
+        await sink.flush()
     async with get_session() as session:
-        result = await session.scalars(
-            select(SimLog).where(SimLog.session_id == session_id).order_by(SimLog.created_at.asc())
+        result = await session.execute(
+            select(SimLog.role, SimLog.message, SimLog.created_at)
+            .where(SimLog.session_id == session_id)
+            .order_by(SimLog.created_at.desc(), SimLog.id.desc())
+            .limit(MAX_HISTORY_MESSAGES)
         )
-        logs = result.all()
-        return logs[-MAX_HISTORY_MESSAGES:]
+        entries = [HistoryEntry(*row) for row in reversed(result.all())]
+    _history_buffer.prime(session_id, entries)
+    return entries
+
+
+async def _load_summary(session_id: int) -> ConversationSummary:
+    cached = _history_buffer.get_summary(session_id)
+    if cached is not None:
+        return cached
+    async with get_session() as session:
+        sim_session = await session.get(SimSession, session_id)
+        summary = ConversationSummary.from_json(sim_session.summary if sim_session else None)
+    _history_buffer.set_summary(session_id, summary)
+    return summary
+
+
+def _format_transcript(entries: List[HistoryEntry]) -> str:
+    speakers = {"student": "Estudiante", "patient": "Paciente"}
+    return "\n".join(f"{speakers[entry.role]}: {entry.message}" for entry in entries if entry.role in speakers)
+
+
+def _clip_to_tokens(text: str, budget: int) -> str:
+    limit = budget * CHARS_PER_TOKEN
+    return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+
+async def _fold_history(
+    session_id: int, summary: ConversationSummary, older: List[HistoryEntry]
+) -> ConversationSummary:
+    transcript = _format_transcript(older)
+    text = ""
+    if transcript:
+        payload = {
+            "persona": {},
+            "system": (
+                "Resume la entrevista clínica en español neutro, en tercera persona y en pocas frases. "
+                "Conserva los datos que el paciente ya contó y las preguntas que el estudiante ya hizo. "
+                "No agregues diagnósticos ni información nueva."
+            ),
+            "messages": [
+                {
+                    "role": "user",
+                    "content": f"Resumen previo: {summary.text or 'sin resumen'}\n\nTurnos nuevos:\n{transcript}",
+                }
+            ],
+            "temperature": 0.2,
+            "max_tokens": settings.history_summary_tokens,
+        }
+        try:
+            text = (await _call_llm(payload)).strip()
+        except httpx.HTTPError:
+            text = ""
+        if not text:
+            text = " ".join(part for part in (summary.text, transcript.replace("\n", " ")) if part)
+    updated = ConversationSummary(
+        text=_clip_to_tokens(text or summary.text, settings.history_summary_tokens),
+        through=older[-1].created_at,
+        turns=summary.turns + len(older),
+    )
+    async with get_session() as session:
+        sim_session = await session.get(SimSession, session_id)
+        if sim_session:
+            sim_session.summary = updated.to_json()
+            await session.commit()
+    _history_buffer.set_summary(session_id, updated)
+    return updated
+
+
+def _schedule_fold(session_id: int, summary: ConversationSummary, older: List[HistoryEntry]) -> None:
+    if session_id in _fold_tasks:
+        return
+    task = asyncio.create_task(_fold_history(session_id, summary, older), name=f"history-fold-{session_id}")
+    _fold_tasks[session_id] = task
+    task.add_done_callback(lambda _: _fold_tasks.pop(session_id, None))
 
 
-def _history_to_messages(logs: List[SimLog]) -> List[Dict[str, str]]:
+async def _build_conversation(
+    session_id: int, wait: bool = False
+) -> tuple[ConversationSummary, List[HistoryEntry]]:
+    history = await _load_history(session_id)
+    summary = await _load_summary(session_id)
+    budget = settings.history_token_budget
+    pending = summary.pending(history)
+    older, recent = split_by_tokens(pending, budget, MAX_RECENT_MESSAGES)
+    if not older:
+        return summary, recent
+    if wait:
+        await release_connection()
+        running = _fold_tasks.get(session_id)
+        if running is not None:
+            summary = await running
+            older, recent = split_by_tokens(summary.pending(history), budget, MAX_RECENT_MESSAGES)
+        if older:
+            summary = await _fold_history(session_id, summary, older)
+        return summary, recent
+    folded, _ = split_by_tokens(pending, budget // 2, MAX_RECENT_MESSAGES // 2)
+    _schedule_fold(session_id, summary, folded)
+    return summary, recent
+
+
+def _history_to_messages(logs: List[HistoryEntry]) -> List[Dict[str, str]]:
     messages: List[Dict[str, str]] = []
     for entry in logs:
         if entry.role not in {"student", "patient"}:
@@ -111,14 +250,115 @@ def _history_to_messages(logs: List[SimLog]) -> List[Dict[str, str]]:
 
 
 async def _call_llm(payload: Dict[str, object]) -> str:
-    async with httpx.AsyncClient(timeout=settings.ollama_timeout_seconds) as client:
-        response = await client.post(f"{settings.api_base_url}/llm/chat", json=payload)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("reply", "Lo siento, no pude generar una respuesta en este momento.")
+    data = await get_llm_client().post_json("/llm/chat", payload)
+    return data.get("reply", "Lo siento, no pude generar una respuesta en este momento.")
+
+
+async def _stream_llm(payload: Dict[str, object]) -> AsyncIterator[str]:
+    async for chunk in get_llm_client().stream_json("/llm/chat", {**payload, "stream": True}):
+        delta = chunk.get("delta")
+        if delta:
+            yield delta
+
+
+_edit_budget: Optional[TokenBucket] = None
+
+
+def _get_edit_budget() -> TokenBucket:
+    global _edit_budget
+    if _edit_budget is None:
+        _edit_budget = TokenBucket(settings.llm_stream_global_edits_per_second)
+    return _edit_budget
+
+
+async def _edit_reply(message: Message, text: str, final: bool = False) -> bool:
+    budget = _get_edit_budget()
+    if final:
+        await budget.acquire()
+    elif not budget.try_acquire():
+        return False
+    try:
+        await message.edit_text(text)
+    except RetryAfter as exc:
+        if not final:
+            return False
+        await asyncio.sleep(exc.retry_after)
+        await message.edit_text(text)
+    except BadRequest as exc:
+        if "not modified" in str(exc).lower():
+            return True
+        if not final:
+            return False
+        raise
+    except TelegramError:
+        if not final:
+            return False
+        raise
+    return True
+
+
+async def _stream_patient_reply(message: Message, payload: Dict[str, object]) -> str:
+    header = f"{STRINGS.AI_DISCLAIMER}\n\n"
+    started = time.monotonic()
+    placeholder = await message.reply_text(header + STRINGS.PATIENT_TYPING)
+    parts: List[str] = []
+    shown = ""
+    last_edit = 0.0
+    first_visible = True
+    try:
+        async for delta in _stream_llm(payload):
+            parts.append(delta)
+            now = time.monotonic()
+            if now - last_edit < settings.llm_stream_edit_interval_seconds:
+                continue
+            partial = "".join(parts).strip()
+            if not partial or partial == shown:
+                continue
+            if await _edit_reply(placeholder, f"{header}{partial} …"):
+                shown = partial
+                last_edit = now
+                if first_visible:
+                    get_llm_client().latency.observe("patient:first_visible", now - started)
+                    first_visible = False
+    except httpx.HTTPError:
+        parts = []
+
+    reply = "".join(parts).strip() or STRINGS.PATIENT_CONFUSED
+    try:
+        await _edit_reply(placeholder, header + reply, final=True)
+    except TelegramError:
+        logger.warning("No se pudo editar la respuesta del paciente; se envía como mensaje nuevo", exc_info=True)
+        try:
+            await message.reply_text(header + reply)
+        except TelegramError:
+            logger.warning("No se pudo entregar la respuesta del paciente", exc_info=True)
+    return reply
 
 
-def _build_system_prompt(persona: Dict[str, object]) -> str:
+async def _cached_reply(key: str) -> Optional[str]:
+    try:
+        return await get_response_cache().get(key)
+    except RedisError:
+        return None
+
+
+async def _store_reply(key: str, reply: str, generation_seconds: float) -> None:
+    try:
+        await get_response_cache().put(key, reply, generation_seconds)
+    except RedisError:
+        pass
+
+
+def _retrieve_passages(patient: Dict[str, object], question: str) -> List[str]:
+    retriever = patient.get("retriever")
+    if not isinstance(retriever, PassageIndex):
+        return []
+    return retriever.top_passages(question, settings.retrieval_top_k, settings.retrieval_token_budget)
+
+
+def _build_system_prompt(
+    persona: Dict[str, object], passages: Optional[List[str]] = None, summary: str = ""
+) -> str:
     demographics = persona.get("demografia") or "Paciente sin datos demográficos específicos."
     antecedentes = persona.get("antecedentes") or "Sin antecedentes registrados."
     motivo = persona.get("motivo_consulta") or "Sin motivo de consulta declarado."
@@ -129,13 +369,19 @@ def _build_system_prompt(persona: Dict[str, object]) -> str:
         "Fundamenta tus respuestas únicamente en la información proporcionada; si algo no está documentado, admite desconocimiento o neutralidad. "
         "Nunca reveles diagnósticos ni tratamientos ni sugieras decisiones médicas finales."
     )
-    return (
+    prompt = (
         f"{instructions}\n\n"
         f"Demografía: {demographics}\n"
         f"Motivo de consulta: {motivo}\n"
         f"Antecedentes: {antecedentes}\n"
         f"Narrativa adicional: {narrative}"
     )
+    if passages:
+        fragments = "\n".join(f"- {passage}" for passage in passages)
+        prompt += f"\n\nFragmentos de la historia clínica relevantes para la pregunta actual:\n{fragments}"
+    if summary:
+        prompt += f"\n\nResumen de la entrevista hasta ahora (mantén la coherencia con él):\n{summary}"
+    return prompt
 
 
 def _extract_json_payload(raw: str) -> str:
@@ -271,25 +517,53 @@ async def handle_patient_message(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     await _append_log(session_id, "student", user_text)
-    history = await _load_history(session_id)
-    messages = _history_to_messages(history)
-    system_prompt = _build_system_prompt(patient["persona"])
+    summary, recent = await _build_conversation(session_id)
+    messages = _history_to_messages(recent)
+    if not messages or messages[-1] != {"role": "user", "content": user_text}:
+        messages.append({"role": "user", "content": user_text})
+    passages = _retrieve_passages(patient, user_text)
+    system_prompt = _build_system_prompt(patient["persona"], passages, summary.text)
 
     payload = {
         "persona": patient["persona"],
         "system": system_prompt,
-        "messages": messages + [{"role": "user", "content": user_text}],
+        "messages": messages,
         "temperature": settings.ollama_temperature,
         "max_tokens": settings.ollama_max_tokens,
     }
 
-    try:
-        reply = await _call_llm(payload)
-    except httpx.HTTPError:
-        reply = "Estoy un poco confundida, ¿podrías repetir la pregunta?"
+    cache_key = None
+    if settings.response_cache_enabled:
+        previous_turns = summary.turns + len(messages) - 1
+        cache_key = get_response_cache().key(
+            str(patient["slug"]),
+            int(patient.get("version") or 0),
+            user_text,
+            previous_turns,
+            [message["content"] for message in messages[:-1]],
+        )
+        cached = await _cached_reply(cache_key)
+        if cached:
+            await _append_log(session_id, "patient", cached, {"cached": True})
+            await update.message.reply_text(f"{STRINGS.AI_DISCLAIMER}\n\n{cached}")
+            return
+
+    await release_connection()
+    started = time.monotonic()
+    if settings.llm_streaming:
+        reply = await _stream_patient_reply(update.message, payload)
+        await _append_log(session_id, "patient", reply)
+    else:
+        try:
+            reply = await _call_llm(payload)
+        except httpx.HTTPError:
+            reply = STRINGS.PATIENT_CONFUSED
 
-    await _append_log(session_id, "patient", reply)
-    await update.message.reply_text(f"{STRINGS.AI_DISCLAIMER}\n\n{reply}")
+        await _append_log(session_id, "patient", reply)
+        await update.message.reply_text(f"{STRINGS.AI_DISCLAIMER}\n\n{reply}")
+
+    if cache_key and reply != STRINGS.PATIENT_CONFUSED:
+        await _store_reply(cache_key, reply, time.monotonic() - started)
 
 
 async def handle_patient_termination(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -300,7 +574,37 @@ async def handle_patient_termination(update: Update, context: ContextTypes.DEFAU
             await update.callback_query.answer(STRINGS.PATIENT_NO_ACTIVE_SESSION, show_alert=True)
         return
 
-    history = await _load_history(session_id)
+    if update.callback_query:
+        await update.callback_query.answer()
+    if update.effective_chat:
+        chat_id = update.effective_chat.id
+    else:
+        chat_id = update.effective_user.id if update.effective_user else 0
+
+    sink = get_log_sink()
+    if sink.has_pending(session_id):
+        await sink.flush()
+    async with get_session() as session:
+        sim_session = await session.get(SimSession, session_id)
+        if sim_session:
+            sim_session.status = "evaluating"
+        session.add(EvaluationJob(session_id=session_id, chat_id=chat_id, payload={"persona": patient["persona"]}))
+        await session.commit()
+    after_commit(notify_evaluation_worker)
+
+    await _append_log(session_id, "system", "evaluacion:en_cola")
+    _history_buffer.discard(session_id)
+    context.user_data.pop(SESSION_KEY, None)
+    context.user_data.pop("patient_slug", None)
+    if update.callback_query:
+        await update.callback_query.edit_message_text(STRINGS.PATIENT_EVAL_QUEUED)
+    else:
+        await update.message.reply_text(STRINGS.PATIENT_EVAL_QUEUED)
+
+
+async def _evaluation_payload(session_id: int, persona: object) -> Dict[str, object]:
+    summary, history = await _build_conversation(session_id, wait=True)
+    _history_buffer.discard(session_id)
     evaluation_prompt = (
         "Eres tutora clínica. Evalúa la interacción según la conversación previa. "
         "Para cada dimensión (anamnesis, hipótesis, examen físico, uso de pruebas, próximos pasos) "
@@ -311,46 +615,51 @@ async def handle_patient_termination(update: Update, context: ContextTypes.DEFAU
         "\"resumen\":\"comentario final sin diagnóstico ni tratamiento\"}. "
         "No repitas instrucciones y responde siempre en español neutro."
     )
+    if summary.text:
+        evaluation_prompt += f" Resumen de la primera parte de la entrevista: {summary.text}"
     messages = _history_to_messages(history)
-    payload = {
-        "persona": patient["persona"],
+    return {
+        "persona": persona,
         "system": evaluation_prompt,
         "messages": messages,
         "temperature": 0.2,
         "max_tokens": 400,
     }
 
+
+async def process_evaluation(bot: Bot, job: EvaluationJob, final: bool) -> None:
+    payload = job.payload
+    if "messages" not in payload:
+        payload = await _evaluation_payload(job.session_id, payload.get("persona", {}))
     try:
         evaluation = await _call_llm(payload)
     except httpx.HTTPError:
+        if not final:
+            raise
         evaluation = STRINGS.PATIENT_EVAL_FALLBACK
 
     formatted_text, rubric_payload = _format_evaluation(evaluation)
+    if rubric_payload.get("error") and not final:
+        raise ValueError("La evaluación no devolvió una rúbrica válida")
 
     async with get_session() as session:
-        sim_session = await session.get(SimSession, session_id)
+        sim_session = await session.get(SimSession, job.session_id)
         if sim_session:
             sim_session.status = "completed"
             sim_session.rubric = {
                 "raw": evaluation,
                 "parsed": rubric_payload,
                 "generated_at": datetime.now(timezone.utc).isoformat(),
+                "attempts": job.attempts,
             }
             sim_session.ended_at = datetime.now(timezone.utc)
             await session.commit()
 
-    await _append_log(session_id, "system", f"evaluacion:{formatted_text[:120]}")
-    context.user_data.pop(SESSION_KEY, None)
-    context.user_data.pop("patient_slug", None)
-    if update.callback_query:
-        await update.callback_query.answer()
-        await update.callback_query.edit_message_text(
-            formatted_text, reply_markup=build_back_to_menu_button()
-        )
-    else:
-        await update.message.reply_text(
-            formatted_text, reply_markup=build_back_to_menu_button()
-        )
+    await _append_log(job.session_id, "system", f"evaluacion:{formatted_text[:120]}")
+    try:
+        await bot.send_message(chat_id=job.chat_id, text=formatted_text, reply_markup=build_back_to_menu_button())
+    except TelegramError:
+        logger.warning("No se pudo entregar la evaluación %s al chat %s", job.id, job.chat_id, exc_info=True)
 
 
 async def handle_patient_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, data: str) -> None:
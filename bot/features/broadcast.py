@@ -1,18 +1,234 @@
 from __future__ import annotations
 
-from telegram import Update
+import asyncio
+import logging
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from functools import partial
+from typing import AsyncContextManager, Callable, Optional, Set
+
+from redis.asyncio import Redis
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Bot, Update
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
 from telegram.ext import ContextTypes
 
+from common.config import settings
+from common.db import Broadcast, Setting, User, after_commit, get_session
+from common.redis_client import get_redis, redis_key
+
 from ..i18n_es import STRINGS
 from ..menus import build_back_to_menu_button
-from ..utils import require_admin
+from ..throttle import TokenBucket
+from ..utils import register_user, require_admin
+
+logger = logging.getLogger(__name__)
+
+LOCK_TTL_SECONDS = 120
+SEND_ATTEMPTS = 3
+
+LOCK_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+LOCK_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_running: Set[asyncio.Task[None]] = set()
+
+
+@dataclass
+class BroadcastProgress:
+    last_user_id: int = 0
+    sent: int = 0
+    failed: int = 0
+
+
+def _progress_key(broadcast_id: int) -> str:
+    return f"broadcast_progress:{broadcast_id}"
+
+
+class BroadcastEngine:
+    def __init__(
+        self,
+        bot: Bot,
+        redis: Redis,
+        *,
+        chunk_size: int,
+        messages_per_second: float,
+        bucket: Optional[TokenBucket] = None,
+        session_factory: Callable[[], AsyncContextManager[AsyncSession]] = get_session,
+    ) -> None:
+        self.chunk_size = chunk_size
+        self._bot = bot
+        self._redis = redis
+        self._bucket = bucket or TokenBucket(messages_per_second)
+        self._session_factory = session_factory
+        self._renew_lock = redis.register_script(LOCK_RENEW_SCRIPT)
+        self._release_lock = redis.register_script(LOCK_RELEASE_SCRIPT)
+
+    async def _load_progress(self, session: AsyncSession, broadcast_id: int) -> BroadcastProgress:
+        stored = await session.get(Setting, _progress_key(broadcast_id))
+        return BroadcastProgress(**stored.value) if stored else BroadcastProgress()
+
+    async def _save_progress(self, broadcast_id: int, progress: BroadcastProgress) -> None:
+        async with self._session_factory() as session:
+            stored = await session.get(Setting, _progress_key(broadcast_id))
+            if stored:
+                stored.value = asdict(progress)
+                stored.updated_at = datetime.utcnow()
+            else:
+                session.add(Setting(key=_progress_key(broadcast_id), value=asdict(progress)))
+            await session.commit()
+
+    async def _deliver(self, chat_id: int, text: str) -> bool:
+        for _ in range(SEND_ATTEMPTS):
+            await self._bucket.acquire()
+            try:
+                await self._bot.send_message(chat_id=chat_id, text=text)
+                return True
+            except RetryAfter as exc:
+                self._bucket.pause(exc.retry_after)
+            except (Forbidden, BadRequest):
+                return False
+            except TelegramError:
+                logger.warning("Error transitorio enviando aviso a %s", chat_id, exc_info=True)
+        return False
+
+    async def run(self, broadcast_id: int) -> Optional[BroadcastProgress]:
+        lock_key = redis_key("broadcast", "lock", broadcast_id)
+        token = uuid.uuid4().hex
+        if not await self._redis.set(lock_key, token, nx=True, ex=LOCK_TTL_SECONDS):
+            return None
+        try:
+            async with self._session_factory() as session:
+                broadcast = await session.get(Broadcast, broadcast_id)
+                if not broadcast or broadcast.sent_at:
+                    return None
+                text = f"📢 {broadcast.title}\n\n{broadcast.message}"
+                progress = await self._load_progress(session, broadcast_id)
+
+            while True:
+                async with self._session_factory() as session:
+                    result = await session.scalars(
+                        select(User.id)
+                        .where(User.id > progress.last_user_id)
+                        .order_by(User.id)
+                        .limit(self.chunk_size)
+                    )
+                    user_ids = result.all()
+                if not user_ids:
+                    break
+                delivered = await asyncio.gather(*(self._deliver(user_id, text) for user_id in user_ids))
+                progress.sent += sum(delivered)
+                progress.failed += len(delivered) - sum(delivered)
+                progress.last_user_id = user_ids[-1]
+                await self._save_progress(broadcast_id, progress)
+                if not await self._renew_lock(keys=[lock_key], args=[token, LOCK_TTL_SECONDS]):
+                    logger.warning("Aviso %s: se perdió el lock; otra réplica continúa el envío", broadcast_id)
+                    return None
+
+            async with self._session_factory() as session:
+                broadcast = await session.get(Broadcast, broadcast_id)
+                if broadcast:
+                    broadcast.sent_at = datetime.utcnow()
+                    await session.commit()
+            logger.info("Aviso %s entregado: %s", broadcast_id, progress)
+            return progress
+        finally:
+            await self._release_lock(keys=[lock_key], args=[token])
+
+
+_send_bucket: Optional[TokenBucket] = None
+
+
+def get_send_bucket() -> TokenBucket:
+    global _send_bucket
+    if _send_bucket is None:
+        _send_bucket = TokenBucket(settings.broadcast_messages_per_second)
+    return _send_bucket
+
+
+def start_broadcast(bot: Bot, broadcast_id: int) -> None:
+    engine = BroadcastEngine(
+        bot,
+        get_redis(),
+        chunk_size=settings.broadcast_chunk_size,
+        messages_per_second=settings.broadcast_messages_per_second,
+        bucket=get_send_bucket(),
+    )
+    task = asyncio.create_task(engine.run(broadcast_id), name=f"broadcast-{broadcast_id}")
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+
+
+async def resume_broadcasts(bot: Bot) -> None:
+    async with get_session() as session:
+        result = await session.scalars(select(Broadcast.id).where(Broadcast.sent_at.is_(None)).order_by(Broadcast.id))
+        pending = result.all()
+    for broadcast_id in pending:
+        logger.info("Reanudando aviso %s", broadcast_id)
+        start_broadcast(bot, broadcast_id)
+
+
+async def stop_broadcasts() -> None:
+    for task in list(_running):
+        task.cancel()
+    await asyncio.gather(*_running, return_exceptions=True)
 
 
 @require_admin
 async def show_broadcasts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    message = f"📢 {STRINGS.NOT_IMPLEMENTED}"
+    async with get_session() as session:
+        result = await session.scalars(select(Broadcast).order_by(Broadcast.created_at.desc()).limit(5))
+        broadcasts = result.all()
+        lines = [STRINGS.BROADCAST_HEADER]
+        for broadcast in broadcasts:
+            if broadcast.sent_at:
+                status = "✅ enviado"
+            else:
+                progress = await session.get(Setting, _progress_key(broadcast.id))
+                sent = progress.value.get("sent", 0) if progress else 0
+                status = f"⏳ en curso ({sent} entregados)"
+            lines.append(f"• {broadcast.title} — {status}")
+    if not broadcasts:
+        lines.append(STRINGS.BROADCAST_EMPTY)
+    lines.append("")
+    lines.append(STRINGS.BROADCAST_USAGE)
+    message = "\n".join(lines)
+
     if update.callback_query:
         await update.callback_query.answer()
         await update.callback_query.edit_message_text(message, reply_markup=build_back_to_menu_button())
     elif update.message:
         await update.message.reply_text(message, reply_markup=build_back_to_menu_button())
+
+
+@require_admin
+async def handle_broadcast_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not update.message or not update.effective_user:
+        return
+    raw = " ".join(context.args or [])
+    title, _, body = raw.partition("|")
+    if not title.strip() or not body.strip():
+        await update.message.reply_text(STRINGS.BROADCAST_USAGE)
+        return
+
+    await register_user(update.effective_user)
+    async with get_session() as session:
+        broadcast = Broadcast(title=title.strip(), message=body.strip(), created_by=update.effective_user.id)
+        session.add(broadcast)
+        await session.commit()
+        broadcast_id = broadcast.id
+
+    after_commit(partial(start_broadcast, context.bot, broadcast_id))
+    await update.message.reply_text(STRINGS.BROADCAST_QUEUED.format(title=title.strip()))
@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncContextManager, Callable, List, Optional
+
+from sqlalchemy import delete, func, insert, literal_column, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from common.config import settings
+from common.db import SEARCH_TEXT_CONFIG, Document, DocumentPage, get_session
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LIMIT = 8
+SNIPPET_CHARS = 160
+CLAIM_LEASE_SECONDS = 600
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def extract_pages(path: str) -> List[str]:
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    return [" ".join((page.extract_text() or "").split()) for page in reader.pages]
+
+
+class DocumentIndexer:
+    def __init__(
+        self,
+        *,
+        max_workers: int,
+        session_factory: Callable[[], AsyncContextManager[AsyncSession]] = get_session,
+        extract: Callable[[str], List[str]] = extract_pages,
+    ) -> None:
+        self.max_workers = max_workers
+        self._session_factory = session_factory
+        self._extract = extract
+        self._queue: asyncio.Queue[int] = asyncio.Queue()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        self.indexed = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="document-indexer")
+
+    def enqueue(self, document_id: int) -> None:
+        self._queue.put_nowait(document_id)
+        self.start()
+
+    async def enqueue_pending(self) -> int:
+        async with self._session_factory() as session:
+            result = await session.scalars(select(Document).where(Document.file_type == "pdf"))
+            pending = [doc.id for doc in result.all() if (doc.extra or {}).get("index_status") != "ready"]
+        for document_id in pending:
+            self.enqueue(document_id)
+        return len(pending)
+
+    async def _set_status(self, session: AsyncSession, document: Document, status: str, pages: int = 0) -> None:
+        document.extra = {**(document.extra or {}), "index_status": status, "indexed_pages": pages}
+        await session.commit()
+
+    async def claim(self, document_id: int) -> Optional[str]:
+        now = datetime.utcnow()
+        async with self._session_factory() as session:
+            document = await session.get(Document, document_id)
+            if not document:
+                return None
+            extra = dict(document.extra or {})
+            status = extra.get("index_status")
+            claimed_at = extra.get("index_claimed_at")
+            expired = (now - timedelta(seconds=CLAIM_LEASE_SECONDS)).isoformat()
+            if status == "ready" or (status == "indexing" and claimed_at and claimed_at > expired):
+                return None
+            path = document.file_path
+            result = await session.execute(
+                update(Document)
+                .where(
+                    Document.id == document_id,
+                    func.coalesce(Document.extra["index_status"].as_string(), "") == (status or ""),
+                    func.coalesce(Document.extra["index_claimed_at"].as_string(), "") == (claimed_at or ""),
+                )
+                .values(extra={**extra, "index_status": "indexing", "index_claimed_at": now.isoformat()})
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != 1:
+                await session.rollback()
+                return None
+            await session.commit()
+        return path
+
+    async def index_document(self, document_id: int) -> int:
+        path = await self.claim(document_id)
+        if path is None:
+            return 0
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        loop = asyncio.get_running_loop()
+        try:
+            pages = await loop.run_in_executor(self._pool, self._extract, path)
+        except Exception:
+            logger.warning("No se pudo extraer el texto de %s", path, exc_info=True)
+            async with self._session_factory() as session:
+                document = await session.get(Document, document_id)
+                if document:
+                    await self._set_status(session, document, "failed")
+            return 0
+
+        rows = [
+            {"document_id": document_id, "page_number": number, "content": content}
+            for number, content in enumerate(pages, start=1)
+            if content
+        ]
+        async with self._session_factory() as session:
+            await session.execute(delete(DocumentPage).where(DocumentPage.document_id == document_id))
+            if rows:
+                await session.execute(insert(DocumentPage), rows)
+            document = await session.get(Document, document_id)
+            if document:
+                await self._set_status(session, document, "ready", len(rows))
+            else:
+                await session.commit()
+        self.indexed += 1
+        return len(rows)
+
+    async def _run(self) -> None:
+        while True:
+            document_id = await self._queue.get()
+            try:
+                pages = await self.index_document(document_id)
+                logger.info("Documento %s indexado (%d páginas con texto)", document_id, pages)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Falló la indexación del documento %s", document_id)
+            finally:
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        await self._queue.join()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_indexer: Optional[DocumentIndexer] = None
+
+
+def get_document_indexer() -> DocumentIndexer:
+    global _indexer
+    if _indexer is None:
+        _indexer = DocumentIndexer(max_workers=settings.doc_index_workers)
+    return _indexer
+
+
+async def close_document_indexer() -> None:
+    global _indexer
+    if _indexer is not None:
+        await _indexer.close()
+        _indexer = None
+
+
+@dataclass
+class SearchHit:
+    document_id: int
+    title: str
+    page_number: int
+    snippet: str
+    rank: float
+
+
+def _snippet(content: str, terms: List[str]) -> str:
+    lower = content.lower()
+    positions = [lower.find(term) for term in terms if term in lower]
+    start = max(0, min(positions) - SNIPPET_CHARS // 3) if positions else 0
+    snippet = content[start : start + SNIPPET_CHARS].strip()
+    return ("…" if start else "") + snippet + ("…" if start + SNIPPET_CHARS < len(content) else "")
+
+
+async def _search_postgres(session: AsyncSession, query: str, limit: int) -> List[SearchHit]:
+    config = literal_column(f"'{SEARCH_TEXT_CONFIG}'")
+    tsquery = func.websearch_to_tsquery(config, query)
+    rank = func.ts_rank_cd(func.to_tsvector(config, DocumentPage.content), tsquery)
+    ranked = (
+        select(DocumentPage.id, rank.label("rank"))
+        .where(func.to_tsvector(config, DocumentPage.content).op("@@")(tsquery))
+        .order_by(rank.desc())
+        .limit(limit)
+        .subquery()
+    )
+    headline = func.ts_headline(
+        config,
+        DocumentPage.content,
+        tsquery,
+        "StartSel=«, StopSel=», MaxWords=25, MinWords=10, MaxFragments=1",
+    )
+    stmt = (
+        select(Document.id, Document.title, DocumentPage.page_number, headline, ranked.c.rank)
+        .select_from(DocumentPage)
+        .join(ranked, ranked.c.id == DocumentPage.id)
+        .join(Document, Document.id == DocumentPage.document_id)
+        .order_by(ranked.c.rank.desc())
+    )
+    result = await session.execute(stmt)
+    return [SearchHit(*row) for row in result.all()]
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def _search_fallback(session: AsyncSession, query: str, limit: int) -> List[SearchHit]:
+    terms = [term.lower() for term in TOKEN_PATTERN.findall(query)]
+    if not terms:
+        return []
+    stmt = select(Document.id, Document.title, DocumentPage.page_number, DocumentPage.content).join(
+        Document, Document.id == DocumentPage.document_id
+    )
+    for term in terms:
+        stmt = stmt.where(DocumentPage.content.ilike(f"%{_escape_like(term)}%", escape="\\"))
+    result = await session.execute(stmt)
+    hits = []
+    for document_id, title, page_number, content in result.all():
+        lower = content.lower()
+        rank = sum(lower.count(term) for term in terms) / (1 + len(lower) / 1000)
+        hits.append(SearchHit(document_id, title, page_number, _snippet(content, terms), rank))
+    hits.sort(key=lambda hit: hit.rank, reverse=True)
+    return hits[:limit]
+
+
+async def search_documents(session: AsyncSession, query: str, limit: int = SEARCH_LIMIT) -> List[SearchHit]:
+    if session.bind.dialect.name == "postgresql":
+        return await _search_postgres(session, query, limit)
+    return await _search_fallback(session, query, limit)
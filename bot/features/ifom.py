@@ -1,22 +1,38 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 
-from sqlalchemy import func, select
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Poll, Update
+from redis.exceptions import RedisError
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Poll, Update
 from telegram.ext import ContextTypes
 
-from common.db import IFOMAttempt, IFOMItem, get_session
+from common.config import settings
+from common.db import IFOMAttempt, get_session
+from common.redis_client import get_redis
 
 from ..i18n_es import STRINGS
+from .ifom_bank import IFOMRecord, get_item, get_item_sampler, refresh_bank
+from .poll_store import PollStore
+
+logger = logging.getLogger(__name__)
 
-POLL_STORE_KEY = "ifom_polls"
 LETTERS = ["A", "B", "C", "D", "E"]
 
+_poll_store: Optional[PollStore] = None
+
 
-def _poll_store(context: ContextTypes.DEFAULT_TYPE) -> Dict[str, Dict[str, object]]:
-    return context.application_data.setdefault(POLL_STORE_KEY, {})
+def get_poll_store() -> PollStore:
+    global _poll_store
+    if _poll_store is None:
+        _poll_store = PollStore(
+            get_redis(),
+            ttl_seconds=settings.ifom_poll_ttl_seconds,
+            grace_seconds=settings.ifom_poll_sweep_seconds * 2 + 60,
+        )
+    return _poll_store
 
 
 def _build_result_keyboard() -> InlineKeyboardMarkup:
@@ -34,9 +50,9 @@ async def handle_ifom(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     if not user or not chat:
         return
 
-    async with get_session() as session:
-        statement = select(IFOMItem).order_by(func.random()).limit(1)
-        item = await session.scalar(statement)
+    await refresh_bank()
+    item_id = get_item_sampler().sample(user.id)
+    item = await get_item(item_id) if item_id is not None else None
 
     if not item:
         message = "⚠️ Aún no hay preguntas cargadas en el banco IFOM."
@@ -54,23 +70,38 @@ async def handle_ifom(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     poll_message = await context.bot.send_poll(
         chat_id=chat.id,
         question=item.stem,
-        options=item.options,
+        options=list(item.options),
         type=Poll.QUIZ,
         correct_option_id=item.answer_index,
         is_anonymous=False,
     )
 
-    _poll_store(context)[poll_message.poll.id] = {
-        "item_id": item.id,
-        "user_id": user.id,
-        "chat_id": chat.id,
-        "message_id": poll_message.message_id,
-        "started_at": datetime.utcnow().timestamp(),
-    }
+    try:
+        await get_poll_store().put(
+            poll_message.poll.id,
+            {
+                "item_id": item.id,
+                "user_id": user.id,
+                "chat_id": chat.id,
+                "message_id": poll_message.message_id,
+                "started_at": datetime.utcnow().timestamp(),
+            },
+        )
+    except RedisError:
+        logger.exception("No se pudo registrar la encuesta IFOM %s; se cierra", poll_message.poll.id)
+        try:
+            await context.bot.stop_poll(chat.id, poll_message.message_id)
+        except Exception:
+            pass
+        await context.bot.send_message(
+            chat_id=chat.id,
+            text="⚠️ No pudimos registrar esta pregunta. Pide otra en unos segundos.",
+            reply_markup=_build_result_keyboard(),
+        )
 
 
 async def _persist_attempt(
-    item: IFOMItem,
+    item: IFOMRecord,
     user_id: int,
     selected_index: Optional[int],
     elapsed_seconds: Optional[int],
@@ -88,15 +119,7 @@ async def _persist_attempt(
         await session.commit()
 
 
-async def handle_ifom_poll_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    answer = update.poll_answer
-    if not answer:
-        return
-
-    data = _poll_store(context).pop(answer.poll_id, None)
-    if not data:
-        return
-
+async def _resolve_poll(bot: Bot, data: Dict[str, Any], selected_index: Optional[int]) -> None:
     item_id = data.get("item_id")
     chat_id = data.get("chat_id")
     message_id = data.get("message_id")
@@ -106,14 +129,10 @@ async def handle_ifom_poll_answer(update: Update, context: ContextTypes.DEFAULT_
     if chat_id is None or user_id is None:
         return
 
-    async with get_session() as session:
-        item = await session.get(IFOMItem, item_id)
-
+    item = await get_item(item_id)
     if not item:
         return
 
-    selected_indices = answer.option_ids or []
-    selected_index = selected_indices[0] if selected_indices else None
     is_correct = selected_index == item.answer_index
     elapsed = None
     if isinstance(started_at, (int, float)):
@@ -123,7 +142,7 @@ async def handle_ifom_poll_answer(update: Update, context: ContextTypes.DEFAULT_
 
     if chat_id and message_id:
         try:
-            await context.bot.stop_poll(chat_id, message_id)
+            await bot.stop_poll(chat_id, message_id)
         except Exception:
             pass
 
@@ -144,4 +163,40 @@ async def handle_ifom_poll_answer(update: Update, context: ContextTypes.DEFAULT_
         explanation_lines.append("")
         explanation_lines.append("Etiquetas: " + ", ".join(item.tags))
 
-    await context.bot.send_message(chat_id=chat_id, text="\n".join(explanation_lines), reply_markup=_build_result_keyboard())
+    await bot.send_message(chat_id=chat_id, text="\n".join(explanation_lines), reply_markup=_build_result_keyboard())
+
+
+async def handle_ifom_poll_answer(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    answer = update.poll_answer
+    if not answer:
+        return
+
+    data = await get_poll_store().pop(answer.poll_id)
+    if not data:
+        return
+
+    selected_indices = answer.option_ids or []
+    selected_index = selected_indices[0] if selected_indices else None
+    await _resolve_poll(context.bot, data, selected_index)
+
+
+async def sweep_expired_polls(bot: Bot) -> int:
+    expired = await get_poll_store().pop_expired()
+    for poll_id, data in expired:
+        try:
+            await _resolve_poll(bot, data, None)
+        except Exception:
+            logger.exception("No se pudo cerrar la encuesta IFOM vencida %s", poll_id)
+    return len(expired)
+
+
+async def run_poll_sweeper(bot: Bot) -> None:
+    while True:
+        await asyncio.sleep(settings.ifom_poll_sweep_seconds)
+        try:
+            swept = await sweep_expired_polls(bot)
+        except Exception:
+            logger.exception("Fallo el barrido de encuestas IFOM")
+            continue
+        if swept:
+            logger.info("Encuestas IFOM vencidas registradas como tiempo agotado: %d", swept)
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import logging
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+
+from common.config import settings
+from common.db import IFOM_BANK_VERSION_KEY, IFOMItem, Setting, get_session
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_ATTEMPTS = 8
+
+
+@dataclass(frozen=True, slots=True)
+class IFOMRecord:
+    id: int
+    external_id: str
+    stem: str
+    options: Tuple[str, ...]
+    answer_index: int
+    explanation: Optional[str]
+    tags: Tuple[str, ...]
+
+    @classmethod
+    def from_item(cls, item: IFOMItem) -> "IFOMRecord":
+        return cls(
+            id=item.id,
+            external_id=item.external_id,
+            stem=item.stem,
+            options=tuple(item.options or ()),
+            answer_index=item.answer_index,
+            explanation=item.explanation,
+            tags=tuple(item.tags or ()),
+        )
+
+
+class BankCache:
+    def __init__(self) -> None:
+        self._by_id: Dict[int, IFOMRecord] = {}
+        self._by_external_id: Dict[str, IFOMRecord] = {}
+        self.version: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, records: Iterable[IFOMRecord], version: int) -> None:
+        by_id = {record.id: record for record in records}
+        self._by_id = by_id
+        self._by_external_id = {record.external_id: record for record in by_id.values()}
+        self.version = version
+
+    def put(self, record: IFOMRecord) -> None:
+        self._by_id[record.id] = record
+        self._by_external_id[record.external_id] = record
+
+    def get(self, item_id: int) -> Optional[IFOMRecord]:
+        record = self._by_id.get(item_id)
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return record
+
+    def get_by_external_id(self, external_id: str) -> Optional[IFOMRecord]:
+        record = self._by_external_id.get(external_id)
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return record
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "items": len(self._by_id),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+class ItemSampler:
+    def __init__(self, max_seen_per_user: int, max_users: int = 5000, rng: Optional[random.Random] = None) -> None:
+        self.max_seen_per_user = max_seen_per_user
+        self.max_users = max_users
+        self._rng = rng or random.Random()
+        self._ids: List[int] = []
+        self._by_tag: Dict[str, List[int]] = {}
+        self._seen: OrderedDict[int, Dict[int, None]] = OrderedDict()
+
+    def load(self, rows: Iterable[Tuple[int, Sequence[str]]]) -> None:
+        ids: List[int] = []
+        by_tag: Dict[str, List[int]] = {}
+        for item_id, tags in rows:
+            ids.append(item_id)
+            for tag in tags or ():
+                by_tag.setdefault(tag, []).append(item_id)
+        self._ids = ids
+        self._by_tag = by_tag
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def sample(self, user_id: int, tag: Optional[str] = None) -> Optional[int]:
+        pool = self._ids if tag is None else self._by_tag.get(tag, [])
+        if not pool:
+            return None
+        seen = self._seen.setdefault(user_id, {})
+        self._seen.move_to_end(user_id)
+        while len(self._seen) > self.max_users:
+            self._seen.popitem(last=False)
+
+        choice = None
+        for _ in range(SAMPLE_ATTEMPTS):
+            candidate = pool[self._rng.randrange(len(pool))]
+            if candidate not in seen:
+                choice = candidate
+                break
+        if choice is None:
+            unseen = [item_id for item_id in pool if item_id not in seen]
+            if not unseen:
+                for item_id in pool:
+                    seen.pop(item_id, None)
+                unseen = pool
+            choice = unseen[self._rng.randrange(len(unseen))]
+
+        seen[choice] = None
+        while len(seen) > self.max_seen_per_user:
+            seen.pop(next(iter(seen)))
+        return choice
+
+
+_sampler = ItemSampler(max_seen_per_user=settings.ifom_max_seen_per_user, max_users=settings.ifom_max_seen_users)
+_cache = BankCache()
+_checked_at = 0.0
+
+
+def get_item_sampler() -> ItemSampler:
+    return _sampler
+
+
+def get_bank_cache() -> BankCache:
+    return _cache
+
+
+async def refresh_bank(force: bool = False) -> None:
+    global _checked_at
+    now = time.monotonic()
+    if not force and _cache.version is not None and now - _checked_at < settings.ifom_index_refresh_seconds:
+        return
+    _checked_at = now
+
+    async with get_session() as session:
+        stamp = await session.get(Setting, IFOM_BANK_VERSION_KEY)
+        version = int((stamp.value or {}).get("version", 0)) if stamp else 0
+        if not force and version == _cache.version:
+            return
+        items = (await session.scalars(select(IFOMItem))).all()
+        records = [IFOMRecord.from_item(item) for item in items]
+
+    _cache.load(records, version)
+    _sampler.load((record.id, record.tags) for record in records)
+    logger.info("Banco IFOM v%s cargado: %s", version, _cache.stats())
+
+
+async def get_item(item_id: int) -> Optional[IFOMRecord]:
+    record = _cache.get(item_id)
+    if record is not None:
+        return record
+    async with get_session() as session:
+        item = await session.get(IFOMItem, item_id)
+        if not item:
+            return None
+        record = IFOMRecord.from_item(item)
+    _cache.put(record)
+    return record
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from common.config import settings
+from common.invalidation import PATIENT_CHANNEL
+from common.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PersonaEntry:
+    data: Dict[str, object]
+    version: int
+    loaded_at: float
+
+
+class PersonaCache:
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, PersonaEntry] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, slug: str) -> Optional[PersonaEntry]:
+        entry = self._entries.get(slug)
+        if entry is not None and time.monotonic() - entry.loaded_at > self.ttl_seconds:
+            del self._entries[slug]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(slug)
+        self.hits += 1
+        return entry
+
+    def put(self, slug: str, data: Dict[str, object], version: int) -> None:
+        current = self._entries.get(slug)
+        if current is not None and current.version > version:
+            return
+        self._entries[slug] = PersonaEntry(data=data, version=version, loaded_at=time.monotonic())
+        self._entries.move_to_end(slug)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, slug: str, version: Optional[int] = None) -> None:
+        entry = self._entries.get(slug)
+        if entry is not None and (version is None or entry.version < version):
+            del self._entries[slug]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_cache = PersonaCache(settings.persona_cache_max_entries, settings.persona_cache_ttl_seconds)
+
+
+def get_persona_cache() -> PersonaCache:
+    return _cache
+
+
+async def run_invalidation_listener() -> None:
+    while True:
+        pubsub = get_redis().pubsub()
+        try:
+            await pubsub.subscribe(PATIENT_CHANNEL)
+            get_persona_cache().clear()
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                payload = json.loads(message["data"])
+                get_persona_cache().invalidate(payload["slug"], payload.get("version"))
+                logger.info("Persona '%s' invalidada (v%s)", payload["slug"], payload.get("version"))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning("Se perdió la suscripción de invalidación de pacientes; reintentando", exc_info=True)
+            await asyncio.sleep(5)
+        finally:
+            await pubsub.aclose()
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis.asyncio import Redis
+
+from common.redis_client import redis_key
+
+
+class PollStore:
+    def __init__(self, redis: Redis, ttl_seconds: int, grace_seconds: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.grace_seconds = grace_seconds
+        self._redis = redis
+        self._expiry_key = redis_key("ifom", "polls", "expiry")
+
+    def _poll_key(self, poll_id: str) -> str:
+        return redis_key("ifom", "poll", poll_id)
+
+    async def put(self, poll_id: str, data: Dict[str, Any]) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._poll_key(poll_id), json.dumps(data), ex=self.ttl_seconds + self.grace_seconds)
+            pipe.zadd(self._expiry_key, {poll_id: time.time() + self.ttl_seconds})
+            await pipe.execute()
+
+    async def pop(self, poll_id: str) -> Optional[Dict[str, Any]]:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.getdel(self._poll_key(poll_id))
+            pipe.zrem(self._expiry_key, poll_id)
+            raw, _ = await pipe.execute()
+        return json.loads(raw) if raw else None
+
+    async def pop_expired(self, now: Optional[float] = None, limit: int = 100) -> List[Tuple[str, Dict[str, Any]]]:
+        deadline = time.time() if now is None else now
+        poll_ids = await self._redis.zrangebyscore(self._expiry_key, "-inf", deadline, start=0, num=limit)
+        expired: List[Tuple[str, Dict[str, Any]]] = []
+        for poll_id in poll_ids:
+            if not await self._redis.zrem(self._expiry_key, poll_id):
+                continue
+            raw = await self._redis.getdel(self._poll_key(poll_id))
+            if raw:
+                expired.append((poll_id, json.loads(raw)))
+        return expired
+
+    async def pending(self) -> int:
+        return await self._redis.zcard(self._expiry_key)
@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import hashlib
+import random
+import time
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from redis.asyncio import Redis
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from common.config import settings
+from common.redis_client import get_redis, redis_key
+from common.text import WORD_PATTERN, fold
+
+from ..i18n_es import STRINGS
+from ..utils import require_admin
+
+CONTEXT_TURNS = 2
+
+
+def normalize_question(text: str) -> str:
+    return " ".join(WORD_PATTERN.findall(fold(text)))
+
+
+def context_bucket(previous_turns: int) -> str:
+    if previous_turns == 0:
+        return "inicio"
+    if previous_turns <= 4:
+        return "temprano"
+    return "avanzado"
+
+
+@dataclass
+class CacheStats:
+    hits: int
+    misses: int
+    stores: int
+    generation_seconds: float
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def saved_seconds(self) -> float:
+        return self.hits * self.generation_seconds / self.stores if self.stores else 0.0
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        redis: Redis,
+        *,
+        ttl_seconds: int,
+        max_entries: int,
+        max_variants: int,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_variants = max_variants
+        self._redis = redis
+        self._rng = rng or random.Random()
+        self._lru_key = redis_key("llmcache", "lru")
+        self._stats_key = redis_key("llmcache", "stats")
+
+    def key(
+        self, slug: str, version: int, question: str, previous_turns: int, context: Sequence[str] = ()
+    ) -> str:
+        recent = "|".join(normalize_question(turn) for turn in context[-CONTEXT_TURNS:])
+        fingerprint = f"{context_bucket(previous_turns)}:{recent}:{normalize_question(question)}"
+        digest = hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:20]
+        return redis_key("llmcache", slug, version, digest)
+
+    async def get(self, key: str) -> Optional[str]:
+        variants = await self._redis.lrange(key, 0, -1)
+        if variants and len(variants) < self.max_variants and self._rng.random() < 1 / (len(variants) + 1):
+            variants = []
+        async with self._redis.pipeline(transaction=False) as pipe:
+            if variants:
+                pipe.expire(key, self.ttl_seconds)
+                pipe.zadd(self._lru_key, {key: time.time()})
+                pipe.hincrby(self._stats_key, "hits", 1)
+            else:
+                pipe.hincrby(self._stats_key, "misses", 1)
+            await pipe.execute()
+        return self._rng.choice(variants) if variants else None
+
+    async def put(self, key: str, reply: str, generation_seconds: float) -> None:
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(key, 0, reply)
+            pipe.lpush(key, reply)
+            pipe.ltrim(key, 0, self.max_variants - 1)
+            pipe.expire(key, self.ttl_seconds)
+            pipe.zadd(self._lru_key, {key: time.time()})
+            pipe.hincrby(self._stats_key, "stores", 1)
+            pipe.hincrbyfloat(self._stats_key, "generation_seconds", generation_seconds)
+            pipe.zcard(self._lru_key)
+            size = (await pipe.execute())[-1]
+        if size > self.max_entries:
+            evicted = await self._redis.zpopmin(self._lru_key, size - self.max_entries)
+            if evicted:
+                await self._redis.delete(*(member for member, _ in evicted))
+        await self._redis.zremrangebyscore(self._lru_key, "-inf", time.time() - self.ttl_seconds)
+
+    async def stats(self) -> CacheStats:
+        raw = await self._redis.hgetall(self._stats_key)
+        return CacheStats(
+            hits=int(raw.get("hits", 0)),
+            misses=int(raw.get("misses", 0)),
+            stores=int(raw.get("stores", 0)),
+            generation_seconds=float(raw.get("generation_seconds", 0.0)),
+        )
+
+
+_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache(
+            get_redis(),
+            ttl_seconds=settings.response_cache_ttl_seconds,
+            max_entries=settings.response_cache_max_entries,
+            max_variants=settings.response_cache_variants,
+        )
+    return _cache
+
+
+@require_admin
+async def show_cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not update.message:
+        return
+    if not settings.response_cache_enabled:
+        await update.message.reply_text(STRINGS.RESPONSE_CACHE_DISABLED)
+        return
+    stats = await get_response_cache().stats()
+    await update.message.reply_text(
+        STRINGS.RESPONSE_CACHE_STATS.format(
+            hits=stats.hits,
+            lookups=stats.hits + stats.misses,
+            rate=stats.hit_rate * 100,
+            saved=stats.saved_seconds / 60,
+        )
+    )
@@ -1,21 +1,21 @@
 from __future__ import annotations
 
 from datetime import datetime
+from functools import partial
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 from sqlalchemy import select
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes
 
 from common.config import settings
-from common.db import Document, get_session
+from common.db import Document, after_commit, get_session
 
 from ..i18n_es import STRINGS
-from ..menus import build_back_to_menu_button
+from ..menus import DOCUMENT_CALLBACK_PREFIX, build_back_to_menu_button
 from ..utils import require_admin
-
-DOCUMENT_CALLBACK_PREFIX = "DOC_"
+from .document_index import get_document_indexer, search_documents
 
 
 def _build_documents_keyboard(documents: List[Document]) -> InlineKeyboardMarkup:
@@ -82,7 +82,37 @@ async def handle_document_upload(update: Update, context: ContextTypes.DEFAULT_T
         session.add(record)
         await session.commit()
 
-    await update.message.reply_text(f"📄 '{filename}' cargado correctamente y disponible para los estudiantes.")
+    after_commit(partial(get_document_indexer().enqueue, record.id))
+    await update.message.reply_text(
+        f"📄 '{filename}' cargado correctamente y disponible para los estudiantes. "
+        "Se indexará en segundo plano para /buscar."
+    )
+
+
+async def handle_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not update.message:
+        return
+    query = " ".join(context.args or []).strip()
+    if not query:
+        await update.message.reply_text(STRINGS.SEARCH_USAGE)
+        return
+
+    async with get_session() as session:
+        hits = await search_documents(session, query)
+    if not hits:
+        await update.message.reply_text(STRINGS.SEARCH_EMPTY.format(query=query))
+        return
+
+    lines = [STRINGS.SEARCH_HEADER.format(query=query)]
+    documents: Dict[int, str] = {}
+    for index, hit in enumerate(hits, start=1):
+        lines.append(f"{index}. 📄 {hit.title} — pág. {hit.page_number}\n   {hit.snippet}")
+        documents.setdefault(hit.document_id, hit.title)
+    rows = [
+        [InlineKeyboardButton(f"📄 {title}", callback_data=f"{DOCUMENT_CALLBACK_PREFIX}{document_id}")]
+        for document_id, title in documents.items()
+    ]
+    await update.message.reply_text("\n".join(lines), reply_markup=InlineKeyboardMarkup(rows))
 
 
 async def handle_document_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, payload: str) -> None:
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from common.text import estimate_tokens
+
+
+class HistoryEntry(NamedTuple):
+    role: str
+    message: str
+    created_at: datetime
+
+
+def as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+@dataclass
+class ConversationSummary:
+    text: str = ""
+    through: Optional[datetime] = None
+    turns: int = 0
+
+    @classmethod
+    def from_json(cls, data: Optional[Dict[str, Any]]) -> ConversationSummary:
+        if not data:
+            return cls()
+        through = data.get("through")
+        return cls(
+            text=str(data.get("text") or ""),
+            through=datetime.fromisoformat(through) if through else None,
+            turns=int(data.get("turns") or 0),
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        through = as_utc(self.through).isoformat() if self.through else None
+        return {"text": self.text, "through": through, "turns": self.turns}
+
+    def pending(self, entries: Iterable[HistoryEntry]) -> List[HistoryEntry]:
+        if self.through is None:
+            return list(entries)
+        through = as_utc(self.through)
+        return [entry for entry in entries if as_utc(entry.created_at) > through]
+
+
+def split_by_tokens(
+    entries: List[HistoryEntry], budget: int, max_messages: Optional[int] = None
+) -> Tuple[List[HistoryEntry], List[HistoryEntry]]:
+    used = 0
+    start = len(entries)
+    floor = max(0, len(entries) - max_messages) if max_messages is not None else 0
+    while start > floor:
+        cost = estimate_tokens(entries[start - 1].message)
+        if used + cost > budget and start < len(entries):
+            break
+        used += cost
+        start -= 1
+    return entries[:start], entries[start:]
+
+
+class HistoryBuffer:
+    def __init__(self, max_messages: int, max_sessions: int) -> None:
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[int, Deque[HistoryEntry]] = OrderedDict()
+        self._summaries: Dict[int, ConversationSummary] = {}
+
+    def get(self, session_id: int) -> Optional[List[HistoryEntry]]:
+        entries = self._sessions.get(session_id)
+        if entries is None:
+            return None
+        self._sessions.move_to_end(session_id)
+        return list(entries)
+
+    def prime(self, session_id: int, entries: Iterable[HistoryEntry]) -> None:
+        self._sessions[session_id] = deque(entries, maxlen=self.max_messages)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            evicted, _ = self._sessions.popitem(last=False)
+            self._summaries.pop(evicted, None)
+
+    def append(self, session_id: int, entry: HistoryEntry) -> None:
+        entries = self._sessions.get(session_id)
+        if entries is not None:
+            entries.append(entry)
+
+    def get_summary(self, session_id: int) -> Optional[ConversationSummary]:
+        return self._summaries.get(session_id)
+
+    def set_summary(self, session_id: int, summary: ConversationSummary) -> None:
+        if session_id in self._sessions or len(self._summaries) < self.max_sessions:
+            self._summaries[session_id] = summary
+
+    def discard(self, session_id: int) -> None:
+        self._sessions.pop(session_id, None)
+        self._summaries.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
@@ -25,8 +25,25 @@ class SpanishStrings:
     ]
     NOT_IMPLEMENTED = "🚧 Función en construcción."
     ONLY_ADMINS = "Esta opción es solo para administradores."
+    RATE_LIMITED = "⏳ Vas muy rápido. Espera {seconds} segundos antes de continuar."
+    RATE_LIMITED_GLOBAL = "⏳ Hay muchas consultas en este momento. Intenta de nuevo en {seconds} segundos."
     START_BUTTON_LABEL = "Menú principal"
 
+    SEARCH_USAGE = "🔎 Escribe lo que buscas, por ejemplo: /buscar criterios de sepsis"
+    SEARCH_HEADER = "🔎 Resultados para «{query}»:"
+    SEARCH_EMPTY = "No encontré «{query}» en los documentos publicados."
+
+    RESPONSE_CACHE_DISABLED = "La caché de respuestas del simulador está desactivada."
+    RESPONSE_CACHE_STATS = (
+        "🧠 Caché del simulador: {hits} aciertos de {lookups} consultas ({rate:.1f} %). "
+        "Tiempo de generación ahorrado: ~{saved:.1f} min."
+    )
+
+    BROADCAST_HEADER = "📢 Avisos recientes:"
+    BROADCAST_EMPTY = "Aún no se han enviado avisos."
+    BROADCAST_USAGE = "Para enviar un aviso a todos los estudiantes usa: /aviso Título | Mensaje"
+    BROADCAST_QUEUED = "📢 Aviso «{title}» en envío. Revisa el progreso en Novedades y avisos."
+
     PATIENT_GUIDE = (
         "Puedes conversar libremente conmigo como paciente simulado. "
         "Pregunta por antecedentes, hábitos, domicilio, síntomas o lo que necesites para tu anamnesis."
@@ -35,6 +52,8 @@ class SpanishStrings:
         "⚠️ Simulación educativa: la información proviene de notas académicas ficticias. "
         "No constituye diagnóstico ni tratamiento real."
     )
+    PATIENT_TYPING = "✍️ Escribiendo…"
+    PATIENT_CONFUSED = "Estoy un poco confundida, ¿podrías repetir la pregunta?"
     PATIENT_NOT_FOUND = "No se encontró el caso clínico disponible en este momento."
     PATIENT_NO_ACTIVE_SESSION = (
         "No hay una simulación activa. Vuelve al menú principal e inicia el caso para continuar."
@@ -55,6 +74,9 @@ class SpanishStrings:
     PATIENT_EVAL_REMINDER = (
         "Continúa profundizando tus hipótesis y planes sin adelantar diagnósticos ni tratamientos definitivos."
     )
+    PATIENT_EVAL_QUEUED = (
+        "⏳ Evaluación en curso. Te enviaremos la retroalimentación en este chat en cuanto esté lista."
+    )
     PATIENT_EVAL_FALLBACK = "No fue posible generar la retroalimentación en este momento."
     PATIENT_EVAL_EMPTY_FEEDBACK = "Sin observaciones registradas."
     PATIENT_EVAL_DIMENSIONS: Tuple[Tuple[str, str], ...] = (
@@ -0,0 +1,17 @@
+from __future__ import annotations
+
+from importlib import import_module
+from typing import Any, Awaitable, Callable
+
+
+def resolve(target: str) -> Any:
+    module, _, attribute = target.partition(":")
+    return getattr(import_module(module), attribute)
+
+
+def lazy_callback(target: str) -> Callable[..., Awaitable[Any]]:
+    async def callback(*args: Any, **kwargs: Any) -> Any:
+        return await resolve(target)(*args, **kwargs)
+
+    callback.__name__ = callback.__qualname__ = target
+    return callback
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import InterfaceError, OperationalError, StatementError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from common.config import settings
+from common.db import SimLog, get_sessionmaker
+
+logger = logging.getLogger(__name__)
+
+
+class SimLogSink:
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        *,
+        batch_size: int,
+        flush_interval: float,
+        max_pending: int = 10000,
+        max_attempts: int = 5,
+    ) -> None:
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._session_factory = session_factory
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._in_flight: List[Dict[str, Any]] = []
+        self._failures = 0
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+        self.flushed = 0
+        self.dropped = 0
+
+    def append(
+        self, session_id: int, role: str, message: str, extra: Optional[Dict[str, object]] = None
+    ) -> Dict[str, Any]:
+        row = {
+            "session_id": session_id,
+            "role": role,
+            "message": message,
+            "extra": extra or {},
+            "created_at": datetime.utcnow(),
+        }
+        self._pending.append(row)
+        self._trim()
+        self._ensure_started()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return row
+
+    def has_pending(self, session_id: int) -> bool:
+        return any(row["session_id"] == session_id for row in (*self._in_flight, *self._pending))
+
+    def _trim(self) -> None:
+        while len(self._pending) > self.max_pending:
+            self._pending.popleft()
+            self.dropped += 1
+
+    async def _insert(self, rows: List[Dict[str, Any]]) -> None:
+        async with self._session_factory() as session:
+            await session.execute(insert(SimLog), rows)
+            await session.commit()
+
+    async def _insert_isolating(self, rows: List[Dict[str, Any]]) -> int:
+        try:
+            await self._insert(rows)
+            return 0
+        except (OperationalError, InterfaceError):
+            raise
+        except StatementError:
+            if len(rows) == 1:
+                logger.exception("Registro de simulación descartado: %r", rows[0])
+                self.dropped += 1
+                return 1
+        rejected = 0
+        for row in rows:
+            rejected += await self._insert_isolating([row])
+        return rejected
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            rows = self._in_flight = list(self._pending)
+            self._pending.clear()
+            try:
+                rejected = await self._insert_isolating(rows)
+            except Exception:
+                self._failures += 1
+                if self._failures >= self.max_attempts:
+                    logger.exception(
+                        "Se descartan %d registros de simulación tras %d intentos", len(rows), self._failures
+                    )
+                    self._failures = 0
+                    self.dropped += len(rows)
+                else:
+                    logger.exception("No se pudieron guardar %d registros de simulación", len(rows))
+                    self._pending.extendleft(reversed(rows))
+                    self._trim()
+                return 0
+            finally:
+                self._in_flight = []
+            self._failures = 0
+            self.flushed += len(rows) - rejected
+            return len(rows) - rejected
+
+    def _ensure_started(self) -> None:
+        if self._task is not None:
+            return
+        try:
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="simlog-sink")
+        except RuntimeError:
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+_sink: Optional[SimLogSink] = None
+
+
+def get_log_sink() -> SimLogSink:
+    global _sink
+    if _sink is None:
+        _sink = SimLogSink(
+            get_sessionmaker(),
+            batch_size=settings.simlog_flush_batch_size,
+            flush_interval=settings.simlog_flush_interval_seconds,
+            max_pending=settings.simlog_max_pending,
+            max_attempts=settings.simlog_max_attempts,
+        )
+    return _sink
+
+
+async def close_log_sink() -> None:
+    global _sink
+    if _sink is None:
+        return
+    await _sink.close()
+    _sink = None
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import Awaitable, Callable, Dict
+from functools import partial
+from typing import Awaitable, Callable, Dict, List
 
 from telegram import Update
 from telegram.ext import (
@@ -12,32 +14,45 @@ from telegram.ext import (
     ContextTypes,
     MessageHandler,
     PollAnswerHandler,
+    TypeHandler,
     filters,
 )
 
 from common.config import settings
 
-from .features.ai_patient import (
-    handle_patient_callback,
-    handle_patient_message,
-    handle_patient_sim,
-)
-from .features.broadcast import show_broadcasts
-from .features.ifom import handle_ifom, handle_ifom_poll_answer
-from .features.syllabus_grades import (
-    DOCUMENT_CALLBACK_PREFIX,
-    handle_document_callback,
-    handle_document_upload,
-    handle_syllabus,
-)
-from .features.week import show_week_status
 from .i18n_es import STRINGS
-from .menus import build_main_menu, build_start_message
+from .lazy import lazy_callback, resolve
+from .menus import DOCUMENT_CALLBACK_PREFIX, build_main_menu, build_start_message
 
 logger = logging.getLogger(__name__)
 
+_background_tasks: List[asyncio.Task[None]] = []
+
+FIRST_UPDATE_MODULES = (
+    "bot.persistence",
+    "bot.update_processor",
+    "bot.rate_limit",
+    "bot.utils",
+)
+
+STARTUP_MODULES = (
+    "bot.features.ifom_bank",
+    "bot.features.ifom",
+    "bot.features.patient_cache",
+    "bot.features.broadcast",
+    "bot.features.document_index",
+    "bot.features.ai_patient",
+    "bot.evaluation_queue",
+)
+
+register_user = lazy_callback("bot.utils:register_user")
+handle_patient_callback = lazy_callback("bot.features.ai_patient:handle_patient_callback")
+handle_document_callback = lazy_callback("bot.features.syllabus_grades:handle_document_callback")
+
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.message and update.effective_user:
+        await register_user(update.effective_user)
     first_name = update.effective_user.first_name if update.effective_user else None
     text = build_start_message(first_name)
     if update.message:
@@ -48,11 +63,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 CALLBACK_HANDLERS: Dict[str, Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[None]]] = {
-    "MENU_WEEK": show_week_status,
-    "MENU_SYLLABUS": handle_syllabus,
-    "MENU_IFOM": handle_ifom,
-    "MENU_PATIENT": handle_patient_sim,
-    "MENU_BROADCASTS": show_broadcasts,
+    "MENU_WEEK": lazy_callback("bot.features.week:show_week_status"),
+    "MENU_SYLLABUS": lazy_callback("bot.features.syllabus_grades:handle_syllabus"),
+    "MENU_IFOM": lazy_callback("bot.features.ifom:handle_ifom"),
+    "MENU_PATIENT": lazy_callback("bot.features.ai_patient:handle_patient_sim"),
+    "MENU_BROADCASTS": lazy_callback("bot.features.broadcast:show_broadcasts"),
     "MENU_MAIN": start,
 }
 
@@ -74,15 +89,97 @@ async def handle_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     await action(update, context)
 
 
+async def start_services(application: Application) -> None:
+    from sqlalchemy.exc import SQLAlchemyError
+
+    run_poll_sweeper = resolve("bot.features.ifom:run_poll_sweeper")
+    run_invalidation_listener = resolve("bot.features.patient_cache:run_invalidation_listener")
+    _background_tasks.append(asyncio.create_task(run_poll_sweeper(application.bot), name="ifom-poll-sweeper"))
+    _background_tasks.append(asyncio.create_task(run_invalidation_listener(), name="persona-invalidation"))
+    try:
+        await resolve("bot.features.broadcast:resume_broadcasts")(application.bot)
+    except SQLAlchemyError:
+        logger.warning("No se pudieron reanudar los avisos pendientes", exc_info=True)
+    try:
+        await resolve("bot.features.document_index:get_document_indexer")().enqueue_pending()
+    except SQLAlchemyError:
+        logger.warning("No se pudieron encolar los documentos pendientes de indexar", exc_info=True)
+    try:
+        process_evaluation = resolve("bot.features.ai_patient:process_evaluation")
+        await resolve("bot.evaluation_queue:start_evaluation_worker")(partial(process_evaluation, application.bot))
+    except SQLAlchemyError:
+        logger.warning("No se pudo iniciar el worker de evaluaciones", exc_info=True)
+    try:
+        await resolve("bot.features.ifom_bank:refresh_bank")(force=True)
+    except SQLAlchemyError:
+        logger.warning("No se pudo precargar el banco IFOM; se cargará en el primer uso", exc_info=True)
+
+
+def _log_startup_failure(task: asyncio.Task[None]) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Falló el arranque de los servicios en segundo plano", exc_info=task.exception())
+
+
+async def on_startup(application: Application) -> None:
+    resolve("bot.rate_limit:get_rate_limiter")()
+    task = asyncio.create_task(start_services(application), name="startup-services")
+    task.add_done_callback(_log_startup_failure)
+    _background_tasks.append(task)
+
+
+async def on_shutdown(application: Application) -> None:
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+    for target in (
+        "bot.features.broadcast:stop_broadcasts",
+        "bot.evaluation_queue:stop_evaluation_worker",
+        "bot.features.document_index:close_document_indexer",
+        "bot.log_sink:close_log_sink",
+        "common.llm:close_llm_client",
+        "common.redis_client:close_redis",
+    ):
+        await resolve(target)()
+
+
 def build_application() -> Application:
-    logging.basicConfig(level=getattr(logging, settings.bot_log_level.upper(), logging.INFO))
-    application = ApplicationBuilder().token(settings.telegram_token).build()
+    from .persistence import build_persistence
+    from .update_processor import ChatOrderedUpdateProcessor, rollback_on_error
 
+    logging.basicConfig(level=getattr(logging, settings.bot_log_level.upper(), logging.INFO))
+    application = (
+        ApplicationBuilder()
+        .token(settings.telegram_token)
+        .persistence(build_persistence())
+        .concurrent_updates(
+            ChatOrderedUpdateProcessor(
+                settings.update_concurrency, max_pending_per_chat=settings.update_max_pending_per_chat
+            )
+        )
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
+
+    application.add_handler(TypeHandler(Update, lazy_callback("bot.rate_limit:rate_limit_guard")), group=-1)
     application.add_handler(CommandHandler("start", start))
-    application.add_handler(MessageHandler(filters.Document.PDF, handle_document_upload))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_patient_message))
-    application.add_handler(CallbackQueryHandler(handle_menu_callback, pattern=r"^(MENU_|DOC_|PATIENT_)"))
-    application.add_handler(PollAnswerHandler(handle_ifom_poll_answer))
+    application.add_handler(CommandHandler("aviso", lazy_callback("bot.features.broadcast:handle_broadcast_command")))
+    application.add_handler(CommandHandler("buscar", lazy_callback("bot.features.syllabus_grades:handle_search")))
+    application.add_handler(CommandHandler("cache", lazy_callback("bot.features.response_cache:show_cache_stats")))
+    application.add_handler(
+        MessageHandler(filters.Document.PDF, lazy_callback("bot.features.syllabus_grades:handle_document_upload"))
+    )
+    application.add_handler(
+        MessageHandler(
+            filters.TEXT & ~filters.COMMAND, lazy_callback("bot.features.ai_patient:handle_patient_message")
+        )
+    )
+    application.add_handler(
+        CallbackQueryHandler(handle_menu_callback, pattern=rf"^(MENU_|{DOCUMENT_CALLBACK_PREFIX}|PATIENT_)")
+    )
+    application.add_handler(PollAnswerHandler(lazy_callback("bot.features.ifom:handle_ifom_poll_answer")))
+    application.add_error_handler(rollback_on_error)
     return application
 
 
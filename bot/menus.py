@@ -6,6 +6,10 @@ from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
 from .i18n_es import STRINGS
 
+DOCUMENT_CALLBACK_PREFIX = "DOC_"
+PATIENT_TERMINATE = "PATIENT_END"
+SESSION_KEY = "patient_session_id"
+
 
 def build_start_message(first_name: Optional[str]) -> str:
     name = first_name or "estudiante"
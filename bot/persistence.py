@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Set
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from telegram.ext import BasePersistence, PersistenceInput
+
+from common.config import settings
+from common.redis_client import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+
+def user_data_key(user_id: int) -> str:
+    return redis_key("user_data", user_id)
+
+
+def _dumps(data: Dict[Any, Any]) -> Optional[str]:
+    if not data:
+        return None
+    return json.dumps(data, sort_keys=True, ensure_ascii=False)
+
+
+def _snapshot(data: Dict[Any, Any]) -> Optional[str]:
+    try:
+        return _dumps(data)
+    except (TypeError, ValueError):
+        return ""
+
+
+class RedisPersistence(BasePersistence[Dict[Any, Any], Dict[Any, Any], Dict[Any, Any]]):
+    def __init__(
+        self,
+        redis: Optional[Redis] = None,
+        *,
+        update_interval: float,
+        ttl_seconds: int,
+        refresh_seconds: float,
+    ) -> None:
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.ttl_seconds = ttl_seconds
+        self.refresh_seconds = refresh_seconds
+        self._redis = redis
+        self._stored: Dict[int, Optional[str]] = {}
+        self._loaded_at: Dict[int, float] = {}
+        self._dirty: Dict[int, Optional[str]] = {}
+        self._unloaded: Set[int] = set()
+        self._flush_task: Optional[asyncio.Task[None]] = None
+        self.loads = 0
+        self.writes = 0
+
+    @property
+    def redis(self) -> Redis:
+        return self._redis or get_redis()
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        loaded_at = self._loaded_at.get(user_id)
+        if loaded_at is not None and time.monotonic() - loaded_at < self.refresh_seconds:
+            return
+        try:
+            raw = await self.redis.get(user_data_key(user_id))
+        except RedisError:
+            logger.warning("No se pudo leer user_data de %s; se usa la copia local", user_id, exc_info=True)
+            if loaded_at is None:
+                self._unloaded.add(user_id)
+            else:
+                self._loaded_at[user_id] = time.monotonic()
+            return
+        self._unloaded.discard(user_id)
+        self.loads += 1
+        self._loaded_at[user_id] = time.monotonic()
+        if loaded_at is not None:
+            stored = self._stored.get(user_id)
+            if raw == stored or user_id in self._dirty or _snapshot(user_data) != stored:
+                return
+        self._stored[user_id] = raw
+        user_data.clear()
+        if raw:
+            user_data.update(json.loads(raw))
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        try:
+            payload = _dumps(data)
+        except (TypeError, ValueError):
+            logger.warning("user_data de %s no es serializable; no se persiste", user_id, exc_info=True)
+            return
+        if user_id in self._unloaded:
+            return
+        if payload == self._stored.get(user_id) and user_id not in self._dirty:
+            return
+        self._dirty[user_id] = payload
+        await self._coalesce()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty[user_id] = None
+        self._loaded_at.pop(user_id, None)
+        await self._coalesce()
+
+    async def _coalesce(self) -> None:
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after_tick(), name="persistence-flush")
+        await asyncio.shield(self._flush_task)
+
+    async def _flush_after_tick(self) -> None:
+        await asyncio.sleep(0)
+        self._flush_task = None
+        await self._write(self._dirty)
+
+    async def _write(self, dirty: Dict[int, Optional[str]]) -> None:
+        if not dirty:
+            return
+        batch = dict(dirty)
+        dirty.clear()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for user_id, payload in batch.items():
+                    if payload is None:
+                        pipe.delete(user_data_key(user_id))
+                    else:
+                        pipe.set(user_data_key(user_id), payload, ex=self.ttl_seconds)
+                await pipe.execute()
+        except Exception:
+            for user_id, payload in batch.items():
+                dirty.setdefault(user_id, payload)
+            raise
+        self._stored.update(batch)
+        self.writes += 1
+
+    async def flush(self) -> None:
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self._write(self._dirty)
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Any, Any]:
+        return {}
+
+    async def update_conversation(self, name: str, key: Any, new_state: Optional[object]) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def update_callback_data(self, data: Any) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        pass
+
+
+def build_persistence() -> RedisPersistence:
+    return RedisPersistence(
+        update_interval=settings.persistence_flush_seconds,
+        ttl_seconds=settings.persistence_ttl_seconds,
+        refresh_seconds=settings.persistence_refresh_seconds,
+    )
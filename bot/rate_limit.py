@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, ContextTypes
+
+from common.config import settings
+from common.redis_client import get_redis, redis_key
+
+from .i18n_es import STRINGS
+from .menus import PATIENT_TERMINATE, SESSION_KEY
+
+logger = logging.getLogger(__name__)
+
+FEATURE_COSTS: Dict[str, int] = {
+    "menu": 1,
+    "llm": 3,
+    "evaluation": 5,
+}
+
+TOKEN_BUCKET_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local cost = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+local wait = 0
+local limited = 0
+local levels = {}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + i * 2])
+    local rate = tonumber(ARGV[2 + i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+    if tokens < cost and (cost - tokens) / rate > wait then
+        wait = (cost - tokens) / rate
+        limited = i
+    end
+    levels[i] = tokens
+end
+if wait > 0 then
+    return {0, math.ceil(wait * 1000), limited}
+end
+for i, key in ipairs(KEYS) do
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - cost), 'ts', tostring(now))
+    redis.call('EXPIRE', key, ttl)
+end
+return {1, 0, 0}
+"""
+
+SCOPES = ("user", "global")
+
+
+@dataclass
+class RateDecision:
+    allowed: bool
+    retry_after: float
+    scope: Optional[str] = None
+
+
+class RateLimiter:
+    def __init__(self, redis: Redis, per_user_per_minute: int, global_per_minute: int) -> None:
+        self.per_user_per_minute = per_user_per_minute
+        self.global_per_minute = global_per_minute
+        self._redis = redis
+        self._script = redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def check(self, user_id: int, cost: int) -> RateDecision:
+        keys = [redis_key("ratelimit", "user", user_id), redis_key("ratelimit", "global")]
+        args = [
+            cost,
+            120,
+            self.per_user_per_minute,
+            self.per_user_per_minute / 60,
+            self.global_per_minute,
+            self.global_per_minute / 60,
+        ]
+        allowed, wait_ms, limited = await self._script(keys=keys, args=args)
+        scope = SCOPES[int(limited) - 1] if int(limited) else None
+        return RateDecision(allowed=bool(allowed), retry_after=int(wait_ms) / 1000, scope=scope)
+
+
+_limiter: Optional[RateLimiter] = None
+_last_notice: Dict[int, float] = {}
+
+
+def validate_limits(per_user_per_minute: int, global_per_minute: int) -> None:
+    feature, cost = max(FEATURE_COSTS.items(), key=lambda item: item[1])
+    limits = (("RATE_LIMIT_PER_MINUTE", per_user_per_minute), ("GLOBAL_RATE_LIMIT_PER_MINUTE", global_per_minute))
+    for name, capacity in limits:
+        if capacity < cost:
+            raise ValueError(f"{name}={capacity} es menor que el costo de '{feature}' ({cost}); nunca se permitiría")
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        validate_limits(settings.rate_limit_per_minute, settings.global_rate_limit_per_minute)
+        _limiter = RateLimiter(get_redis(), settings.rate_limit_per_minute, settings.global_rate_limit_per_minute)
+    return _limiter
+
+
+def classify_update(update: Update, user_data: Optional[Dict[object, object]]) -> Optional[str]:
+    if update.poll_answer:
+        return None
+    if update.callback_query:
+        return "evaluation" if update.callback_query.data == PATIENT_TERMINATE else "menu"
+    message = update.effective_message
+    if message and message.text and not message.text.startswith("/"):
+        return "llm" if user_data and user_data.get(SESSION_KEY) else "menu"
+    return "menu"
+
+
+async def rate_limit_guard(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    user = update.effective_user
+    if not user:
+        return
+    feature = classify_update(update, context.user_data)
+    if feature is None:
+        return
+    try:
+        decision = await get_rate_limiter().check(user.id, FEATURE_COSTS[feature])
+    except RedisError:
+        logger.warning("Limitador no disponible; se deja pasar el update", exc_info=True)
+        return
+    if decision.allowed:
+        return
+
+    seconds = max(1, math.ceil(decision.retry_after))
+    now = time.monotonic()
+    if now - _last_notice.get(user.id, 0.0) >= seconds:
+        _last_notice[user.id] = now
+        template = STRINGS.RATE_LIMITED_GLOBAL if decision.scope == "global" else STRINGS.RATE_LIMITED
+        text = template.format(seconds=seconds)
+        if update.callback_query:
+            await update.callback_query.answer(text, show_alert=True)
+        elif update.effective_message:
+            await update.effective_message.reply_text(text)
+    elif update.callback_query:
+        await update.callback_query.answer()
+    raise ApplicationHandlerStop
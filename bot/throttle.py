@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+
+class TokenBucket:
+    def __init__(self, per_second: float, capacity: float | None = None) -> None:
+        self.per_second = per_second
+        self.capacity = capacity if capacity is not None else per_second
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = max(0.0, now - max(self._updated, self._paused_until))
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.per_second)
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self._tokens >= 1 and time.monotonic() >= self._paused_until:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self) -> None:
+        while not self.try_acquire():
+            paused = self._paused_until - time.monotonic()
+            await asyncio.sleep(max(paused, (1 - self._tokens) / self.per_second))
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import logging
+from collections import deque
+from typing import Any, AsyncContextManager, Awaitable, Callable, Coroutine, Deque, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor, ContextTypes
+
+from common.db import UnitOfWork, mark_rollback, unit_of_work
+
+logger = logging.getLogger(__name__)
+
+QUERY_SAMPLE_SIZE = 1000
+
+DropCallback = Callable[[object], Awaitable[None]]
+
+
+def ordering_key(update: object) -> Optional[int]:
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+async def rollback_on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    mark_rollback()
+    logger.error("Error procesando la update %s", getattr(update, "update_id", None), exc_info=context.error)
+
+
+def _discard(coroutine: Awaitable[Any]) -> None:
+    if isinstance(coroutine, Coroutine):
+        coroutine.close()
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    def __init__(
+        self,
+        max_concurrent_updates: int,
+        *,
+        max_pending_per_chat: int,
+        unit_of_work_factory: Callable[[], AsyncContextManager[UnitOfWork]] = unit_of_work,
+        on_drop: Optional[DropCallback] = None,
+    ) -> None:
+        super().__init__(max_concurrent_updates)
+        self.max_pending_per_chat = max_pending_per_chat
+        self.on_drop = on_drop
+        self._unit_of_work_factory = unit_of_work_factory
+        self._pending: Dict[int, Deque[Tuple[object, Awaitable[Any]]]] = {}
+        self.query_counts: Deque[int] = deque(maxlen=QUERY_SAMPLE_SIZE)
+        self.processed = 0
+        self.dropped = 0
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._pending)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = ordering_key(update)
+        if key is None:
+            await self._run(update, coroutine)
+            return
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            if len(pending) >= self.max_pending_per_chat:
+                self.dropped += 1
+                await self._drop(update, coroutine)
+                logger.warning("Cola del chat %s llena; update descartado", key)
+                return
+            pending.append((update, coroutine))
+            return
+
+        pending = self._pending[key] = deque()
+        try:
+            while True:
+                await self._run(update, coroutine)
+                if not pending:
+                    break
+                update, coroutine = pending.popleft()
+        finally:
+            while pending:
+                await self._drop(*pending.popleft())
+            del self._pending[key]
+
+    async def _drop(self, update: object, coroutine: Awaitable[Any]) -> None:
+        _discard(coroutine)
+        if self.on_drop is None:
+            return
+        try:
+            await self.on_drop(update)
+        except Exception:
+            update_id = getattr(update, "update_id", None)
+            logger.warning("Falló el aviso de descarte de la update %s", update_id, exc_info=True)
+
+    async def _run(self, update: object, coroutine: Awaitable[Any]) -> None:
+        update_id = getattr(update, "update_id", None)
+        try:
+            async with self._unit_of_work_factory() as unit:
+                await coroutine
+        except Exception:
+            logger.exception("Error procesando la update %s", update_id)
+        else:
+            self.query_counts.append(unit.queries)
+            logger.debug("Update %s resuelta con %d consultas", update_id, unit.queries)
+        self.processed += 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        for pending in self._pending.values():
+            while pending:
+                await self._drop(*pending.popleft())
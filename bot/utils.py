@@ -3,10 +3,11 @@ from __future__ import annotations
 from functools import wraps
 from typing import Awaitable, Callable, TypeVar
 
-from telegram import Update
+from telegram import Update, User as TelegramUser
 from telegram.ext import ContextTypes
 
 from common.config import settings
+from common.db import User, get_session
 
 from .i18n_es import STRINGS
 
@@ -19,6 +20,19 @@ def is_admin(user_id: int | None) -> bool:
     return user_id in settings.admin_ids
 
 
+async def register_user(user: TelegramUser) -> None:
+    async with get_session() as session:
+        record = await session.get(User, user.id)
+        if record is None:
+            record = User(id=user.id, role="admin" if is_admin(user.id) else "student")
+            session.add(record)
+        record.first_name = user.first_name
+        record.last_name = user.last_name
+        record.username = user.username
+        record.language_code = user.language_code
+        await session.commit()
+
+
 def require_admin(handler: THandler) -> THandler:
     @wraps(handler)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:  # type: ignore[misc]
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from redis.asyncio import Redis
+from telegram import Bot, Update
+
+from common.config import settings
+from common.redis_client import close_redis, get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/telegram/webhook"
+
+
+def update_queue_key(shard: int) -> str:
+    return redis_key("updates", shard)
+
+
+def processing_queue_key(shard: int) -> str:
+    return redis_key("updates", "processing", shard)
+
+
+def routing_id(payload: Dict[str, Any]) -> int:
+    for value in payload.values():
+        if not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return int(chat["id"])
+        sender = value.get("from") or value.get("user")
+        if sender and "id" in sender:
+            return int(sender["id"])
+    return int(payload.get("update_id", 0))
+
+
+def shard_for(payload: Dict[str, Any], shards: int) -> int:
+    return routing_id(payload) % shards
+
+
+async def enqueue_update(redis: Redis, payload: Dict[str, Any], shards: int, dedup_ttl: int) -> bool:
+    update_id = payload.get("update_id")
+    if update_id is None:
+        return False
+    seen_key = redis_key("updates", "seen", update_id)
+    if not await redis.set(seen_key, 1, nx=True, ex=dedup_ttl):
+        return False
+    try:
+        await redis.lpush(update_queue_key(shard_for(payload, shards)), json.dumps(payload))
+    except Exception:
+        await redis.delete(seen_key)
+        raise
+    return True
+
+
+def create_webhook_app() -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        if settings.webhook_url:
+            async with Bot(settings.telegram_token) as bot:
+                await bot.set_webhook(
+                    url=f"{settings.webhook_url.rstrip('/')}{WEBHOOK_PATH}",
+                    secret_token=settings.webhook_secret or None,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+            logger.info("Webhook registrado en %s", settings.webhook_url)
+        try:
+            yield
+        finally:
+            await close_redis()
+
+    app = FastAPI(title="CISEC Nexus webhook", lifespan=lifespan)
+
+    @app.post(WEBHOOK_PATH)
+    async def telegram_webhook(
+        request: Request,
+        x_telegram_bot_api_secret_token: Optional[str] = Header(default=None),
+    ) -> Dict[str, bool]:
+        if settings.webhook_secret and x_telegram_bot_api_secret_token != settings.webhook_secret:
+            raise HTTPException(status_code=403, detail="Token secreto inválido")
+        payload = await request.json()
+        queued = await enqueue_update(get_redis(), payload, settings.webhook_shards, settings.update_dedup_ttl_seconds)
+        return {"ok": True, "queued": queued}
+
+    return app
+
+
+app = create_webhook_app()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+from functools import partial
+from typing import Dict, List, Optional
+
+from redis.asyncio import Redis
+from telegram import Update
+from telegram.ext import Application
+
+from common.config import settings
+from common.redis_client import get_redis
+
+from .main import build_application
+from .webhook import processing_queue_key, update_queue_key
+
+logger = logging.getLogger(__name__)
+
+
+async def recover_shard(redis: Redis, shard: int) -> int:
+    moved = 0
+    while await redis.lmove(processing_queue_key(shard), update_queue_key(shard), "LEFT", "RIGHT") is not None:
+        moved += 1
+    if moved:
+        logger.warning("Reencoladas %d updates sin terminar del shard %d", moved, shard)
+    return moved
+
+
+async def _release(redis: Redis, processing: str, raws: Dict[int, str], update: object) -> None:
+    raw = raws.pop(getattr(update, "update_id", None), None)
+    if raw is not None:
+        await redis.lrem(processing, 1, raw)
+
+
+async def _process(
+    application: Application, update: Update, redis: Redis, processing: str, raws: Dict[int, str]
+) -> None:
+    try:
+        await application.process_update(update)
+    finally:
+        await _release(redis, processing, raws, update)
+
+
+async def consume_shard(application: Application, shard: int) -> None:
+    redis = get_redis()
+    key = update_queue_key(shard)
+    processing = processing_queue_key(shard)
+    raws: Dict[int, str] = {}
+    application.update_processor.on_drop = partial(_release, redis, processing, raws)
+    await recover_shard(redis, shard)
+    while True:
+        raw = await redis.blmove(key, processing, 5, "RIGHT", "LEFT")
+        if raw is None:
+            continue
+        try:
+            update = Update.de_json(json.loads(raw), application.bot)
+        except (ValueError, TypeError):
+            logger.warning("Update inválido descartado en shard %d", shard)
+            await redis.lrem(processing, 1, raw)
+            continue
+        raws[update.update_id] = raw
+        application.create_task(
+            application.update_processor.process_update(update, _process(application, update, redis, processing, raws)),
+            update=update,
+        )
+
+
+async def run_worker(shard: int) -> None:
+    application = build_application()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    logger.info("Worker del shard %d iniciado", shard)
+    try:
+        await consume_shard(application, shard)
+    finally:
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def _run_shard(shard: int) -> None:
+    try:
+        asyncio.run(run_worker(shard))
+    except KeyboardInterrupt:
+        pass
+
+
+def main(shards: Optional[List[int]] = None) -> None:
+    selected = shards if shards is not None else list(range(settings.webhook_shards))
+    if len(selected) == 1:
+        _run_shard(selected[0])
+        return
+    processes = [
+        multiprocessing.Process(target=_run_shard, args=(shard,), name=f"bot-worker-{shard}") for shard in selected
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Workers que procesan updates recibidos por webhook")
+    parser.add_argument(
+        "--shard",
+        type=int,
+        action="append",
+        help="Shard a consumir (repetible). Por defecto un proceso por cada shard de WEBHOOK_SHARDS",
+    )
+    args = parser.parse_args()
+    main(args.shard)
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from functools import lru_cache
-from typing import List
+from typing import Any, List, Optional, cast
 
 from pydantic import AnyHttpUrl, BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -20,6 +20,10 @@ class Settings(BaseSettings):
     telegram_admin_ids: str = Field(alias="TELEGRAM_ADMIN_IDS")
     bot_language: str = Field(default="es", alias="BOT_LANGUAGE")
     bot_log_level: str = Field(default="INFO", alias="BOT_LOG_LEVEL")
+    webhook_url: Optional[str] = Field(default=None, alias="WEBHOOK_URL")
+    webhook_secret: str = Field(default="", alias="WEBHOOK_SECRET")
+    webhook_shards: int = Field(default=4, alias="WEBHOOK_SHARDS")
+    update_dedup_ttl_seconds: int = Field(default=86400, alias="UPDATE_DEDUP_TTL_SECONDS")
 
     database_url: str = Field(alias="DATABASE_URL")
     sync_database_url: str = Field(alias="SYNC_DATABASE_URL")
@@ -32,6 +36,9 @@ class Settings(BaseSettings):
     api_base_url: AnyHttpUrl = Field(alias="API_BASE_URL")
     fastapi_host: str = Field(default="0.0.0.0", alias="FASTAPI_HOST")
     fastapi_port: int = Field(default=8000, alias="FASTAPI_PORT")
+    gateway_workers_per_model: int = Field(default=2, alias="GATEWAY_WORKERS_PER_MODEL")
+    gateway_queue_size: int = Field(default=64, alias="GATEWAY_QUEUE_SIZE")
+    gateway_retry_after_max_seconds: int = Field(default=30, alias="GATEWAY_RETRY_AFTER_MAX_SECONDS")
 
     ollama_base_url: AnyHttpUrl = Field(alias="OLLAMA_BASE_URL")
     ollama_model: str = Field(default="llama3:8b-instruct", alias="OLLAMA_MODEL")
@@ -39,6 +46,15 @@ class Settings(BaseSettings):
     ollama_max_tokens: int = Field(default=512, alias="OLLAMA_MAX_TOKENS")
     ollama_temperature: float = Field(default=0.6, alias="OLLAMA_TEMPERATURE")
 
+    llm_pool_max_connections: int = Field(default=100, alias="LLM_POOL_MAX_CONNECTIONS")
+    llm_pool_max_keepalive: int = Field(default=20, alias="LLM_POOL_MAX_KEEPALIVE")
+    llm_keepalive_expiry_seconds: float = Field(default=30.0, alias="LLM_KEEPALIVE_EXPIRY_SECONDS")
+    llm_connect_timeout_seconds: float = Field(default=5.0, alias="LLM_CONNECT_TIMEOUT_SECONDS")
+    llm_max_in_flight: int = Field(default=32, alias="LLM_MAX_IN_FLIGHT")
+    llm_streaming: bool = Field(default=False, alias="LLM_STREAMING")
+    llm_stream_edit_interval_seconds: float = Field(default=1.2, alias="LLM_STREAM_EDIT_INTERVAL_SECONDS")
+    llm_stream_global_edits_per_second: float = Field(default=20.0, alias="LLM_STREAM_GLOBAL_EDITS_PER_SECOND")
+
     academic_period: AcademicPeriod = Field(
         default_factory=lambda: AcademicPeriod(start="2025-09-08", end="2025-12-20", total_weeks=15),
         alias="ACADEMIC_PERIOD",
@@ -52,9 +68,41 @@ class Settings(BaseSettings):
     syllabus_dir: str = Field(default="./data/syllabus", alias="SYLLABUS_DIR")
     patient_notes_dir: str = Field(default="./data/patient_notes", alias="PATIENT_NOTES_DIR")
     ifom_json_path: str = Field(default="./data/ifom_bank.json", alias="IFOM_JSON_PATH")
+    doc_index_workers: int = Field(default=2, alias="DOC_INDEX_WORKERS")
 
     rate_limit_per_minute: int = Field(default=20, alias="RATE_LIMIT_PER_MINUTE")
+    global_rate_limit_per_minute: int = Field(default=1200, alias="GLOBAL_RATE_LIMIT_PER_MINUTE")
     broadcast_chunk_size: int = Field(default=25, alias="BROADCAST_CHUNK_SIZE")
+    broadcast_messages_per_second: float = Field(default=25.0, alias="BROADCAST_MESSAGES_PER_SECOND")
+    update_concurrency: int = Field(default=32, alias="UPDATE_CONCURRENCY")
+    update_max_pending_per_chat: int = Field(default=20, alias="UPDATE_MAX_PENDING_PER_CHAT")
+    persistence_flush_seconds: float = Field(default=10.0, alias="PERSISTENCE_FLUSH_SECONDS")
+    persistence_refresh_seconds: float = Field(default=300.0, alias="PERSISTENCE_REFRESH_SECONDS")
+    persistence_ttl_seconds: int = Field(default=2592000, alias="PERSISTENCE_TTL_SECONDS")
+
+    history_buffer_sessions: int = Field(default=2000, alias="HISTORY_BUFFER_SESSIONS")
+    history_token_budget: int = Field(default=900, alias="HISTORY_TOKEN_BUDGET")
+    history_summary_tokens: int = Field(default=200, alias="HISTORY_SUMMARY_TOKENS")
+    simlog_flush_batch_size: int = Field(default=100, alias="SIMLOG_FLUSH_BATCH_SIZE")
+    simlog_flush_interval_seconds: float = Field(default=1.0, alias="SIMLOG_FLUSH_INTERVAL_SECONDS")
+    simlog_max_pending: int = Field(default=10000, alias="SIMLOG_MAX_PENDING")
+    simlog_max_attempts: int = Field(default=5, alias="SIMLOG_MAX_ATTEMPTS")
+    persona_cache_max_entries: int = Field(default=64, alias="PERSONA_CACHE_MAX_ENTRIES")
+    persona_cache_ttl_seconds: float = Field(default=600.0, alias="PERSONA_CACHE_TTL_SECONDS")
+    response_cache_enabled: bool = Field(default=False, alias="RESPONSE_CACHE_ENABLED")
+    response_cache_ttl_seconds: int = Field(default=86400, alias="RESPONSE_CACHE_TTL_SECONDS")
+    response_cache_max_entries: int = Field(default=5000, alias="RESPONSE_CACHE_MAX_ENTRIES")
+    response_cache_variants: int = Field(default=3, alias="RESPONSE_CACHE_VARIANTS")
+    retrieval_top_k: int = Field(default=4, alias="RETRIEVAL_TOP_K")
+    retrieval_token_budget: int = Field(default=300, alias="RETRIEVAL_TOKEN_BUDGET")
+    evaluation_workers: int = Field(default=2, alias="EVALUATION_WORKERS")
+    evaluation_max_attempts: int = Field(default=3, alias="EVALUATION_MAX_ATTEMPTS")
+
+    ifom_index_refresh_seconds: int = Field(default=60, alias="IFOM_INDEX_REFRESH_SECONDS")
+    ifom_max_seen_per_user: int = Field(default=500, alias="IFOM_MAX_SEEN_PER_USER")
+    ifom_max_seen_users: int = Field(default=5000, alias="IFOM_MAX_SEEN_USERS")
+    ifom_poll_ttl_seconds: int = Field(default=900, alias="IFOM_POLL_TTL_SECONDS")
+    ifom_poll_sweep_seconds: int = Field(default=60, alias="IFOM_POLL_SWEEP_SECONDS")
 
     default_patient_slug: str = Field(default="sofia-gastro", alias="DEFAULT_PATIENT_SLUG")
 
@@ -68,4 +116,15 @@ def get_settings() -> Settings:
     return Settings()
 
 
-settings = get_settings()
+class _LazySettings:
+    def __getattr__(self, name: str) -> Any:
+        return getattr(get_settings(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(get_settings(), name, value)
+
+    def __delattr__(self, name: str) -> None:
+        delattr(get_settings(), name)
+
+
+settings = cast(Settings, _LazySettings())
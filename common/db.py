@@ -1,22 +1,29 @@
 from __future__ import annotations
 
 
+import asyncio
 import json
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Any, AsyncIterator, Dict, Optional
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 
-from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Integer, JSON, String, Text
+from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Index, Integer, JSON, String, Text, event, text
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy.schema import CreateTable
+from sqlalchemy.schema import CreateIndex, CreateTable
 
 from .config import settings
 
 
+IFOM_BANK_VERSION_KEY = "ifom_bank_version"
+SEARCH_TEXT_CONFIG = "spanish"
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -77,6 +84,7 @@ class IFOMItem(Base):
     answer_index: Mapped[int] = mapped_column(Integer)
     explanation: Mapped[Optional[str]] = mapped_column(Text)
     tags: Mapped[list[str]] = mapped_column(JSON_TYPE, default=list)
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64))
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
 
     attempts: Mapped[list["IFOMAttempt"]] = relationship(back_populates="item")
@@ -109,6 +117,23 @@ class Document(Base):
     extra: Mapped[Dict[str, Any]] = mapped_column(JSON_TYPE, default=dict)
 
 
+class DocumentPage(Base):
+    __tablename__ = "document_pages"
+    __table_args__ = (
+        Index("ix_document_pages_document_page", "document_id", "page_number", unique=True),
+        Index(
+            "ix_document_pages_tsv",
+            text(f"to_tsvector('{SEARCH_TEXT_CONFIG}', content)"),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
+
+    id: Mapped[int] = mapped_column(ID_TYPE, primary_key=True, autoincrement=True)
+    document_id: Mapped[int] = mapped_column(ForeignKey("documents.id", ondelete="CASCADE"))
+    page_number: Mapped[int] = mapped_column(Integer)
+    content: Mapped[str] = mapped_column(Text)
+
+
 class Setting(Base):
     __tablename__ = "settings"
 
@@ -125,6 +150,7 @@ class Patient(Base):
     display_name: Mapped[str] = mapped_column(String(120))
     summary: Mapped[Optional[str]] = mapped_column(Text)
     persona: Mapped[Dict[str, Any]] = mapped_column(JSON_TYPE)
+    retrieval: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON_TYPE)
     notes_path: Mapped[Optional[str]] = mapped_column(String(512))
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
 
@@ -139,6 +165,7 @@ class SimSession(Base):
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     status: Mapped[str] = mapped_column(String(32), default="active")
     rubric: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON_TYPE)
+    summary: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON_TYPE)
     started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
     ended_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
 
@@ -149,6 +176,7 @@ class SimSession(Base):
 
 class SimLog(Base):
     __tablename__ = "sim_logs"
+    __table_args__ = (Index("ix_sim_logs_session_created", "session_id", "created_at"),)
 
     id: Mapped[int] = mapped_column(ID_TYPE, primary_key=True, autoincrement=True)
     session_id: Mapped[int] = mapped_column(ForeignKey("sim_sessions.id", ondelete="CASCADE"))
@@ -160,6 +188,62 @@ class SimLog(Base):
     session: Mapped[SimSession] = relationship(back_populates="logs")
 
 
+class EvaluationJob(Base):
+    __tablename__ = "evaluation_jobs"
+    __table_args__ = (Index("ix_evaluation_jobs_status_next", "status", "next_attempt_at"),)
+
+    id: Mapped[int] = mapped_column(ID_TYPE, primary_key=True, autoincrement=True)
+    session_id: Mapped[int] = mapped_column(ForeignKey("sim_sessions.id", ondelete="CASCADE"))
+    chat_id: Mapped[int] = mapped_column(BigInteger)
+    payload: Mapped[Dict[str, Any]] = mapped_column(JSON_TYPE)
+    status: Mapped[str] = mapped_column(String(16), default="queued")
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+
+
+class UnitOfWorkSession(AsyncSession):
+    async def commit(self) -> None:
+        await self.flush()
+
+    async def finish(self) -> None:
+        await super().commit()
+
+
+@dataclass
+class UnitOfWork:
+    session: UnitOfWorkSession
+    task: Optional[asyncio.Task[Any]]
+    queries: int = 0
+    rollback_only: bool = False
+    after_commit: List[Callable[[], None]] = field(default_factory=list)
+
+    async def commit(self) -> None:
+        if self.session.in_transaction():
+            await self.session.finish()
+        callbacks, self.after_commit = self.after_commit, []
+        for callback in callbacks:
+            callback()
+
+
+_unit_of_work: ContextVar[Optional[UnitOfWork]] = ContextVar("unit_of_work", default=None)
+
+
+def current_unit_of_work() -> Optional[UnitOfWork]:
+    unit = _unit_of_work.get()
+    if unit is None or unit.task is not asyncio.current_task():
+        return None
+    return unit
+
+
+def _count_query(*args: Any) -> None:
+    unit = current_unit_of_work()
+    if unit is not None:
+        unit.queries += 1
+
+
 _engine: Optional[AsyncEngine] = None
 _sessionmaker: Optional[async_sessionmaker[AsyncSession]] = None
 
@@ -173,6 +257,7 @@ def get_engine() -> AsyncEngine:
         else:
             engine_kwargs["pool_size"] = settings.db_pool_size
         _engine = create_async_engine(settings.database_url, **engine_kwargs)
+        event.listen(_engine.sync_engine, "before_cursor_execute", _count_query)
         _sessionmaker = async_sessionmaker(_engine, expire_on_commit=False)
     return _engine
 
@@ -186,11 +271,62 @@ def get_sessionmaker() -> async_sessionmaker[AsyncSession]:
 
 @asynccontextmanager
 async def get_session() -> AsyncIterator[AsyncSession]:
+    unit = current_unit_of_work()
+    if unit is not None:
+        yield unit.session
+        return
     session_factory = get_sessionmaker()
     async with session_factory() as session:
         yield session
 
 
+@asynccontextmanager
+async def unit_of_work(bind: Optional[AsyncEngine] = None) -> AsyncIterator[UnitOfWork]:
+    unit = UnitOfWork(UnitOfWorkSession(bind=bind or get_engine(), expire_on_commit=False), asyncio.current_task())
+    token = _unit_of_work.set(unit)
+    try:
+        yield unit
+        if unit.rollback_only:
+            await unit.session.rollback()
+        else:
+            await unit.commit()
+    finally:
+        _unit_of_work.reset(token)
+        await unit.session.close()
+
+
+async def release_connection() -> None:
+    unit = current_unit_of_work()
+    if unit is not None and not unit.rollback_only:
+        await unit.commit()
+
+
+def after_commit(callback: Callable[[], None]) -> None:
+    unit = current_unit_of_work()
+    if unit is None:
+        callback()
+    else:
+        unit.after_commit.append(callback)
+
+
+def mark_rollback() -> None:
+    unit = current_unit_of_work()
+    if unit is not None:
+        unit.rollback_only = True
+
+
+async def bump_version(session: AsyncSession, key: str) -> int:
+    stamp = await session.get(Setting, key)
+    version = int((stamp.value or {}).get("version", 0)) + 1 if stamp else 1
+    value = {"version": version, "updated_at": datetime.utcnow().isoformat()}
+    if stamp:
+        stamp.value = value
+        stamp.updated_at = datetime.utcnow()
+    else:
+        session.add(Setting(key=key, value=value))
+    return version
+
+
 async def init_db(drop_existing: bool = False) -> None:
     engine = get_engine()
     async with engine.begin() as conn:
@@ -205,6 +341,8 @@ def dump_schema_sql(path: Path) -> None:
     for table in Base.metadata.sorted_tables:
         sql = str(CreateTable(table).compile(dialect=dialect))
         statements.append(sql.rstrip("; ") + ";")
+        for index in sorted(table.indexes, key=lambda item: item.name or ""):
+            statements.append(str(CreateIndex(index).compile(dialect=dialect)).rstrip("; ") + ";")
     path.write_text("\n\n".join(statements), encoding="utf-8")
 
 
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import json
+
+from redis.asyncio import Redis
+
+from .redis_client import redis_key
+
+PATIENT_CHANNEL = redis_key("invalidate", "patient")
+
+
+def patient_version_key(slug: str) -> str:
+    return redis_key("patient", "version", slug)
+
+
+async def get_patient_version(redis: Redis, slug: str) -> int:
+    raw = await redis.get(patient_version_key(slug))
+    return int(raw) if raw else 0
+
+
+async def publish_patient_version(redis: Redis, slug: str) -> int:
+    version = await redis.incr(patient_version_key(slug))
+    await redis.publish(PATIENT_CHANNEL, json.dumps({"slug": slug, "version": version}))
+    return version
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+from .config import settings
+from .metrics import LatencyRecorder
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClient:
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+        connect_timeout: float,
+        read_timeout: float,
+        max_in_flight: int,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            transport=transport,
+        )
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.latency = LatencyRecorder()
+
+    async def post_json(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        queued_at = time.perf_counter()
+        async with self._semaphore:
+            started = time.perf_counter()
+            self.latency.observe(f"{path}:wait", started - queued_at)
+            self.in_flight += 1
+            try:
+                response = await self._client.post(path, json=payload)
+                response.raise_for_status()
+                return response.json()
+            finally:
+                self.in_flight -= 1
+                elapsed = time.perf_counter() - started
+                self.latency.observe(path, elapsed)
+                logger.debug("LLM %s completado en %.0f ms", path, elapsed * 1000)
+
+    async def stream_json(self, path: str, payload: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        queued_at = time.perf_counter()
+        async with self._semaphore:
+            started = time.perf_counter()
+            self.latency.observe(f"{path}:wait", started - queued_at)
+            self.in_flight += 1
+            first_chunk = True
+            try:
+                async with self._client.stream("POST", path, json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        if first_chunk:
+                            self.latency.observe(f"{path}:first_chunk", time.perf_counter() - started)
+                            first_chunk = False
+                        try:
+                            chunk = json.loads(line)
+                        except json.JSONDecodeError as exc:
+                            logger.warning("Fragmento inválido en el stream de %s: %.200r", path, line)
+                            raise httpx.DecodingError(
+                                f"Fragmento JSON inválido: {exc}", request=response.request
+                            ) from exc
+                        yield chunk
+            finally:
+                self.in_flight -= 1
+                self.latency.observe(f"{path}:stream", time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "latency": self.latency.snapshot(),
+        }
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+_client: Optional[LLMClient] = None
+
+
+def get_llm_client() -> LLMClient:
+    global _client
+    if _client is None:
+        _client = LLMClient(
+            str(settings.api_base_url),
+            max_connections=settings.llm_pool_max_connections,
+            max_keepalive_connections=settings.llm_pool_max_keepalive,
+            keepalive_expiry=settings.llm_keepalive_expiry_seconds,
+            connect_timeout=settings.llm_connect_timeout_seconds,
+            read_timeout=settings.ollama_timeout_seconds,
+            max_in_flight=settings.llm_max_in_flight,
+        )
+    return _client
+
+
+async def close_llm_client() -> None:
+    global _client
+    if _client is None:
+        return
+    logger.info("Latencias LLM: %s", _client.latency.snapshot())
+    await _client.aclose()
+    _client = None
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+from collections import defaultdict, deque
+from typing import Deque, Dict
+
+
+class LatencyRecorder:
+    def __init__(self, window: int = 1024) -> None:
+        self._window = window
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self._window))
+        self._counts: Dict[str, int] = defaultdict(int)
+
+    def observe(self, name: str, seconds: float) -> None:
+        self._samples[name].append(seconds)
+        self._counts[name] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        report: Dict[str, Dict[str, float]] = {}
+        for name, samples in self._samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            report[name] = {
+                "count": self._counts[name],
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 1),
+                "p50_ms": round(_percentile(ordered, 0.50) * 1000, 1),
+                "p95_ms": round(_percentile(ordered, 0.95) * 1000, 1),
+                "max_ms": round(ordered[-1] * 1000, 1),
+            }
+        return report
+
+
+def _percentile(ordered: list[float], fraction: float) -> float:
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
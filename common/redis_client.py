@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from redis.asyncio import Redis
+
+from .config import settings
+
+_redis: Optional[Redis] = None
+
+
+def redis_key(*parts: object) -> str:
+    return ":".join([settings.redis_bot_prefix, *(str(part) for part in parts)])
+
+
+def get_redis() -> Redis:
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(settings.redis_url, decode_responses=True)
+    return _redis
+
+
+async def close_redis() -> None:
+    global _redis
+    if _redis is None:
+        return
+    await _redis.aclose()
+    _redis = None
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import math
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .text import estimate_tokens, tokenize
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def build_bm25_index(passages: Sequence[str]) -> Dict[str, Any]:
+    counts = [Counter(tokenize(passage)) for passage in passages]
+    vocab = sorted({term for count in counts for term in count})
+    positions = {term: index for index, term in enumerate(vocab)}
+    lengths = [sum(count.values()) for count in counts]
+    average = (sum(lengths) / len(lengths)) if lengths else 0.0
+    frequency = Counter(term for count in counts for term in count)
+    total = len(passages)
+
+    weights: List[List[List[float]]] = []
+    for count, length in zip(counts, lengths):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average) if average else BM25_K1
+        row = []
+        for term, tf in count.items():
+            idf = math.log(1 + (total - frequency[term] + 0.5) / (frequency[term] + 0.5))
+            row.append([positions[term], round(idf * tf * (BM25_K1 + 1) / (tf + norm), 4)])
+        weights.append(row)
+    return {"passages": list(passages), "vocab": vocab, "weights": weights}
+
+
+Postings = Dict[int, Tuple[np.ndarray, np.ndarray]]
+
+
+class PassageIndex:
+    def __init__(self, passages: List[str], vocab: List[str], postings: Postings) -> None:
+        self.passages = passages
+        self._positions = {term: index for index, term in enumerate(vocab)}
+        self._postings = postings
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> PassageIndex:
+        passages = list(payload.get("passages") or [])
+        vocab = list(payload.get("vocab") or [])
+        columns: Dict[int, Tuple[List[int], List[float]]] = defaultdict(lambda: ([], []))
+        for row, entries in enumerate(payload.get("weights") or []):
+            for column, weight in entries:
+                rows, weights = columns[int(column)]
+                rows.append(row)
+                weights.append(weight)
+        postings = {
+            column: (np.asarray(rows, dtype=np.int32), np.asarray(weights, dtype=np.float32))
+            for column, (rows, weights) in columns.items()
+        }
+        return cls(passages, vocab, postings)
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def search(self, query: str, k: int) -> List[int]:
+        columns = sorted({self._positions[term] for term in tokenize(query) if term in self._positions})
+        if not columns or not self.passages:
+            return []
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for column in columns:
+            if column in self._postings:
+                rows, weights = self._postings[column]
+                scores[rows] += weights
+        k = min(k, len(self.passages))
+        candidates = np.argpartition(-scores, k - 1)[:k]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [int(index) for index in ranked if scores[index] > 0]
+
+    def top_passages(self, query: str, k: int, token_budget: int) -> List[str]:
+        selected: List[str] = []
+        used = 0
+        for index in self.search(query, k):
+            cost = estimate_tokens(self.passages[index])
+            if used + cost > token_budget:
+                continue
+            selected.append(self.passages[index])
+            used += cost
+        return selected
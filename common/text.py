@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import math
+import re
+import unicodedata
+from typing import List
+
+WORD_PATTERN = re.compile(r"\w+")
+CHARS_PER_TOKEN = 4
+
+STOPWORDS = frozenset(
+    """
+    a al algo ante antes aqui asi como con contra cual cuando de del desde donde el ella ellas ellos en entre era
+    es esa ese eso esta estaba este esto estoy fue ha hay la las le les lo los mas me mi mis mucho muy nada ni no
+    nos o otra otro para pero poco por porque que se sea ser si sin sobre su sus tambien te tiene tu un una uno
+    unos usted y ya yo
+    """.split()
+)
+
+
+def fold(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in WORD_PATTERN.findall(fold(text)) if len(word) > 1 and word not in STOPWORDS]
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
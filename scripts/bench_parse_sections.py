@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+from typing import Iterator, List, Optional
+
+from scripts.seed_patient_from_pdf import SECTION_ALIASES, detect_section, parse_sections
+
+FILLER = [
+    "Paciente refiere dolor de intensidad moderada que aumenta con la ingesta de alimentos.",
+    "Niega fiebre, pérdida de peso o cambios en el hábito intestinal.",
+    "Se solicita control en 48 horas con resultados pendientes.",
+    "Refiere buena adherencia al tratamiento indicado previamente.",
+    "Sin hallazgos relevantes adicionales en la revisión por sistemas.",
+]
+
+
+def synthetic_pages(pages: int, lines_per_page: int, seed: int = 7) -> Iterator[str]:
+    rng = random.Random(seed)
+    headers = [alias.title() + ":" for aliases in SECTION_ALIASES.values() for alias in aliases]
+    for _ in range(pages):
+        lines: List[str] = []
+        for _ in range(lines_per_page):
+            lines.append(rng.choice(headers) if rng.random() < 0.08 else rng.choice(FILLER))
+        yield "\n".join(lines)
+
+
+def naive_detect_section(line: str) -> Optional[str]:
+    lower = line.lower().strip(": ")
+    for key, aliases in SECTION_ALIASES.items():
+        for alias in aliases:
+            if lower.startswith(alias):
+                return key
+    return None
+
+
+def naive_parse_sections(text: str) -> dict:
+    sections = {"narrativa": []}
+    current = "narrativa"
+    for raw_line in text.splitlines():
+        line = re.sub(r"\s+", " ", raw_line.strip())
+        if not line:
+            continue
+        section = naive_detect_section(line)
+        if section:
+            current = section
+            sections.setdefault(current, [])
+            continue
+        sections.setdefault(current, []).append(line)
+    return sections
+
+
+def main(pages: int, lines_per_page: int, repeat: int) -> None:
+    note = list(synthetic_pages(pages, lines_per_page))
+    lines = [line for page in note for line in page.splitlines()]
+    assert all(detect_section(line) == naive_detect_section(line) for line in lines)
+
+    best_naive = best_compiled = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        naive = naive_parse_sections("\n".join(note))
+        best_naive = min(best_naive, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        compiled = parse_sections(iter(note))
+        best_compiled = min(best_compiled, time.perf_counter() - start)
+    assert naive == compiled
+
+    print(f"{pages} páginas × {lines_per_page} líneas ({len(lines)} líneas)")
+    print(f"  startswith por alias: {best_naive * 1000:8.1f} ms")
+    print(f"  patrón compilado:     {best_compiled * 1000:8.1f} ms  ({best_naive / best_compiled:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark de parse_sections sobre una nota clínica sintética")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--lines-per-page", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    main(args.pages, args.lines_per_page, args.repeat)
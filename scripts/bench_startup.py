@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import List, NamedTuple, Tuple
+
+DEFAULT_MODULE = "bot.main"
+DEFAULT_BUDGET_MS = 700.0
+DEFAULT_FIRST_UPDATE_BUDGET_MS = 1200.0
+HEAVY_MODULES = ("sqlalchemy", "PyPDF2", "numpy", "redis", "bot.features")
+FIRST_UPDATE_FORBIDDEN = ("PyPDF2", "numpy", "bot.features")
+
+
+class ImportTiming(NamedTuple):
+    module: str
+    depth: int
+    self_ms: float
+    cumulative_ms: float
+
+
+def parse_importtime(output: str) -> List[ImportTiming]:
+    timings: List[ImportTiming] = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|", 2)
+        module = name.lstrip()
+        depth = (len(name) - len(module) - 1) // 2
+        timings.append(ImportTiming(module.strip(), depth, int(self_us) / 1000, int(cumulative_us) / 1000))
+    return timings
+
+
+def direct_imports(timings: List[ImportTiming], module: str) -> List[ImportTiming]:
+    end = max(index for index, timing in enumerate(timings) if timing.module == module and timing.depth == 0)
+    start = end
+    while start > 0 and timings[start - 1].depth > 0:
+        start -= 1
+    return [timing for timing in timings[start:end] if timing.depth == 1]
+
+
+def imported_since(timings: List[ImportTiming], module: str) -> float:
+    end = next(index for index, timing in enumerate(timings) if timing.module == module and timing.depth == 0)
+    start = end
+    while start > 0 and timings[start - 1].depth > 0:
+        start -= 1
+    return sum(timing.cumulative_ms for timing in timings[start:] if timing.depth == 0)
+
+
+def measure(module: str) -> Tuple[float, List[ImportTiming]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+        check=True,
+    )
+    timings = parse_importtime(result.stderr)
+    total = next(timing.cumulative_ms for timing in reversed(timings) if timing.module == module and timing.depth == 0)
+    return total, timings
+
+
+def measure_cold_start(module: str, attribute: str = "STARTUP_MODULES") -> float:
+    code = (
+        f"import importlib, {module}\n"
+        f"for name in getattr({module}, {attribute!r}, ()):\n"
+        f"    importlib.import_module(name)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=os.environ.copy(),
+        check=True,
+    )
+    return imported_since(parse_importtime(result.stderr), module)
+
+
+def first_update_statement(module: str) -> str:
+    code = f"import {module}; print(', '.join(getattr({module}, 'FIRST_UPDATE_MODULES', ())))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=os.environ.copy(), check=True
+    )
+    names = result.stdout.strip()
+    return f"{module}, {names}" if names else module
+
+
+def loaded_modules(module: str, prefixes: Tuple[str, ...] = HEAVY_MODULES) -> List[str]:
+    code = (
+        f"import sys, {module}\n"
+        f"print('\\n'.join(sorted(m for m in sys.modules if m.split('.')[0] in {prefixes!r} or m in {prefixes!r})))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, env=os.environ.copy(), check=True
+    )
+    return [line for line in result.stdout.splitlines() if line]
+
+
+def main(module: str, runs: int, budget_ms: float, first_update_budget_ms: float, top: int) -> None:
+    totals: List[float] = []
+    first_update: List[float] = []
+    cold: List[float] = []
+    timings: List[ImportTiming] = []
+    for _ in range(runs):
+        total, timings = measure(module)
+        totals.append(total)
+        first_update.append(measure_cold_start(module, "FIRST_UPDATE_MODULES"))
+        cold.append(measure_cold_start(module))
+    median = statistics.median(totals)
+    first_update_median = statistics.median(first_update)
+
+    print(f"import {module}: mediana {median:.0f} ms, mínimo {min(totals):.0f} ms ({runs} ejecuciones)")
+    print(f"  hasta atender el primer update: mediana {first_update_median:.0f} ms")
+    print(f"  con los servicios de post_init: mediana {statistics.median(cold):.0f} ms (se cargan en segundo plano)")
+    for timing in sorted(direct_imports(timings, module), key=lambda item: item.cumulative_ms, reverse=True)[:top]:
+        print(f"  {timing.cumulative_ms:8.1f} ms  {timing.module}")
+    heavy = loaded_modules(module)
+    if heavy:
+        print(f"  módulos pesados cargados al importar: {', '.join(heavy)}")
+
+    exceeded = False
+    if median > budget_ms:
+        print(f"Presupuesto excedido: {median:.0f} ms > {budget_ms:.0f} ms")
+        exceeded = True
+    forbidden = loaded_modules(first_update_statement(module), FIRST_UPDATE_FORBIDDEN)
+    if forbidden:
+        print(f"Módulos de funciones cargados antes del primer update: {', '.join(forbidden)}")
+        exceeded = True
+    if first_update_median > first_update_budget_ms:
+        print(f"Presupuesto del primer update excedido: {first_update_median:.0f} ms > {first_update_budget_ms:.0f} ms")
+        exceeded = True
+    if exceeded:
+        raise SystemExit(1)
+    print(f"Dentro del presupuesto de {budget_ms:.0f} ms ({first_update_budget_ms:.0f} ms hasta el primer update)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el tiempo de importación del bot con python -X importtime")
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--first-update-budget-ms", type=float, default=DEFAULT_FIRST_UPDATE_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    main(args.module, args.runs, args.budget_ms, args.first_update_budget_ms, args.top)
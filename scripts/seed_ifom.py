@@ -4,14 +4,40 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import hashlib
 import json
+import re
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, AsyncContextManager, Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO
 
-from sqlalchemy import select
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from common.config import settings
-from common.db import IFOMItem, init_db, get_session
+from common.db import IFOM_BANK_VERSION_KEY, IFOMItem, bump_version, init_db, get_session
+
+CONTENT_FIELDS = ("stem", "options", "answer_index", "explanation", "tags")
+
+
+@dataclass
+class SeedSummary:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+
+    def add(self, other: SeedSummary) -> None:
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.deleted += other.deleted
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserted or self.updated or self.deleted)
 
 
 def adapt_case(case: Dict[str, Any], index: int) -> Dict[str, Any]:
@@ -36,46 +62,235 @@ def adapt_case(case: Dict[str, Any], index: int) -> Dict[str, Any]:
     return internal
 
 
-async def persist_items(items: List[Dict[str, Any]]) -> None:
-    await init_db()
-    async with get_session() as session:
-        for payload in items:
-            stmt = select(IFOMItem).where(IFOMItem.external_id == payload["id"])
-            existing = await session.scalar(stmt)
-            if existing:
-                existing.stem = payload["stem"]
-                existing.options = payload["options"]
-                existing.answer_index = payload["answer_index"]
-                existing.explanation = payload["explanation"]
-                existing.tags = payload["tags"]
-            else:
-                session.add(
-                    IFOMItem(
-                        external_id=payload["id"],
-                        stem=payload["stem"],
-                        options=payload["options"],
-                        answer_index=payload["answer_index"],
-                        explanation=payload["explanation"],
-                        tags=payload["tags"],
-                    )
-                )
+def content_hash(payload: Dict[str, Any]) -> str:
+    content = {field: payload[field] for field in CONTENT_FIELDS}
+    encoded = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _upsert_statement(session: AsyncSession, rows: List[Dict[str, Any]]):
+    insert = pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(IFOMItem).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[IFOMItem.external_id],
+        set_={column: stmt.excluded[column] for column in (*CONTENT_FIELDS, "content_hash")},
+    )
+
+
+SCALAR_END = re.compile(r"[,\]}\s]")
+
+
+def _skip_whitespace(buffer: str, pos: int) -> int:
+    while pos < len(buffer) and buffer[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def iter_json_array(fp: TextIO, key: str, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def next_token() -> str:
+        nonlocal pos
+        while True:
+            pos = _skip_whitespace(buffer, pos)
+            if pos < len(buffer):
+                return buffer[pos]
+            if not fill():
+                raise ValueError("JSON truncado")
+
+    def decode() -> Any:
+        nonlocal pos
+        if next_token() not in "{[\"":
+            while not SCALAR_END.search(buffer, pos) and fill():
+                pass
+        while True:
+            try:
+                value, pos = decoder.raw_decode(buffer, pos)
+                return value
+            except json.JSONDecodeError:
+                if eof or not fill():
+                    raise
+
+    if next_token() != "{":
+        raise ValueError("Se esperaba un objeto JSON en la raíz")
+    pos += 1
+    while next_token() != "}":
+        if buffer[pos] == ",":
+            pos += 1
+        name = decode()
+        if next_token() != ":":
+            raise ValueError("JSON inválido: falta ':'")
+        pos += 1
+        if name != key:
+            decode()
+            continue
+        if next_token() != "[":
+            raise ValueError(f"'{key}' debe ser una lista")
+        pos += 1
+        while next_token() != "]":
+            if buffer[pos] == ",":
+                pos += 1
+                continue
+            yield decode()
+        return
+    raise ValueError(f"El JSON no contiene '{key}'")
+
+
+def iter_cases(path: Path) -> Iterator[Dict[str, Any]]:
+    with path.open(encoding="utf-8") as fp:
+        if path.suffix in {".jsonl", ".ndjson"}:
+            for line in fp:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(fp, "cases")
+
+
+async def _upsert_batch(session: AsyncSession, batch: Dict[str, Dict[str, Any]]) -> SeedSummary:
+    summary = SeedSummary()
+    result = await session.execute(
+        select(IFOMItem.external_id, IFOMItem.content_hash).where(IFOMItem.external_id.in_(list(batch)))
+    )
+    existing = dict(result.tuples().all())
+
+    rows: List[Dict[str, Any]] = []
+    for external_id, payload in batch.items():
+        digest = content_hash(payload)
+        if external_id not in existing:
+            summary.inserted += 1
+        elif existing[external_id] != digest:
+            summary.updated += 1
+        else:
+            summary.unchanged += 1
+            continue
+        row = {field: payload[field] for field in CONTENT_FIELDS}
+        rows.append({**row, "external_id": external_id, "content_hash": digest})
+    if rows:
+        await session.execute(_upsert_statement(session, rows))
+    return summary
+
+
+async def _prune(session: AsyncSession, keep: Set[str], batch_size: int) -> int:
+    result = await session.scalars(select(IFOMItem.external_id))
+    stale = [external_id for external_id in result.all() if external_id not in keep]
+    for start in range(0, len(stale), batch_size):
+        chunk = stale[start : start + batch_size]
+        await session.execute(delete(IFOMItem).where(IFOMItem.external_id.in_(chunk)))
+    return len(stale)
+
+
+def _batched(items: Iterable[Dict[str, Any]], batch_size: int) -> Iterator[Dict[str, Dict[str, Any]]]:
+    batch: Dict[str, Dict[str, Any]] = {}
+    for payload in items:
+        batch[payload["id"]] = payload
+        if len(batch) >= batch_size:
+            yield batch
+            batch = {}
+    if batch:
+        yield batch
+
+
+async def persist_items(
+    items: Iterable[Dict[str, Any]],
+    *,
+    batch_size: int = 500,
+    prune: bool = False,
+    session_factory: Callable[[], AsyncContextManager[AsyncSession]] = get_session,
+) -> SeedSummary:
+    summary = SeedSummary()
+    seen: Set[str] = set()
+    async with session_factory() as session:
+        for batch in _batched(items, batch_size):
+            summary.add(await _upsert_batch(session, batch))
+            seen.update(batch)
+        if prune:
+            summary.deleted = await _prune(session, seen, batch_size)
+        if summary.changed:
+            await bump_version(session, IFOM_BANK_VERSION_KEY)
         await session.commit()
+    return summary
 
 
-async def main(path: Path) -> None:
-    data = json.loads(path.read_text(encoding="utf-8"))
-    cases = data.get("cases", [])
-    if not cases:
-        raise ValueError("El JSON no contiene 'cases'")
+async def stream_items(
+    items: Iterable[Dict[str, Any]],
+    *,
+    batch_size: int = 500,
+    prune: bool = False,
+    session_factory: Callable[[], AsyncContextManager[AsyncSession]] = get_session,
+    progress: Optional[Callable[[int, SeedSummary], None]] = None,
+) -> SeedSummary:
+    summary = SeedSummary()
+    seen: Set[str] = set()
+    processed = 0
+    for batch in _batched(items, batch_size):
+        async with session_factory() as session:
+            batch_summary = await _upsert_batch(session, batch)
+            if batch_summary.changed:
+                await bump_version(session, IFOM_BANK_VERSION_KEY)
+            await session.commit()
+        summary.add(batch_summary)
+        seen.update(batch)
+        processed += len(batch)
+        if progress:
+            progress(processed, summary)
+    if prune:
+        async with session_factory() as session:
+            summary.deleted = await _prune(session, seen, batch_size)
+            if summary.deleted:
+                await bump_version(session, IFOM_BANK_VERSION_KEY)
+            await session.commit()
+    return summary
 
-    items = [adapt_case(case, idx) for idx, case in enumerate(cases, start=1)]
-    await persist_items(items)
-    print(f"Se cargaron {len(items)} ítems IFOM")
+
+def _print_progress(processed: int, summary: SeedSummary) -> None:
+    print(f"  … {processed} casos procesados ({summary.inserted} nuevos, {summary.updated} actualizados)", flush=True)
+
+
+async def main(path: Path, batch_size: int, prune: bool, stream: bool) -> None:
+    await init_db()
+    if stream or path.suffix in {".jsonl", ".ndjson"}:
+        items = (adapt_case(case, idx) for idx, case in enumerate(iter_cases(path), start=1))
+        summary = await stream_items(items, batch_size=batch_size, prune=prune, progress=_print_progress)
+    else:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        cases = data.get("cases", [])
+        if not cases:
+            raise ValueError("El JSON no contiene 'cases'")
+        items = [adapt_case(case, idx) for idx, case in enumerate(cases, start=1)]
+        summary = await persist_items(items, batch_size=batch_size, prune=prune)
+    print(
+        f"Banco IFOM: {summary.inserted} nuevos, {summary.updated} actualizados, "
+        f"{summary.unchanged} sin cambios, {summary.deleted} eliminados"
+    )
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Seed IFOM bank")
     parser.add_argument("--path", type=Path, default=Path(settings.ifom_json_path), help="Ruta al JSON original")
+    parser.add_argument("--batch-size", type=int, default=500, help="Filas por sentencia INSERT … ON CONFLICT")
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Elimina los ítems que ya no están en el JSON (borra también sus intentos)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Lee los casos uno a uno y confirma cada lote (siempre activo para .jsonl)",
+    )
     args = parser.parse_args()
 
-    asyncio.run(main(args.path))
+    asyncio.run(main(args.path, args.batch_size, args.prune, args.stream))
@@ -2,19 +2,30 @@ from __future__ import annotations
 
 import argparse
 import asyncio
+import hashlib
 import json
 import re
-from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, AsyncContextManager, Callable, Dict, Iterable, Iterator, List, Optional, Pattern, Union
 
 from PyPDF2 import PdfReader
+from redis.exceptions import RedisError
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from common.config import settings
-from common.db import Patient, init_db, get_session
+from common.db import Patient, Setting, init_db, get_session
+from common.invalidation import publish_patient_version
+from common.retrieval import build_bm25_index
+from common.redis_client import close_redis, get_redis
 
 
+PATIENT_NOTES_MANIFEST_KEY = "patient_notes_manifest"
+NOTE_SUFFIXES = {".pdf", ".txt"}
+
 SECTION_ALIASES = {
     "demografia": ["datos generales", "demografía", "identificación"],
     "motivo_consulta": ["motivo de consulta", "consulta"],
@@ -30,6 +41,18 @@ SECTION_ALIASES = {
     "narrativa": ["narrativa", "resumen narrativo"],
 }
 
+RETRIEVAL_SECTIONS = {
+    "demografia": "Datos generales",
+    "motivo_consulta": "Motivo de consulta",
+    "antecedentes": "Antecedentes",
+    "medicamentos": "Medicamentos",
+    "alergias": "Alergias",
+    "habitos": "Hábitos",
+    "narrativa": "Narrativa",
+}
+PASSAGE_WORDS = 60
+PASSAGE_OVERLAP = 15
+
 
 @dataclass
 class Persona:
@@ -38,48 +61,75 @@ class Persona:
     summary: str
     persona: Dict[str, str]
     notes_path: str
+    retrieval: Dict[str, Any] = field(default_factory=dict)
+
+
+def _compile_section_pattern(aliases: Dict[str, List[str]]) -> Pattern[str]:
+    groups = [f"(?P<{key}>{'|'.join(re.escape(alias) for alias in names)})" for key, names in aliases.items()]
+    return re.compile("|".join(groups))
+
+
+SECTION_PATTERN = _compile_section_pattern(SECTION_ALIASES)
 
 
 def clean_line(line: str) -> str:
-    return re.sub(r"\s+", " ", line.strip())
+    return " ".join(line.split())
 
 
-def extract_text(path: Path) -> str:
+def iter_pages(path: Path) -> Iterator[str]:
     if path.suffix.lower() == ".pdf":
-        reader = PdfReader(str(path))
-        pages = [page.extract_text() or "" for page in reader.pages]
-        return "\n".join(pages)
-    return path.read_text(encoding="utf-8")
+        for page in PdfReader(str(path)).pages:
+            yield page.extract_text() or ""
+        return
+    with path.open(encoding="utf-8") as fp:
+        yield from fp
+
+
+def extract_text(path: Path) -> str:
+    return "\n".join(iter_pages(path))
 
 
 def detect_section(line: str) -> Optional[str]:
-    lower = line.lower().strip(": ")
-    for key, aliases in SECTION_ALIASES.items():
-        for alias in aliases:
-            if lower.startswith(alias):
-                return key
-    return None
+    match = SECTION_PATTERN.match(line.lower().strip(": "))
+    return match.lastgroup if match else None
 
 
-def parse_sections(text: str) -> Dict[str, List[str]]:
+def parse_sections(text: Union[str, Iterable[str]]) -> Dict[str, List[str]]:
+    pages = [text] if isinstance(text, str) else text
     sections: Dict[str, List[str]] = {}
     current = "narrativa"
     sections[current] = []
 
-    for raw_line in text.splitlines():
-        line = clean_line(raw_line)
-        if not line:
-            continue
-        section = detect_section(line)
-        if section:
-            current = section
-            sections.setdefault(current, [])
-            continue
-        sections.setdefault(current, []).append(line)
+    for page in pages:
+        for raw_line in page.splitlines():
+            line = clean_line(raw_line)
+            if not line:
+                continue
+            section = detect_section(line)
+            if section:
+                current = section
+                sections.setdefault(current, [])
+                _, colon, inline = line.partition(":")
+                if colon and inline.strip():
+                    sections[current].append(inline.strip())
+                continue
+            sections.setdefault(current, []).append(line)
 
     return sections
 
 
+def chunk_sections(sections: Dict[str, List[str]]) -> List[str]:
+    passages: List[str] = []
+    step = PASSAGE_WORDS - PASSAGE_OVERLAP
+    for key, label in RETRIEVAL_SECTIONS.items():
+        words = " ".join(sections.get(key, [])).split()
+        for start in range(0, max(len(words) - PASSAGE_OVERLAP, 1), step):
+            window = words[start : start + PASSAGE_WORDS]
+            if window:
+                passages.append(f"{label}: {' '.join(window)}")
+    return passages
+
+
 def build_persona(slug: str, path: Path, sections: Dict[str, List[str]]) -> Persona:
     display_name = next(iter(sections.get("demografia", [slug.replace("-", " ").title()])), "Paciente")
     resumen = " ".join(sections.get("motivo_consulta", [])) or "Caso clínico para práctica de anamnesis."
@@ -105,49 +155,163 @@ def build_persona(slug: str, path: Path, sections: Dict[str, List[str]]) -> Pers
         summary=resumen,
         persona=persona,
         notes_path=str(path),
+        retrieval=build_bm25_index(chunk_sections(sections)),
     )
 
 
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fp:
+        for block in iter(lambda: fp.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def slug_for(path: Path) -> str:
+    return path.stem.replace(" ", "-").lower()
+
+
+def load_persona(path: Path, slug: Optional[str] = None) -> Persona:
+    sections = parse_sections(iter_pages(path))
+    if not any(sections.values()):
+        raise ValueError(f"No se pudo extraer texto de {path}")
+    return build_persona(slug or slug_for(path), path, sections)
+
+
+def write_persona_json(persona: Persona) -> Path:
+    output_json = Path(settings.data_dir) / f"{persona.slug}.json"
+    output_json.parent.mkdir(parents=True, exist_ok=True)
+    output_json.write_text(json.dumps(persona.persona, indent=2, ensure_ascii=False), encoding="utf-8")
+    return output_json
+
+
+async def persist_personas(
+    personas: List[Persona],
+    manifest: Optional[Dict[str, str]] = None,
+    session_factory: Callable[[], AsyncContextManager[AsyncSession]] = get_session,
+) -> None:
+    async with session_factory() as session:
+        result = await session.scalars(select(Patient).where(Patient.slug.in_([p.slug for p in personas])))
+        existing = {patient.slug: patient for patient in result.all()}
+        for persona in personas:
+            payload = {
+                "slug": persona.slug,
+                "display_name": persona.display_name,
+                "summary": persona.summary,
+                "persona": persona.persona,
+                "retrieval": persona.retrieval,
+                "notes_path": persona.notes_path,
+            }
+            patient = existing.get(persona.slug)
+            if patient:
+                for key, value in payload.items():
+                    setattr(patient, key, value)
+            else:
+                session.add(Patient(**payload))
+        if manifest is not None:
+            stored = await session.get(Setting, PATIENT_NOTES_MANIFEST_KEY)
+            if stored:
+                stored.value = manifest
+                stored.updated_at = datetime.utcnow()
+            else:
+                session.add(Setting(key=PATIENT_NOTES_MANIFEST_KEY, value=manifest))
+        await session.commit()
+
+
+async def publish_versions(slugs: List[str]) -> None:
+    try:
+        for slug in slugs:
+            version = await publish_patient_version(get_redis(), slug)
+            print(f"Versión {version} de '{slug}' publicada para los bots en ejecución")
+    except RedisError as exc:
+        print(f"No se pudo notificar a los bots ({exc}); tomarán el cambio al vencer su caché")
+    finally:
+        await close_redis()
+
+
 async def persist_persona(persona: Persona) -> None:
     await init_db()
-    async with get_session() as session:
-        stmt = select(Patient).where(Patient.slug == persona.slug)
-        existing = await session.scalar(stmt)
-        payload = {
-            "slug": persona.slug,
-            "display_name": persona.display_name,
-            "summary": persona.summary,
-            "persona": persona.persona,
-            "notes_path": persona.notes_path,
-        }
-        if existing:
-            for key, value in payload.items():
-                setattr(existing, key, value)
-        else:
-            session.add(Patient(**payload))
-        await session.commit()
+    await persist_personas([persona])
     print(f"Paciente '{persona.slug}' actualizado")
+    await publish_versions([persona.slug])
+
+
+async def seed_directory(
+    directory: Path,
+    *,
+    force: bool = False,
+    max_workers: Optional[int] = None,
+    session_factory: Callable[[], AsyncContextManager[AsyncSession]] = get_session,
+) -> List[Persona]:
+    files = sorted(path for path in directory.rglob("*") if path.suffix.lower() in NOTE_SUFFIXES)
+    async with session_factory() as session:
+        stored = await session.get(Setting, PATIENT_NOTES_MANIFEST_KEY)
+        manifest: Dict[str, str] = dict(stored.value) if stored else {}
+
+    digests = {str(path): file_digest(path) for path in files}
+    pending = [path for path in files if force or manifest.get(str(path)) != digests[str(path)]]
+    print(f"{len(files)} archivos en {directory}; {len(pending)} nuevos o modificados")
+    if not pending:
+        return []
+
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        results = await asyncio.gather(
+            *(loop.run_in_executor(pool, load_persona, path) for path in pending),
+            return_exceptions=True,
+        )
+
+    personas: List[Persona] = []
+    for path, result in zip(pending, results):
+        if isinstance(result, Exception):
+            print(f"⚠️  {path}: {result}")
+            continue
+        personas.append(result)
+        manifest[str(path)] = digests[str(path)]
+
+    seen_slugs: Dict[str, str] = {}
+    for persona in personas:
+        if persona.slug in seen_slugs:
+            raise ValueError(f"Slug duplicado '{persona.slug}': {seen_slugs[persona.slug]} y {persona.notes_path}")
+        seen_slugs[persona.slug] = persona.notes_path
+
+    if personas:
+        await persist_personas(personas, manifest, session_factory)
+    return personas
 
 
 async def main(path: Path, slug: Optional[str] = None) -> None:
-    text = extract_text(path)
-    if not text:
-        raise ValueError("No se pudo extraer texto del archivo")
-    sections = parse_sections(text)
-    patient_slug = slug or path.stem.replace(" ", "-").lower()
-    persona = build_persona(patient_slug, path, sections)
+    persona = load_persona(path, slug)
     await persist_persona(persona)
+    print(f"Persona guardada en {write_persona_json(persona)}")
 
-    output_json = Path(settings.data_dir) / f"{persona.slug}.json"
-    output_json.parent.mkdir(parents=True, exist_ok=True)
-    output_json.write_text(json.dumps(persona.persona, indent=2, ensure_ascii=False), encoding="utf-8")
-    print(f"Persona guardada en {output_json}")
+
+async def main_batch(directory: Path, force: bool, workers: Optional[int]) -> None:
+    await init_db()
+    personas = await seed_directory(directory, force=force, max_workers=workers)
+    for persona in personas:
+        write_persona_json(persona)
+    print(f"{len(personas)} pacientes actualizados en una sola transacción")
+    if personas:
+        await publish_versions([persona.slug for persona in personas])
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Seed de paciente desde PDF/TXT")
-    parser.add_argument("path", type=Path, help="Ruta al archivo PDF/TXT")
+    parser.add_argument("path", type=Path, nargs="?", help="Ruta al archivo PDF/TXT")
     parser.add_argument("--slug", type=str, help="Slug opcional del paciente")
+    parser.add_argument(
+        "--all",
+        action="store_true",
+        help="Procesa todo PATIENT_NOTES_DIR (o la carpeta indicada en path) en paralelo",
+    )
+    parser.add_argument("--force", action="store_true", help="Reprocesa aunque el archivo no haya cambiado")
+    parser.add_argument("--workers", type=int, help="Procesos de extracción (por defecto, uno por núcleo)")
     args = parser.parse_args()
 
-    asyncio.run(main(args.path, args.slug))
+    if args.all:
+        asyncio.run(main_batch(args.path or Path(settings.patient_notes_dir), args.force, args.workers))
+    elif args.path:
+        asyncio.run(main(args.path, args.slug))
+    else:
+        parser.error("Indica un archivo o usa --all")
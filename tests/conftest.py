@@ -1,11 +1,41 @@
 from __future__ import annotations
 
+import asyncio
 import os
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
 
 os.environ.setdefault("TELEGRAM_TOKEN", "test-token")
 os.environ.setdefault("TELEGRAM_ADMIN_IDS", "1")
-os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///./data/test.db")
-os.environ.setdefault("SYNC_DATABASE_URL", "sqlite:///./data/test.db")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+os.environ.setdefault("SYNC_DATABASE_URL", "sqlite:///:memory:")
 os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
 os.environ.setdefault("API_BASE_URL", "http://localhost:8000")
 os.environ.setdefault("OLLAMA_BASE_URL", "http://localhost:11434")
+
+
+@pytest.fixture
+def sqlite_sessionmaker(tmp_path):
+    from common.db import Base
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool)
+
+    async def create_schema():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create_schema())
+    yield async_sessionmaker(engine, expire_on_commit=False)
+
+
+@pytest.fixture
+def sqlite_get_session(sqlite_sessionmaker):
+    @asynccontextmanager
+    async def get_session():
+        async with sqlite_sessionmaker() as session:
+            yield session
+
+    return get_session
@@ -1,12 +1,19 @@
 from __future__ import annotations
 
 import asyncio
+from datetime import datetime
+from functools import partial
 from types import SimpleNamespace
 
+import httpx
 import pytest
+from sqlalchemy import select
+
+from bot import evaluation_queue
 
 from bot.features import ai_patient
 from bot.features.ai_patient import (
+    MAX_HISTORY_MESSAGES,
     SESSION_KEY,
     PATIENT_PANEL_EXAM,
     PATIENT_PANEL_IMAGES,
@@ -17,7 +24,9 @@ from bot.features.ai_patient import (
     handle_patient_message,
     handle_patient_termination,
 )
+from bot.history import ConversationSummary, HistoryBuffer
 from bot.i18n_es import STRINGS
+from bot.log_sink import SimLogSink
 
 
 def test_build_patient_keyboard_layout():
@@ -59,12 +68,16 @@ def test_handle_patient_message_includes_disclaimer(monkeypatch, user_text):
     async def fake_history(*args, **kwargs):
         return []
 
+    async def fake_summary(*args, **kwargs):
+        return ConversationSummary()
+
     async def fake_call_llm(payload):
         return "Respuesta breve del paciente"
 
     monkeypatch.setattr(ai_patient, "_fetch_patient", fake_fetch)
     monkeypatch.setattr(ai_patient, "_append_log", fake_append)
     monkeypatch.setattr(ai_patient, "_load_history", fake_history)
+    monkeypatch.setattr(ai_patient, "_load_summary", fake_summary)
     monkeypatch.setattr(ai_patient, "_call_llm", fake_call_llm)
 
     update = SimpleNamespace(message=DummyMessage(user_text))
@@ -76,41 +89,21 @@ def test_handle_patient_message_includes_disclaimer(monkeypatch, user_text):
     assert replies[0].startswith(STRINGS.AI_DISCLAIMER)
 
 
-def test_handle_patient_termination_formats_rubric(monkeypatch):
+def test_handle_patient_termination_queues_and_pushes_rubric(monkeypatch, sqlite_sessionmaker, sqlite_get_session):
+    from common.db import EvaluationJob, Patient, SimSession, User
+
     replies: list[str] = []
+    pushed: list[tuple] = []
     log_calls: list[tuple] = []
+    llm_calls: list[dict] = []
 
     class DummyMessage:
         async def reply_text(self, text: str, reply_markup=None) -> None:  # pragma: no cover - signature
             replies.append(text)
 
-    class DummySimSession:
-        def __init__(self) -> None:
-            self.status = "active"
-            self.rubric = None
-            self.ended_at = None
-
-    class DummyDBSession:
-        def __init__(self) -> None:
-            self.instance = DummySimSession()
-            self.committed = False
-
-        async def __aenter__(self):  # pragma: no cover - context manager protocol
-            return self
-
-        async def __aexit__(self, exc_type, exc, tb):  # pragma: no cover - context manager protocol
-            return False
-
-        async def get(self, model, pk):
-            return self.instance
-
-        async def commit(self):
-            self.committed = True
-
-    dummy_session = DummyDBSession()
-
-    def fake_get_session():
-        return dummy_session
+    class DummyBot:
+        async def send_message(self, chat_id, text, reply_markup=None):
+            pushed.append((chat_id, text))
 
     async def fake_fetch(context):
         return {
@@ -124,7 +117,13 @@ def test_handle_patient_termination_formats_rubric(monkeypatch):
     async def fake_history(*args, **kwargs):
         return [SimpleNamespace(role="student", message="Hola")]
 
+    async def fake_summary(*args, **kwargs):
+        return ConversationSummary()
+
     async def fake_call_llm(payload):
+        llm_calls.append(payload)
+        if len(llm_calls) == 1:
+            raise httpx.ReadTimeout("timeout")
         return (
             '{"anamnesis":{"score":2,"feedback":"Buena exploración."},'
             '"hipotesis":{"score":1,"feedback":"Falta ampliar diagnósticos."},'
@@ -137,22 +136,377 @@ def test_handle_patient_termination_formats_rubric(monkeypatch):
     async def fake_append(*args, **kwargs):
         log_calls.append(args)
 
-    monkeypatch.setattr(ai_patient, "get_session", fake_get_session)
+    monkeypatch.setattr(ai_patient, "get_session", sqlite_get_session)
     monkeypatch.setattr(ai_patient, "_fetch_patient", fake_fetch)
     monkeypatch.setattr(ai_patient, "_load_history", fake_history)
+    monkeypatch.setattr(ai_patient, "_load_summary", fake_summary)
     monkeypatch.setattr(ai_patient, "_call_llm", fake_call_llm)
     monkeypatch.setattr(ai_patient, "_append_log", fake_append)
+    monkeypatch.setattr(evaluation_queue, "RETRY_BASE_SECONDS", 0)
 
-    update = SimpleNamespace(message=DummyMessage(), callback_query=None)
+    update = SimpleNamespace(
+        message=DummyMessage(), callback_query=None, effective_chat=SimpleNamespace(id=555), effective_user=None
+    )
     context = SimpleNamespace(user_data={SESSION_KEY: 7}, application_data={})
 
-    asyncio.run(handle_patient_termination(update, context))
+    async def scenario():
+        async with sqlite_get_session() as session:
+            session.add(User(id=1, role="student"))
+            session.add(Patient(id=1, slug="dummy", display_name="Paciente", persona={}))
+            session.add(SimSession(id=7, user_id=1, patient_id=1))
+            await session.commit()
+
+        await handle_patient_termination(update, context)
+        async with sqlite_get_session() as session:
+            queued_status = (await session.get(SimSession, 7)).status
+
+        worker = evaluation_queue.EvaluationWorker(
+            partial(ai_patient.process_evaluation, DummyBot()),
+            workers=1,
+            max_attempts=3,
+            session_factory=sqlite_get_session,
+        )
+        assert await worker.run_once() is True
+        assert not pushed
+        assert await worker.run_once() is True
+        assert await worker.run_once() is False
+        async with sqlite_get_session() as session:
+            return queued_status, await session.get(SimSession, 7), (await session.scalars(select(EvaluationJob))).one()
+
+    queued_status, sim_session, job = asyncio.run(scenario())
 
-    assert replies and replies[0].startswith(STRINGS.PATIENT_EVAL_HEADER)
-    assert dummy_session.instance.status == "completed"
-    assert dummy_session.committed is True
+    assert replies == [STRINGS.PATIENT_EVAL_QUEUED]
+    assert queued_status == "evaluating"
     assert context.user_data.get(SESSION_KEY) is None
-    assert dummy_session.instance.rubric is not None
-    parsed = dummy_session.instance.rubric["parsed"]
-    assert parsed["dimensions"]["anamnesis"]["score"] == 2
+    assert len(llm_calls) == 2 and llm_calls[0]["max_tokens"] == 400
+    assert job.status == "done" and job.attempts == 2
+    assert pushed and pushed[0][0] == 555
+    assert pushed[0][1].startswith(STRINGS.PATIENT_EVAL_HEADER)
+    assert sim_session.status == "completed"
+    assert sim_session.rubric["parsed"]["dimensions"]["anamnesis"]["score"] == 2
     assert log_calls, "Se debe registrar la evaluación en los logs"
+
+
+def test_handle_patient_termination_answers_before_building_the_evaluation(monkeypatch, sqlite_get_session):
+    from common.db import EvaluationJob, Patient, SimSession, User
+
+    events: list[str] = []
+
+    class DummyQuery:
+        async def answer(self, *args, **kwargs) -> None:
+            events.append("answer")
+
+        async def edit_message_text(self, text: str, reply_markup=None) -> None:
+            events.append(text)
+
+    async def fake_fetch(context):
+        return {"id": 1, "slug": "dummy", "persona": {"demografia": "Paciente ficticio"}}
+
+    async def fake_conversation(session_id, wait=False):
+        events.append("conversation")
+        return ConversationSummary(text="Refiere dolor"), [SimpleNamespace(role="student", message="Hola")]
+
+    async def fake_append(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(ai_patient, "get_session", sqlite_get_session)
+    monkeypatch.setattr(ai_patient, "_fetch_patient", fake_fetch)
+    monkeypatch.setattr(ai_patient, "_build_conversation", fake_conversation)
+    monkeypatch.setattr(ai_patient, "_append_log", fake_append)
+
+    update = SimpleNamespace(
+        message=None, callback_query=DummyQuery(), effective_chat=SimpleNamespace(id=555), effective_user=None
+    )
+    context = SimpleNamespace(user_data={SESSION_KEY: 7}, application_data={})
+
+    async def scenario():
+        async with sqlite_get_session() as session:
+            session.add(User(id=1, role="student"))
+            session.add(Patient(id=1, slug="dummy", display_name="Paciente", persona={}))
+            session.add(SimSession(id=7, user_id=1, patient_id=1))
+            await session.commit()
+
+        await handle_patient_termination(update, context)
+        async with sqlite_get_session() as session:
+            job = (await session.scalars(select(EvaluationJob))).one()
+        handler_events = list(events)
+        return handler_events, job, await ai_patient._evaluation_payload(job.session_id, job.payload["persona"])
+
+    handler_events, job, payload = asyncio.run(scenario())
+
+    assert handler_events == ["answer", STRINGS.PATIENT_EVAL_QUEUED]
+    assert job.session_id == 7 and "messages" not in job.payload
+    assert payload["messages"] == [{"role": "user", "content": "Hola"}]
+    assert "Refiere dolor" in payload["system"] and payload["persona"] == {"demografia": "Paciente ficticio"}
+
+
+def test_handle_patient_message_streams_with_edits(monkeypatch):
+    edits: list[str] = []
+    placeholders: list[str] = []
+    log_calls: list[tuple] = []
+
+    class DummyPlaceholder:
+        async def edit_text(self, text: str) -> None:
+            edits.append(text)
+
+    class DummyMessage:
+        text = "¿Qué le duele?"
+
+        async def reply_text(self, text: str, reply_markup=None):
+            placeholders.append(text)
+            return DummyPlaceholder()
+
+    async def fake_fetch(context):
+        return {"id": 1, "slug": "dummy", "display_name": "Paciente", "summary": "", "persona": {}}
+
+    async def fake_append(*args, **kwargs):
+        log_calls.append(args)
+
+    async def fake_history(*args, **kwargs):
+        return []
+
+    async def fake_summary(*args, **kwargs):
+        return ConversationSummary()
+
+    async def fake_stream(payload):
+        for token in ["Me ", "duele ", "el ", "estómago."]:
+            yield token
+
+    monkeypatch.setattr(ai_patient.settings, "llm_streaming", True)
+    monkeypatch.setattr(ai_patient.settings, "llm_stream_edit_interval_seconds", 0.0)
+    monkeypatch.setattr(ai_patient, "_fetch_patient", fake_fetch)
+    monkeypatch.setattr(ai_patient, "_append_log", fake_append)
+    monkeypatch.setattr(ai_patient, "_load_history", fake_history)
+    monkeypatch.setattr(ai_patient, "_load_summary", fake_summary)
+    monkeypatch.setattr(ai_patient, "_stream_llm", fake_stream)
+
+    update = SimpleNamespace(message=DummyMessage())
+    context = SimpleNamespace(user_data={SESSION_KEY: 5}, application_data={})
+
+    asyncio.run(handle_patient_message(update, context))
+
+    assert placeholders == [f"{STRINGS.AI_DISCLAIMER}\n\n{STRINGS.PATIENT_TYPING}"]
+    assert len(edits) >= 2
+    assert edits[-1] == f"{STRINGS.AI_DISCLAIMER}\n\nMe duele el estómago."
+    assert log_calls[-1] == (5, "patient", "Me duele el estómago.")
+
+
+@pytest.mark.parametrize("final_fails", [False, True])
+def test_streamed_reply_survives_failed_edits(monkeypatch, final_fails):
+    from telegram.error import TimedOut
+
+    edits: list[str] = []
+    sent: list[str] = []
+    log_calls: list[tuple] = []
+    header = f"{STRINGS.AI_DISCLAIMER}\n\n"
+
+    class DummyPlaceholder:
+        async def edit_text(self, text: str) -> None:
+            if final_fails or text.endswith(" …"):
+                raise TimedOut()
+            edits.append(text)
+
+    class DummyMessage:
+        text = "¿Qué le duele?"
+
+        async def reply_text(self, text: str, reply_markup=None):
+            sent.append(text)
+            return DummyPlaceholder()
+
+    async def fake_fetch(context):
+        return {"id": 1, "slug": "dummy", "display_name": "Paciente", "summary": "", "persona": {}}
+
+    async def fake_append(*args, **kwargs):
+        log_calls.append(args)
+
+    async def fake_history(*args, **kwargs):
+        return []
+
+    async def fake_summary(*args, **kwargs):
+        return ConversationSummary()
+
+    async def fake_stream(payload):
+        for token in ["Me ", "duele ", "el ", "estómago."]:
+            yield token
+
+    monkeypatch.setattr(ai_patient.settings, "llm_streaming", True)
+    monkeypatch.setattr(ai_patient.settings, "llm_stream_edit_interval_seconds", 0.0)
+    monkeypatch.setattr(ai_patient, "_fetch_patient", fake_fetch)
+    monkeypatch.setattr(ai_patient, "_append_log", fake_append)
+    monkeypatch.setattr(ai_patient, "_load_history", fake_history)
+    monkeypatch.setattr(ai_patient, "_load_summary", fake_summary)
+    monkeypatch.setattr(ai_patient, "_stream_llm", fake_stream)
+
+    update = SimpleNamespace(message=DummyMessage())
+    context = SimpleNamespace(user_data={SESSION_KEY: 5}, application_data={})
+
+    asyncio.run(handle_patient_message(update, context))
+
+    reply = f"{header}Me duele el estómago."
+    assert log_calls[-1] == (5, "patient", "Me duele el estómago.")
+    if final_fails:
+        assert edits == [] and sent == [header + STRINGS.PATIENT_TYPING, reply]
+    else:
+        assert edits == [reply] and sent == [header + STRINGS.PATIENT_TYPING]
+
+
+def test_load_history_returns_tail_and_then_serves_from_buffer(
+    monkeypatch, sqlite_sessionmaker, sqlite_get_session
+):
+    monkeypatch.setattr(ai_patient, "get_session", sqlite_get_session)
+    monkeypatch.setattr(ai_patient, "_history_buffer", HistoryBuffer(MAX_HISTORY_MESSAGES, max_sessions=10))
+
+    async def scenario():
+        sink = SimLogSink(sqlite_sessionmaker, batch_size=100, flush_interval=60)
+        monkeypatch.setattr(ai_patient, "get_log_sink", lambda: sink)
+        for index in range(MAX_HISTORY_MESSAGES + 3):
+            await ai_patient._append_log(9, "student", f"mensaje {index}")
+        ai_patient._history_buffer.discard(9)
+        from_db = await ai_patient._load_history(9)
+
+        def fail_get_session():
+            raise AssertionError("La historia debe servirse desde el buffer")
+
+        monkeypatch.setattr(ai_patient, "get_session", fail_get_session)
+        from_buffer = await ai_patient._load_history(9)
+        await sink.close()
+        return from_db, from_buffer
+
+    from_db, from_buffer = asyncio.run(scenario())
+
+    assert [entry.message for entry in from_db] == [f"mensaje {i}" for i in range(3, MAX_HISTORY_MESSAGES + 3)]
+    assert from_buffer == from_db
+
+
+def test_load_history_keeps_insert_order_for_equal_timestamps(monkeypatch, sqlite_sessionmaker, sqlite_get_session):
+    monkeypatch.setattr(ai_patient, "get_session", sqlite_get_session)
+    monkeypatch.setattr(ai_patient, "_history_buffer", HistoryBuffer(MAX_HISTORY_MESSAGES, max_sessions=10))
+    moment = datetime(2025, 10, 1, 12, 0, 0)
+
+    async def scenario():
+        sink = SimLogSink(sqlite_sessionmaker, batch_size=100, flush_interval=60)
+        monkeypatch.setattr(ai_patient, "get_log_sink", lambda: sink)
+        for index in range(MAX_HISTORY_MESSAGES + 2):
+            sink.append(4, "student", f"mensaje {index}")["created_at"] = moment
+        await sink.flush()
+        history = await ai_patient._load_history(4)
+        await sink.close()
+        return history
+
+    history = asyncio.run(scenario())
+
+    assert [entry.message for entry in history] == [f"mensaje {i}" for i in range(2, MAX_HISTORY_MESSAGES + 2)]
+
+
+def test_long_session_keeps_prompt_within_token_budget(monkeypatch, sqlite_sessionmaker, sqlite_get_session):
+    from common.db import Patient, SimSession, User
+    from common.text import estimate_tokens
+
+    payloads: list[dict] = []
+
+    class DummyMessage:
+        def __init__(self, text: str) -> None:
+            self.text = text
+
+        async def reply_text(self, text: str, reply_markup=None) -> None:
+            return None
+
+    async def fake_fetch(context):
+        return {"id": 1, "slug": "dummy", "display_name": "Paciente", "summary": "", "persona": {}}
+
+    async def fake_call_llm(payload):
+        if payload["system"].startswith("Resume"):
+            return f"Resumen hasta el turno {len(payloads)}"
+        payloads.append(payload)
+        return "Me duele desde hace tres días y empeora por la noche. " * 4
+
+    monkeypatch.setattr(ai_patient, "get_session", sqlite_get_session)
+    monkeypatch.setattr(ai_patient, "_history_buffer", HistoryBuffer(MAX_HISTORY_MESSAGES, max_sessions=10))
+    monkeypatch.setattr(ai_patient, "_fetch_patient", fake_fetch)
+    monkeypatch.setattr(ai_patient, "_call_llm", fake_call_llm)
+    monkeypatch.setattr(ai_patient.settings, "llm_streaming", False)
+    monkeypatch.setattr(ai_patient.settings, "history_token_budget", 300)
+
+    async def scenario():
+        async with sqlite_get_session() as session:
+            session.add(User(id=1, role="student"))
+            session.add(Patient(id=1, slug="dummy", display_name="Paciente", persona={}))
+            session.add(SimSession(id=3, user_id=1, patient_id=1))
+            await session.commit()
+        sink = SimLogSink(sqlite_sessionmaker, batch_size=100, flush_interval=60)
+        monkeypatch.setattr(ai_patient, "get_log_sink", lambda: sink)
+        context = SimpleNamespace(user_data={SESSION_KEY: 3})
+        for turn in range(30):
+            question = f"Pregunta {turn}: ¿puede describir con detalle cómo empezó el dolor y qué lo alivia?"
+            await handle_patient_message(SimpleNamespace(message=DummyMessage(question)), context)
+            await asyncio.gather(*ai_patient._fold_tasks.values())
+        await sink.close()
+        async with sqlite_get_session() as session:
+            return (await session.get(SimSession, 3)).summary
+
+    stored = asyncio.run(scenario())
+
+    sizes = [sum(estimate_tokens(message["content"]) for message in payload["messages"]) for payload in payloads]
+    assert len(payloads) == 30
+    assert max(sizes) <= 300
+    assert payloads[-1]["messages"][-1]["content"].startswith("Pregunta 29")
+    assert "Resumen hasta el turno" in payloads[-1]["system"]
+    assert stored["turns"] > 0 and stored["text"].startswith("Resumen")
+
+
+def test_short_turns_are_folded_before_leaving_the_window(monkeypatch, sqlite_sessionmaker, sqlite_get_session):
+    from common.db import Patient, SimSession, User
+
+    folds: list[str] = []
+    prompts: list[dict] = []
+
+    class DummyMessage:
+        def __init__(self, text: str) -> None:
+            self.text = text
+
+        async def reply_text(self, text: str, reply_markup=None) -> None:
+            return None
+
+    async def fake_fetch(context):
+        return {"id": 1, "slug": "dummy", "display_name": "Paciente", "summary": "", "persona": {}}
+
+    async def fake_call_llm(payload):
+        if payload["system"].startswith("Resume"):
+            folds.append(payload["messages"][0]["content"])
+            return f"Resumen {len(folds)}"
+        prompts.append(payload)
+        return "Sí."
+
+    monkeypatch.setattr(ai_patient, "get_session", sqlite_get_session)
+    monkeypatch.setattr(ai_patient, "_history_buffer", HistoryBuffer(MAX_HISTORY_MESSAGES, max_sessions=10))
+    monkeypatch.setattr(ai_patient, "_fetch_patient", fake_fetch)
+    monkeypatch.setattr(ai_patient, "_call_llm", fake_call_llm)
+    monkeypatch.setattr(ai_patient.settings, "llm_streaming", False)
+
+    async def scenario():
+        async with sqlite_get_session() as session:
+            session.add(User(id=1, role="student"))
+            session.add(Patient(id=1, slug="dummy", display_name="Paciente", persona={}))
+            session.add(SimSession(id=5, user_id=1, patient_id=1))
+            await session.commit()
+        sink = SimLogSink(sqlite_sessionmaker, batch_size=100, flush_interval=60)
+        monkeypatch.setattr(ai_patient, "get_log_sink", lambda: sink)
+        context = SimpleNamespace(user_data={SESSION_KEY: 5})
+        for turn in range(40):
+            await handle_patient_message(SimpleNamespace(message=DummyMessage(f"Dato {turn}")), context)
+            await asyncio.gather(*ai_patient._fold_tasks.values())
+        await sink.close()
+
+    asyncio.run(scenario())
+
+    folded_text = "\n".join(folds)
+    assert all(f"Dato {turn}" in folded_text for turn in range(25))
+    assert len(folds) <= 5
+    assert all(len(prompt["messages"]) <= ai_patient.MAX_RECENT_MESSAGES + 1 for prompt in prompts)
+
+
+def test_clip_to_tokens_keeps_the_oldest_facts():
+    clipped = ai_patient._clip_to_tokens("inicio " + "relleno " * 100, 10)
+
+    assert clipped.startswith("inicio")
+    assert clipped.endswith("…")
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from api.app import create_app
+from api.scheduler import ModelScheduler, QueueFullError
+
+
+def _fake_ollama() -> tuple[FastAPI, list[dict]]:
+    calls: list[dict] = []
+    fake = FastAPI()
+
+    @fake.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        calls.append(body)
+        words = ["Me", " duele", " aquí."]
+        if body.get("stream"):
+            lines = [json.dumps({"message": {"content": word}, "done": False}) + "\n" for word in words]
+            lines.append(json.dumps({"done": True}) + "\n")
+            return StreamingResponse(iter(lines), media_type="application/x-ndjson")
+        return {"message": {"role": "assistant", "content": "".join(words)}, "done": True}
+
+    return fake, calls
+
+
+def test_llm_chat_forwards_system_and_messages_to_ollama():
+    fake, calls = _fake_ollama()
+    app = create_app(ollama_transport=httpx.ASGITransport(app=fake))
+    payload = {
+        "persona": {"demografia": "Paciente ficticio"},
+        "system": "Actúa como paciente.",
+        "messages": [{"role": "user", "content": "¿Qué le pasa?"}],
+        "temperature": 0.2,
+        "max_tokens": 50,
+    }
+
+    with TestClient(app) as client:
+        response = client.post("/llm/chat", json=payload)
+        metrics = client.get("/metrics").json()
+
+    assert response.status_code == 200
+    assert response.json()["reply"] == "Me duele aquí."
+    assert calls[0]["messages"][0] == {"role": "system", "content": "Actúa como paciente."}
+    assert calls[0]["options"] == {"temperature": 0.2, "num_predict": 50}
+    model_metrics = next(iter(metrics["models"].values()))
+    assert model_metrics["completed"] == 1
+    assert "queue_wait" in model_metrics["latency"]
+
+
+def test_llm_chat_streams_ndjson_deltas():
+    fake, _ = _fake_ollama()
+    app = create_app(ollama_transport=httpx.ASGITransport(app=fake))
+
+    with TestClient(app) as client:
+        response = client.post("/llm/chat", json={"messages": [{"role": "user", "content": "Hola"}], "stream": True})
+
+    lines = [json.loads(line) for line in response.text.splitlines() if line]
+    assert [line["delta"] for line in lines if "delta" in line] == ["Me", " duele", " aquí."]
+    assert lines[-1] == {"done": True, "reply": "Me duele aquí."}
+
+
+class _SlowBackend:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def chat(self, body):
+        self.calls += 1
+        await self.release.wait()
+        return f"respuesta {body['n']}"
+
+    async def stream_chat(self, body):  # pragma: no cover - not used here
+        yield ""
+
+
+def test_scheduler_coalesces_identical_requests():
+    async def scenario():
+        backend = _SlowBackend()
+        scheduler = ModelScheduler("m", backend, workers=1, queue_size=4, retry_after_max=30)
+        scheduler.start()
+        first = asyncio.create_task(scheduler.submit({"n": 1}))
+        second = asyncio.create_task(scheduler.submit({"n": 1}))
+        await asyncio.sleep(0)
+        backend.release.set()
+        results = await asyncio.gather(first, second)
+        await scheduler.stop()
+        return backend.calls, results, scheduler.snapshot()
+
+    calls, results, snapshot = asyncio.run(scenario())
+
+    assert calls == 1
+    assert results == ["respuesta 1", "respuesta 1"]
+    assert snapshot["coalesced"] == 1
+
+
+def test_scheduler_rejects_when_queue_is_full():
+    async def scenario():
+        backend = _SlowBackend()
+        scheduler = ModelScheduler("m", backend, workers=1, queue_size=1, retry_after_max=30)
+        scheduler.start()
+        running = asyncio.create_task(scheduler.submit({"n": 1}))
+        await asyncio.sleep(0.01)
+        queued = asyncio.create_task(scheduler.submit({"n": 2}))
+        await asyncio.sleep(0)
+        with pytest.raises(QueueFullError) as excinfo:
+            await scheduler.submit({"n": 3})
+        backend.release.set()
+        await asyncio.gather(running, queued)
+        await scheduler.stop()
+        return excinfo.value, scheduler.snapshot()
+
+    error, snapshot = asyncio.run(scenario())
+
+    assert error.retry_after >= 1
+    assert snapshot["rejected"] == 1
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+from types import SimpleNamespace
+
+from bot.lazy import lazy_callback
+from scripts.bench_startup import (
+    FIRST_UPDATE_FORBIDDEN,
+    direct_imports,
+    first_update_statement,
+    imported_since,
+    loaded_modules,
+    parse_importtime,
+)
+
+SAMPLE = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 | encodings
+import time:       300 |       5300 |     telegram._bot
+import time:       800 |       6100 |   telegram
+import time:        50 |         50 |   bot.menus
+import time:       400 |       6550 | bot.main
+"""
+
+
+def test_parse_importtime_tracks_depth_and_milliseconds():
+    timings = parse_importtime(SAMPLE)
+
+    assert [timing.module for timing in timings] == ["encodings", "telegram._bot", "telegram", "bot.menus", "bot.main"]
+    assert [timing.depth for timing in timings] == [0, 2, 1, 1, 0]
+    assert timings[-1].cumulative_ms == 6.55
+    assert [timing.module for timing in direct_imports(timings, "bot.main")] == ["telegram", "bot.menus"]
+
+
+def test_imported_since_adds_the_modules_loaded_after_the_entry_point():
+    timings = parse_importtime(
+        SAMPLE
+        + "import time:       700 |       2700 |   sqlalchemy\n"
+        + "import time:       900 |       3600 | bot.features.ai_patient\n"
+        + "import time:       200 |        200 | bot.evaluation_queue\n"
+    )
+
+    assert round(imported_since(timings, "bot.main"), 2) == 10.35
+
+
+def test_startup_modules_are_importable():
+    from bot import main
+
+    assert all(importlib.util.find_spec(name) for name in main.STARTUP_MODULES)
+
+
+def test_importing_main_does_not_load_feature_modules():
+    assert loaded_modules("bot.main") == []
+
+
+def test_first_update_does_not_load_feature_modules():
+    statement = first_update_statement("bot.main")
+
+    assert statement.startswith("bot.main, bot.persistence")
+    assert loaded_modules(statement, FIRST_UPDATE_FORBIDDEN) == []
+
+
+def test_lazy_callback_imports_on_first_call():
+    callback = lazy_callback("asyncio:sleep")
+
+    assert asyncio.run(callback(0, result="listo")) == "listo"
+    assert callback.__name__ == "asyncio:sleep"
+
+
+def test_post_init_does_not_wait_for_background_services(monkeypatch):
+    from bot import main, rate_limit
+
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_services(application):
+        started.set()
+        await release.wait()
+
+    monkeypatch.setattr(main, "start_services", slow_services)
+    monkeypatch.setattr(rate_limit, "_limiter", SimpleNamespace())
+
+    async def scenario():
+        await asyncio.wait_for(main.on_startup(SimpleNamespace(bot=None)), timeout=1)
+        await started.wait()
+        pending = [task for task in main._background_tasks if not task.done()]
+        release.set()
+        await asyncio.gather(*main._background_tasks)
+        main._background_tasks.clear()
+        return len(pending)
+
+    assert asyncio.run(scenario()) == 1
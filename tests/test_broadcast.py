@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import fakeredis
+from telegram.error import Forbidden, RetryAfter
+
+from bot.features.broadcast import BroadcastEngine, BroadcastProgress, _progress_key
+from bot.throttle import TokenBucket
+from common.db import Broadcast, Setting, User
+from common.redis_client import redis_key
+
+
+class FakeBot:
+    def __init__(self, blocked=(), throttled=()):
+        self.sent = []
+        self.blocked = set(blocked)
+        self.throttled = set(throttled)
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.blocked:
+            raise Forbidden("bot was blocked by the user")
+        if chat_id in self.throttled:
+            self.throttled.discard(chat_id)
+            raise RetryAfter(0)
+        self.sent.append(chat_id)
+
+
+def _seed(get_session, users, progress=None):
+    async def seed():
+        async with get_session() as session:
+            session.add_all(User(id=user_id, role="student") for user_id in users)
+            session.add(Broadcast(id=1, title="Examen", message="Mañana a las 8", created_by=users[0]))
+            if progress:
+                session.add(Setting(key=_progress_key(1), value=progress))
+            await session.commit()
+
+    asyncio.run(seed())
+
+
+def _engine(bot, get_session, redis=None):
+    return BroadcastEngine(
+        bot,
+        redis or fakeredis.FakeAsyncRedis(decode_responses=True),
+        chunk_size=3,
+        messages_per_second=1000,
+        session_factory=get_session,
+    )
+
+
+def test_broadcast_delivers_in_chunks_and_marks_sent(sqlite_get_session):
+    _seed(sqlite_get_session, list(range(1, 8)))
+    bot = FakeBot(blocked={4}, throttled={6})
+
+    async def scenario():
+        progress = await _engine(bot, sqlite_get_session).run(1)
+        async with sqlite_get_session() as session:
+            broadcast = await session.get(Broadcast, 1)
+            checkpoint = await session.get(Setting, _progress_key(1))
+            return progress, broadcast.sent_at, checkpoint.value
+
+    progress, sent_at, checkpoint = asyncio.run(scenario())
+
+    assert sorted(bot.sent) == [1, 2, 3, 5, 6, 7]
+    assert progress == BroadcastProgress(last_user_id=7, sent=6, failed=1)
+    assert checkpoint == {"last_user_id": 7, "sent": 6, "failed": 1}
+    assert sent_at is not None
+
+
+def test_broadcast_resumes_from_checkpoint(sqlite_get_session):
+    _seed(sqlite_get_session, list(range(1, 8)), progress={"last_user_id": 5, "sent": 5, "failed": 0})
+    bot = FakeBot()
+
+    progress = asyncio.run(_engine(bot, sqlite_get_session).run(1))
+
+    assert bot.sent == [6, 7]
+    assert progress.sent == 7
+
+
+def test_broadcast_skips_when_another_replica_holds_the_lock(sqlite_get_session):
+    _seed(sqlite_get_session, [1, 2])
+    bot = FakeBot()
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def scenario():
+        await redis.set(redis_key("broadcast", "lock", 1), 1)
+        return await _engine(bot, sqlite_get_session, redis).run(1)
+
+    assert asyncio.run(scenario()) is None
+    assert bot.sent == []
+
+
+def test_retry_after_pauses_every_pending_delivery(sqlite_get_session):
+    _seed(sqlite_get_session, [1, 2, 3])
+    sent_at: dict[int, float] = {}
+    throttled_at: list[float] = []
+
+    class ThrottledBot:
+        async def send_message(self, chat_id, text):
+            if chat_id == 1 and not throttled_at:
+                throttled_at.append(time.monotonic())
+                raise RetryAfter(0.2)
+            sent_at[chat_id] = time.monotonic()
+
+    progress = asyncio.run(_engine(ThrottledBot(), sqlite_get_session).run(1))
+
+    assert progress.sent == 3
+    assert all(moment - throttled_at[0] >= 0.19 for moment in sent_at.values())
+
+
+def test_token_bucket_pause_blocks_until_it_expires():
+    async def scenario():
+        bucket = TokenBucket(1000)
+        bucket.pause(0.1)
+        blocked = bucket.try_acquire()
+        started = time.monotonic()
+        await bucket.acquire()
+        return blocked, time.monotonic() - started
+
+    blocked, waited = asyncio.run(scenario())
+
+    assert not blocked
+    assert waited >= 0.09
+
+
+def test_broadcast_does_not_release_a_lock_taken_over_by_another_replica(sqlite_get_session):
+    _seed(sqlite_get_session, list(range(1, 8)))
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    lock_key = redis_key("broadcast", "lock", 1)
+
+    class TakeoverBot(FakeBot):
+        async def send_message(self, chat_id, text):
+            await redis.set(lock_key, "otra-replica")
+            await super().send_message(chat_id, text)
+
+    bot = TakeoverBot()
+
+    async def scenario():
+        progress = await _engine(bot, sqlite_get_session, redis).run(1)
+        return progress, await redis.get(lock_key)
+
+    progress, holder = asyncio.run(scenario())
+
+    assert progress is None
+    assert sorted(bot.sent) == [1, 2, 3]
+    assert holder == "otra-replica"
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+
+from bot.features.document_index import DocumentIndexer, search_documents
+from common.db import Document, User
+
+PAGES = {
+    "guia.pdf": ["Introducción al curso de medicina interna.", "", "Criterios de sepsis: qSOFA y lactato elevado."],
+    "roto.pdf": None,
+}
+
+
+def fake_extract(path: str):
+    pages = PAGES[path]
+    if pages is None:
+        raise ValueError("PDF dañado")
+    return pages
+
+
+def test_indexer_builds_pages_and_search_ranks_hits(sqlite_get_session):
+    async def scenario():
+        async with sqlite_get_session() as session:
+            session.add(User(id=1, role="admin"))
+            session.add(Document(id=1, title="Guía", file_path="guia.pdf", file_type="pdf", uploaded_by=1, extra={}))
+            session.add(Document(id=2, title="Roto", file_path="roto.pdf", file_type="pdf", uploaded_by=1, extra={}))
+            await session.commit()
+
+        indexer = DocumentIndexer(max_workers=1, session_factory=sqlite_get_session, extract=fake_extract)
+        try:
+            queued = await indexer.enqueue_pending()
+            await indexer.join()
+            requeued = await indexer.enqueue_pending()
+            await indexer.join()
+        finally:
+            await indexer.close()
+
+        async with sqlite_get_session() as session:
+            hits = await search_documents(session, "sepsis lactato")
+            missing = await search_documents(session, "apendicitis")
+            wildcard = await search_documents(session, "lact_to")
+            guide = await session.get(Document, 1)
+            broken = await session.get(Document, 2)
+        return queued, requeued, hits, missing + wildcard, guide.extra, broken.extra
+
+    queued, requeued, hits, missing, guide, broken = asyncio.run(scenario())
+
+    assert queued == 2
+    assert requeued == 1
+    assert [(hit.document_id, hit.page_number) for hit in hits] == [(1, 3)]
+    assert "sepsis" in hits[0].snippet
+    assert missing == []
+    assert guide["index_status"] == "ready" and guide["indexed_pages"] == 2
+    assert broken["index_status"] == "failed"
+
+
+def test_two_indexers_index_a_pending_document_once(sqlite_get_session):
+    async def scenario():
+        async with sqlite_get_session() as session:
+            session.add(User(id=1, role="admin"))
+            session.add(Document(id=1, title="Guía", file_path="guia.pdf", file_type="pdf", uploaded_by=1, extra={}))
+            await session.commit()
+
+        indexers = [
+            DocumentIndexer(max_workers=1, session_factory=sqlite_get_session, extract=fake_extract) for _ in range(2)
+        ]
+        try:
+            await asyncio.gather(*(indexer.enqueue_pending() for indexer in indexers))
+            await asyncio.gather(*(indexer.join() for indexer in indexers))
+        finally:
+            await asyncio.gather(*(indexer.close() for indexer in indexers))
+
+        async with sqlite_get_session() as session:
+            guide = await session.get(Document, 1)
+        return [indexer.indexed for indexer in indexers], guide.extra
+
+    indexed, guide = asyncio.run(scenario())
+
+    assert sorted(indexed) == [0, 1]
+    assert guide["index_status"] == "ready" and guide["indexed_pages"] == 2
+
+
+def test_claim_skips_live_claims_and_takes_over_expired_ones(sqlite_get_session):
+    from datetime import datetime, timedelta
+
+    from bot.features.document_index import CLAIM_LEASE_SECONDS
+
+    stale = (datetime.utcnow() - timedelta(seconds=CLAIM_LEASE_SECONDS + 1)).isoformat()
+    live = datetime.utcnow().isoformat()
+
+    async def scenario():
+        async with sqlite_get_session() as session:
+            session.add(User(id=1, role="admin"))
+            for document_id, claimed_at in ((1, stale), (2, live)):
+                session.add(
+                    Document(
+                        id=document_id,
+                        title="Guía",
+                        file_path=f"guia-{document_id}.pdf",
+                        file_type="pdf",
+                        uploaded_by=1,
+                        extra={"index_status": "indexing", "index_claimed_at": claimed_at},
+                    )
+                )
+            await session.commit()
+
+        indexer = DocumentIndexer(max_workers=1, session_factory=sqlite_get_session, extract=fake_extract)
+        return await indexer.claim(1), await indexer.claim(1), await indexer.claim(2)
+
+    assert asyncio.run(scenario()) == ("guia-1.pdf", None, None)
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime
+
+from common.db import EvaluationJob, Patient, SimSession, User
+
+from bot import evaluation_queue
+from bot.evaluation_queue import EvaluationWorker
+
+
+async def _seed(get_session, jobs: int, **values) -> None:
+    async with get_session() as session:
+        session.add(User(id=1, role="student"))
+        session.add(Patient(id=1, slug="dummy", display_name="Paciente", persona={}))
+        session.add(SimSession(id=1, user_id=1, patient_id=1))
+        for index in range(jobs):
+            session.add(EvaluationJob(session_id=1, chat_id=100 + index, payload={"index": index}, **values))
+        await session.commit()
+
+
+
+def test_worker_gives_up_after_max_attempts(monkeypatch, sqlite_get_session):
+    monkeypatch.setattr(evaluation_queue, "RETRY_BASE_SECONDS", 0)
+    calls: list[tuple[int, bool]] = []
+
+    async def handler(job, final):
+        calls.append((job.attempts, final))
+        raise RuntimeError("modelo caído")
+
+    async def scenario():
+        await _seed(sqlite_get_session, 1)
+        worker = EvaluationWorker(handler, workers=1, max_attempts=2, session_factory=sqlite_get_session)
+        while await worker.run_once():
+            pass
+        async with sqlite_get_session() as session:
+            return await session.get(EvaluationJob, 1)
+
+    job = asyncio.run(scenario())
+
+    assert calls == [(1, False), (2, True)]
+    assert job.status == "failed" and job.attempts == 2
+    assert "modelo caído" in job.last_error
+
+
+def test_worker_backs_off_before_retrying(sqlite_get_session):
+    async def handler(job, final):
+        raise RuntimeError("timeout")
+
+    async def scenario():
+        await _seed(sqlite_get_session, 1)
+        worker = EvaluationWorker(handler, workers=1, max_attempts=3, session_factory=sqlite_get_session)
+        first = await worker.run_once()
+        second = await worker.run_once()
+        async with sqlite_get_session() as session:
+            return first, second, await session.get(EvaluationJob, 1)
+
+    first, second, job = asyncio.run(scenario())
+
+    assert first is True and second is False
+    assert job.status == "queued"
+    assert job.next_attempt_at > datetime.utcnow()
+
+
+def test_pool_drains_burst_with_bounded_concurrency(sqlite_get_session):
+    running = 0
+    peak = 0
+    done: list[int] = []
+
+    async def handler(job, final):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        done.append(job.chat_id)
+
+    async def scenario():
+        await _seed(sqlite_get_session, 12)
+        worker = EvaluationWorker(
+            handler, workers=3, max_attempts=3, poll_interval=0.05, session_factory=sqlite_get_session
+        )
+        await worker.start()
+        for _ in range(200):
+            if len(done) == 12:
+                break
+            await asyncio.sleep(0.02)
+        await worker.stop()
+
+    asyncio.run(scenario())
+
+    assert sorted(done) == list(range(100, 112))
+    assert peak <= 3
+
+
+def test_running_worker_requeues_jobs_whose_lease_expired(sqlite_get_session):
+    handled: list[int] = []
+
+    async def handler(job, final):
+        handled.append(job.id)
+
+    async def scenario():
+        await _seed(sqlite_get_session, 1)
+        crashed = EvaluationWorker(handler, workers=1, max_attempts=3, session_factory=sqlite_get_session)
+        assert (await crashed.claim()).status == "running"
+        worker = EvaluationWorker(
+            handler,
+            workers=1,
+            max_attempts=3,
+            poll_interval=0.05,
+            lease_seconds=0.3,
+            session_factory=sqlite_get_session,
+        )
+        await worker.start()
+        assert handled == []
+        for _ in range(40):
+            if worker.processed:
+                break
+            await asyncio.sleep(0.05)
+        await worker.stop()
+        async with sqlite_get_session() as session:
+            return await session.get(EvaluationJob, 1)
+
+    job = asyncio.run(scenario())
+
+    assert handled == [1]
+    assert job.status == "done" and job.attempts == 2
+
+
+def test_heartbeat_keeps_long_jobs_from_being_requeued(sqlite_get_session):
+    handled: list[int] = []
+
+    async def handler(job, final):
+        handled.append(job.attempts)
+        await asyncio.sleep(0.6)
+
+    async def scenario():
+        await _seed(sqlite_get_session, 1)
+        workers = [
+            EvaluationWorker(
+                handler,
+                workers=1,
+                max_attempts=3,
+                poll_interval=0.05,
+                lease_seconds=0.3,
+                session_factory=sqlite_get_session,
+            )
+            for _ in range(2)
+        ]
+        for worker in workers:
+            await worker.start()
+        await asyncio.sleep(1.0)
+        for worker in workers:
+            await worker.stop()
+        async with sqlite_get_session() as session:
+            return await session.get(EvaluationJob, 1)
+
+    job = asyncio.run(scenario())
+
+    assert handled == [1]
+    assert job.status == "done" and job.attempts == 1
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import asyncio
+import random
+
+from bot.features import ifom_bank
+from bot.features.ifom_bank import BankCache, ItemSampler
+from common.db import IFOM_BANK_VERSION_KEY, IFOMItem, bump_version
+
+
+def _sampler(max_seen: int = 100, max_users: int = 100) -> ItemSampler:
+    sampler = ItemSampler(max_seen_per_user=max_seen, max_users=max_users, rng=random.Random(7))
+    sampler.load([(1, ["cardio"]), (2, ["cardio", "neumo"]), (3, ["neumo"]), (4, [])])
+    return sampler
+
+
+def test_sampler_avoids_repeating_items_until_pool_is_exhausted():
+    sampler = _sampler()
+    first_round = [sampler.sample(user_id=10) for _ in range(4)]
+    assert sorted(first_round) == [1, 2, 3, 4]
+    assert sampler.sample(user_id=10) in {1, 2, 3, 4}
+
+
+def test_sampler_filters_by_tag_and_tracks_users_separately():
+    sampler = _sampler()
+    picks = {sampler.sample(user_id=1, tag="neumo") for _ in range(2)}
+    assert picks == {2, 3}
+    assert sampler.sample(user_id=2, tag="neumo") in {2, 3}
+    assert sampler.sample(user_id=1, tag="desconocido") is None
+
+
+def test_sampler_bounds_seen_history_per_user():
+    sampler = _sampler(max_seen=2)
+    for _ in range(10):
+        sampler.sample(user_id=5)
+    assert len(sampler._seen[5]) == 2
+
+
+def test_sampler_forgets_the_least_recent_users():
+    sampler = _sampler(max_users=2)
+    for user_id in (1, 2, 1, 3):
+        sampler.sample(user_id=user_id)
+    assert list(sampler._seen) == [1, 3]
+
+
+def test_refresh_bank_reloads_only_when_version_changes(monkeypatch, sqlite_get_session):
+    monkeypatch.setattr(ifom_bank, "get_session", sqlite_get_session)
+    monkeypatch.setattr(ifom_bank, "_cache", BankCache())
+    monkeypatch.setattr(ifom_bank, "_sampler", _sampler())
+    monkeypatch.setattr(ifom_bank.settings, "ifom_index_refresh_seconds", 0)
+
+    def new_item(external_id: str) -> IFOMItem:
+        return IFOMItem(external_id=external_id, stem="¿?", options=["a", "b"], answer_index=1, tags=["t"])
+
+    async def scenario():
+        async with sqlite_get_session() as session:
+            session.add(new_item("ifom-1"))
+            await bump_version(session, IFOM_BANK_VERSION_KEY)
+            await session.commit()
+        await ifom_bank.refresh_bank()
+        first = ifom_bank.get_bank_cache().stats()
+
+        async with sqlite_get_session() as session:
+            session.add(new_item("ifom-2"))
+            await session.commit()
+        await ifom_bank.refresh_bank()
+        unchanged = len(ifom_bank.get_bank_cache())
+
+        async with sqlite_get_session() as session:
+            await bump_version(session, IFOM_BANK_VERSION_KEY)
+            await session.commit()
+        await ifom_bank.refresh_bank()
+        record = ifom_bank.get_bank_cache().get_by_external_id("ifom-2")
+        return first, unchanged, record, ifom_bank.get_bank_cache().stats()
+
+    first, unchanged, record, stats = asyncio.run(scenario())
+
+    assert first["version"] == 1 and first["items"] == 1
+    assert unchanged == 1
+    assert record is not None and record.options == ("a", "b")
+    assert stats["version"] == 2 and stats["hits"] == 1
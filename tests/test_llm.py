@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+
+import httpx
+
+from common.llm import LLMClient
+
+
+def _build_client(handler, max_in_flight: int = 2) -> LLMClient:
+    return LLMClient(
+        "http://gateway.test",
+        max_connections=10,
+        max_keepalive_connections=5,
+        keepalive_expiry=30,
+        connect_timeout=1,
+        read_timeout=5,
+        max_in_flight=max_in_flight,
+        transport=httpx.MockTransport(handler),
+    )
+
+
+def test_post_json_returns_payload_and_records_latency():
+    seen: list[str] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(str(request.url))
+        return httpx.Response(200, json={"reply": "hola"})
+
+    async def scenario():
+        client = _build_client(handler)
+        data = await client.post_json("/llm/chat", {"messages": []})
+        stats = client.stats()
+        await client.aclose()
+        return data, stats
+
+    data, stats = asyncio.run(scenario())
+
+    assert data == {"reply": "hola"}
+    assert seen == ["http://gateway.test/llm/chat"]
+    assert stats["latency"]["/llm/chat"]["count"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_post_json_caps_requests_in_flight():
+    active = 0
+    peak = 0
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return httpx.Response(200, json={"reply": "ok"})
+
+    async def scenario():
+        client = _build_client(handler, max_in_flight=2)
+        await asyncio.gather(*(client.post_json("/llm/chat", {}) for _ in range(6)))
+        await client.aclose()
+
+    asyncio.run(scenario())
+
+    assert peak == 2
+
+
+def test_stream_json_raises_an_httpx_error_on_a_corrupt_line():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=b'{"delta": "Ho"}\n{"delta": "la\n{"done": true}\n')
+
+    async def scenario():
+        client = _build_client(handler)
+        chunks = []
+        try:
+            async for chunk in client.stream_json("/llm/chat", {"stream": True}):
+                chunks.append(chunk)
+        except httpx.HTTPError as exc:
+            error = exc
+        else:
+            error = None
+        stats = client.stats()
+        await client.aclose()
+        return chunks, error, stats
+
+    chunks, error, stats = asyncio.run(scenario())
+
+    assert chunks == [{"delta": "Ho"}]
+    assert isinstance(error, httpx.DecodingError)
+    assert stats["in_flight"] == 0
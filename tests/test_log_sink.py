@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import asyncio
+
+from sqlalchemy import func, select
+
+from bot.log_sink import SimLogSink
+from common.db import SimLog
+
+
+async def _count_logs(sessionmaker) -> int:
+    async with sessionmaker() as session:
+        return await session.scalar(select(func.count()).select_from(SimLog))
+
+
+def test_sink_flushes_in_bulk_when_batch_is_full(sqlite_sessionmaker):
+    async def scenario():
+        sink = SimLogSink(sqlite_sessionmaker, batch_size=3, flush_interval=60)
+        for index in range(2):
+            sink.append(1, "student", f"hola {index}")
+        before = await _count_logs(sqlite_sessionmaker)
+        sink.append(1, "patient", "respuesta")
+        await asyncio.sleep(0.05)
+        after = await _count_logs(sqlite_sessionmaker)
+        await sink.close()
+        return before, after, sink.flushed
+
+    before, after, flushed = asyncio.run(scenario())
+
+    assert before == 0
+    assert after == 3
+    assert flushed == 3
+
+
+def test_sink_close_flushes_pending_rows(sqlite_sessionmaker):
+    async def scenario():
+        sink = SimLogSink(sqlite_sessionmaker, batch_size=100, flush_interval=60)
+        sink.append(2, "system", "Sesión iniciada", {"origen": "test"})
+        assert sink.has_pending(2)
+        await sink.close()
+        async with sqlite_sessionmaker() as session:
+            return (await session.scalars(select(SimLog))).all()
+
+    logs = asyncio.run(scenario())
+
+    assert [(log.session_id, log.role, log.extra) for log in logs] == [(2, "system", {"origen": "test"})]
+
+
+def test_sink_keeps_good_rows_when_one_row_is_rejected(sqlite_sessionmaker):
+    async def scenario():
+        sink = SimLogSink(sqlite_sessionmaker, batch_size=100, flush_interval=60)
+        sink.append(1, "student", "hola")
+        sink.append(1, "system", "roto", {"valor": object()})
+        sink.append(1, "patient", "respuesta")
+        flushed = await sink.flush()
+        again = await sink.flush()
+        await sink.close()
+        async with sqlite_sessionmaker() as session:
+            logs = (await session.scalars(select(SimLog).order_by(SimLog.id))).all()
+        return flushed, again, sink.dropped, [log.message for log in logs]
+
+    flushed, again, dropped, messages = asyncio.run(scenario())
+
+    assert (flushed, again, dropped) == (2, 0, 1)
+    assert messages == ["hola", "respuesta"]
+
+
+def test_sink_gives_up_after_max_attempts_and_bounds_the_buffer():
+    calls = 0
+
+    def broken_factory():
+        nonlocal calls
+        calls += 1
+        raise ConnectionError("base de datos caída")
+
+    async def scenario():
+        sink = SimLogSink(broken_factory, batch_size=100, flush_interval=60, max_pending=3, max_attempts=2)
+        for index in range(5):
+            sink.append(1, "student", f"hola {index}")
+        kept = [row["message"] for row in sink._pending]
+        await sink.flush()
+        requeued = sink.has_pending(1)
+        await sink.flush()
+        return kept, requeued, sink.has_pending(1), sink.dropped
+
+    kept, requeued, pending, dropped = asyncio.run(scenario())
+
+    assert kept == ["hola 2", "hola 3", "hola 4"]
+    assert requeued and not pending
+    assert dropped == 5
+    assert calls == 2
+
+
+def test_has_pending_sees_rows_being_flushed(sqlite_sessionmaker):
+    async def scenario():
+        sink = SimLogSink(sqlite_sessionmaker, batch_size=100, flush_interval=60)
+        sink.append(3, "student", "hola")
+        flushing = asyncio.create_task(sink.flush())
+        await asyncio.sleep(0)
+        during = sink.has_pending(3)
+        if during:
+            await sink.flush()
+        count = await _count_logs(sqlite_sessionmaker)
+        await flushing
+        await sink.close()
+        return during, count
+
+    during, count = asyncio.run(scenario())
+
+    assert during
+    assert count == 1
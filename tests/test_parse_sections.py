@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+from scripts.bench_parse_sections import naive_detect_section, naive_parse_sections, synthetic_pages
+from scripts.seed_patient_from_pdf import detect_section, iter_pages, parse_sections
+
+
+def test_compiled_detection_matches_alias_scan():
+    lines = [
+        "Datos generales: Sofía",
+        ":: Motivo de consulta",
+        "Consulta previa",
+        "HX quirúrgica",
+        "Efecto adverso",
+        "Labs",
+        "Imágenes",
+        "Paciente estable",
+        "",
+    ]
+    for page in synthetic_pages(5, 40):
+        lines.extend(page.splitlines())
+
+    assert [detect_section(line) for line in lines] == [naive_detect_section(line) for line in lines]
+
+
+def test_parse_sections_streams_pages_like_joined_text(tmp_path):
+    pages = list(synthetic_pages(20, 30))
+    note = tmp_path / "nota.txt"
+    note.write_text("\n".join(pages), encoding="utf-8")
+
+    expected = naive_parse_sections("\n".join(pages))
+
+    assert parse_sections(iter(pages)) == expected
+    assert parse_sections("\n".join(pages)) == expected
+    assert parse_sections(iter_pages(note)) == expected
+
+
+def test_parse_sections_keeps_text_after_inline_header():
+    sections = parse_sections("Alergias: penicilina\nHábitos:\nCafé diario")
+
+    assert sections["alergias"] == ["penicilina"]
+    assert sections["habitos"] == ["Café diario"]
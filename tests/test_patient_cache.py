@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import asyncio
+
+import fakeredis
+
+from bot.features import patient_cache
+from bot.features.patient_cache import PersonaCache
+from common.invalidation import publish_patient_version
+
+
+def test_cache_evicts_least_recently_used_slug():
+    cache = PersonaCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", {"slug": "a"}, 1)
+    cache.put("b", {"slug": "b"}, 1)
+    assert cache.get("a") is not None
+    cache.put("c", {"slug": "c"}, 1)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_cache_expires_entries_after_ttl():
+    cache = PersonaCache(max_entries=2, ttl_seconds=0)
+    cache.put("a", {"slug": "a"}, 1)
+    assert cache.get("a") is None
+
+
+def test_invalidate_only_drops_older_versions():
+    cache = PersonaCache(max_entries=4, ttl_seconds=60)
+    cache.put("a", {"slug": "a"}, 3)
+    cache.invalidate("a", 3)
+    assert cache.get("a") is not None
+    cache.invalidate("a", 4)
+    assert cache.get("a") is None
+
+
+def test_listener_invalidates_on_published_version(monkeypatch):
+    server = fakeredis.FakeServer()
+    cache = PersonaCache(max_entries=4, ttl_seconds=60)
+    monkeypatch.setattr(patient_cache, "_cache", cache)
+    monkeypatch.setattr(
+        patient_cache, "get_redis", lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    )
+
+    async def scenario():
+        listener = asyncio.create_task(patient_cache.run_invalidation_listener())
+        await asyncio.sleep(0.05)
+        cache.put("sofia-gastro", {"slug": "sofia-gastro"}, 0)
+        await publish_patient_version(fakeredis.FakeAsyncRedis(server=server, decode_responses=True), "sofia-gastro")
+        for _ in range(50):
+            if cache.get("sofia-gastro") is None:
+                break
+            await asyncio.sleep(0.01)
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+        return len(cache)
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+
+import fakeredis
+
+from bot.features.ai_patient import SESSION_KEY
+from bot.persistence import RedisPersistence, user_data_key
+
+
+def _persistence(redis, refresh_seconds: float = 300) -> RedisPersistence:
+    return RedisPersistence(redis, update_interval=10, ttl_seconds=3600, refresh_seconds=refresh_seconds)
+
+
+def test_user_data_survives_restart_and_loads_lazily():
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def scenario():
+        before = _persistence(redis)
+        await before.update_user_data(7, {SESSION_KEY: 41, "patient_slug": "sofia-gastro"})
+        await before.flush()
+
+        after = _persistence(redis)
+        assert await after.get_user_data() == {}
+        user_data: dict = {}
+        await after.refresh_user_data(7, user_data)
+        await after.refresh_user_data(7, user_data)
+        return after, user_data, await redis.ttl(user_data_key(7))
+
+    after, user_data, ttl = asyncio.run(scenario())
+
+    assert user_data == {SESSION_KEY: 41, "patient_slug": "sofia-gastro"}
+    assert after.loads == 1
+    assert 0 < ttl <= 3600
+
+
+def test_dirty_users_are_flushed_in_one_batch():
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def scenario():
+        persistence = _persistence(redis)
+        await asyncio.gather(*(persistence.update_user_data(user_id, {SESSION_KEY: user_id}) for user_id in range(50)))
+        first_writes = persistence.writes
+        await asyncio.gather(*(persistence.update_user_data(user_id, {SESSION_KEY: user_id}) for user_id in range(50)))
+        await persistence.update_user_data(99, {})
+        return first_writes, persistence.writes, len(await redis.keys(user_data_key("*")))
+
+    first_writes, total_writes, stored = asyncio.run(scenario())
+
+    assert first_writes == 1
+    assert total_writes == 1
+    assert stored == 50
+
+
+def test_refresh_picks_up_changes_from_another_replica_only_when_clean():
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def scenario():
+        replica_a = _persistence(redis, refresh_seconds=0)
+        replica_b = _persistence(redis, refresh_seconds=0)
+        clean: dict = {}
+        await replica_a.refresh_user_data(1, clean)
+        edited: dict = {}
+        await replica_a.refresh_user_data(2, edited)
+        edited["patient_slug"] = "local"
+
+        await replica_b.update_user_data(1, {SESSION_KEY: 5})
+        await replica_b.update_user_data(2, {SESSION_KEY: 6})
+
+        await replica_a.refresh_user_data(1, clean)
+        await replica_a.refresh_user_data(2, edited)
+        return clean, edited
+
+    clean, edited = asyncio.run(scenario())
+
+    assert clean == {SESSION_KEY: 5}
+    assert edited == {"patient_slug": "local"}
+
+
+def test_drop_user_data_removes_the_key():
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    async def scenario():
+        persistence = _persistence(redis)
+        await persistence.update_user_data(3, {SESSION_KEY: 1})
+        await persistence.drop_user_data(3)
+        return await redis.exists(user_data_key(3))
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_refresh_keeps_the_local_copy_when_redis_fails():
+    server = fakeredis.FakeServer()
+    redis = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+
+    async def scenario():
+        persistence = _persistence(redis, refresh_seconds=0)
+        await redis.set(user_data_key(7), '{"patient_slug": "sofia-gastro"}')
+        await redis.set(user_data_key(8), '{"patient_slug": "tomas-cardio"}')
+        known: dict = {}
+        await persistence.refresh_user_data(7, known)
+
+        server.connected = False
+        await persistence.refresh_user_data(7, known)
+        unknown: dict = {}
+        await persistence.refresh_user_data(8, unknown)
+        unknown["nuevo"] = True
+        await persistence.update_user_data(8, unknown)
+
+        server.connected = True
+        await persistence.flush()
+        return known, unknown, await redis.get(user_data_key(8))
+
+    known, unknown, stored = asyncio.run(scenario())
+
+    assert known == {"patient_slug": "sofia-gastro"}
+    assert unknown == {"nuevo": True}
+    assert stored == '{"patient_slug": "tomas-cardio"}'
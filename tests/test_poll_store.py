@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import fakeredis
+from redis.exceptions import RedisError
+
+from bot.features import ifom
+from bot.features.ifom_bank import IFOMRecord
+from bot.features.poll_store import PollStore
+
+
+def _store(ttl: int = 60) -> PollStore:
+    return PollStore(fakeredis.FakeAsyncRedis(decode_responses=True), ttl_seconds=ttl, grace_seconds=30)
+
+
+def test_pop_returns_data_only_once():
+    async def scenario():
+        store = _store()
+        await store.put("poll-1", {"item_id": 3, "user_id": 4})
+        first = await store.pop("poll-1")
+        second = await store.pop("poll-1")
+        return first, second, await store.pending()
+
+    first, second, pending = asyncio.run(scenario())
+
+    assert first == {"item_id": 3, "user_id": 4}
+    assert second is None
+    assert pending == 0
+
+
+def test_pop_expired_claims_only_overdue_polls():
+    async def scenario():
+        store = _store(ttl=60)
+        await store.put("vieja", {"item_id": 1})
+        await store.put("nueva", {"item_id": 2})
+        await store._redis.zadd(store._expiry_key, {"vieja": 0})
+        expired = await store.pop_expired()
+        again = await store.pop_expired()
+        return expired, again, await store.pop("nueva")
+
+    expired, again, fresh = asyncio.run(scenario())
+
+    assert expired == [("vieja", {"item_id": 1})]
+    assert again == []
+    assert fresh == {"item_id": 2}
+
+
+def test_sweeper_records_expired_polls_as_timeouts(monkeypatch):
+    attempts: list[tuple] = []
+    sent: list[str] = []
+    store = _store()
+
+    async def fake_get_item(item_id):
+        return IFOMRecord(1, "ifom-1", "¿?", ("a", "b"), 0, None, ())
+
+    async def fake_persist(item, user_id, selected_index, elapsed, is_correct):
+        attempts.append((item.id, user_id, selected_index, is_correct))
+
+    async def stop_poll(chat_id, message_id):
+        return None
+
+    async def send_message(chat_id, text, reply_markup=None):
+        sent.append(text)
+
+    monkeypatch.setattr(ifom, "get_poll_store", lambda: store)
+    monkeypatch.setattr(ifom, "get_item", fake_get_item)
+    monkeypatch.setattr(ifom, "_persist_attempt", fake_persist)
+    bot = SimpleNamespace(stop_poll=stop_poll, send_message=send_message)
+
+    async def scenario():
+        await store.put("poll-9", {"item_id": 1, "user_id": 7, "chat_id": 7, "message_id": 11, "started_at": 0})
+        await store._redis.zadd(store._expiry_key, {"poll-9": 0})
+        return await ifom.sweep_expired_polls(bot)
+
+    swept = asyncio.run(scenario())
+
+    assert swept == 1
+    assert attempts == [(1, 7, None, False)]
+    assert sent[0].startswith("⏱️")
+
+
+def test_poll_is_closed_when_it_cannot_be_stored(monkeypatch):
+    calls: list[tuple] = []
+
+    class BrokenStore:
+        async def put(self, poll_id, data):
+            raise RedisError("redis caído")
+
+    async def fake_get_item(item_id):
+        return IFOMRecord(1, "ifom-1", "¿?", ("a", "b"), 0, None, ())
+
+    async def fake_refresh():
+        return None
+
+    async def send_poll(**kwargs):
+        return SimpleNamespace(poll=SimpleNamespace(id="poll-1"), message_id=12)
+
+    async def stop_poll(chat_id, message_id):
+        calls.append(("stop_poll", chat_id, message_id))
+
+    async def send_message(chat_id, text, reply_markup=None):
+        calls.append(("send_message", chat_id, text))
+
+    monkeypatch.setattr(ifom, "get_poll_store", lambda: BrokenStore())
+    monkeypatch.setattr(ifom, "refresh_bank", fake_refresh)
+    monkeypatch.setattr(ifom, "get_item", fake_get_item)
+    monkeypatch.setattr(ifom, "get_item_sampler", lambda: SimpleNamespace(sample=lambda user_id: 1))
+    update = SimpleNamespace(
+        effective_user=SimpleNamespace(id=7), effective_chat=SimpleNamespace(id=7), callback_query=None, message=None
+    )
+    context = SimpleNamespace(bot=SimpleNamespace(send_poll=send_poll, stop_poll=stop_poll, send_message=send_message))
+
+    asyncio.run(ifom.handle_ifom(update, context))
+
+    assert calls[0] == ("stop_poll", 7, 12)
+    assert calls[1][0] == "send_message" and calls[1][2].startswith("⚠️")
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import asyncio
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from telegram.ext import ApplicationHandlerStop
+
+from bot import rate_limit
+from bot.features.ai_patient import SESSION_KEY
+from bot.i18n_es import STRINGS
+from bot.rate_limit import RateLimiter, rate_limit_guard
+
+
+def test_user_bucket_blocks_after_capacity_and_reports_wait():
+    async def scenario():
+        limiter = RateLimiter(fakeredis.FakeAsyncRedis(decode_responses=True), per_user_per_minute=6, global_per_minute=600)
+        first = await limiter.check(1, cost=3)
+        second = await limiter.check(1, cost=3)
+        third = await limiter.check(1, cost=3)
+        other_user = await limiter.check(2, cost=3)
+        return first, second, third, other_user
+
+    first, second, third, other_user = asyncio.run(scenario())
+
+    assert first.allowed and second.allowed
+    assert not third.allowed and 0 < third.retry_after <= 30
+    assert other_user.allowed
+
+
+def test_global_bucket_is_shared_between_users():
+    async def scenario():
+        limiter = RateLimiter(fakeredis.FakeAsyncRedis(decode_responses=True), per_user_per_minute=60, global_per_minute=2)
+        return [(await limiter.check(user_id, cost=1)).allowed for user_id in (1, 2, 3)]
+
+    assert asyncio.run(scenario()) == [True, True, False]
+
+
+def test_global_bucket_reports_its_scope():
+    async def scenario():
+        limiter = RateLimiter(fakeredis.FakeAsyncRedis(decode_responses=True), per_user_per_minute=60, global_per_minute=5)
+        await limiter.check(1, cost=5)
+        user = await limiter.check(2, cost=5)
+        crowded = RateLimiter(fakeredis.FakeAsyncRedis(decode_responses=True), per_user_per_minute=5, global_per_minute=600)
+        await crowded.check(1, cost=5)
+        return user, await crowded.check(1, cost=5)
+
+    blocked_globally, blocked_user = asyncio.run(scenario())
+
+    assert (blocked_globally.allowed, blocked_globally.scope) == (False, "global")
+    assert (blocked_user.allowed, blocked_user.scope) == (False, "user")
+
+
+def test_limits_below_the_costliest_feature_are_rejected(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_limiter", None)
+    monkeypatch.setattr(rate_limit.settings, "rate_limit_per_minute", 4)
+
+    with pytest.raises(ValueError, match="RATE_LIMIT_PER_MINUTE=4"):
+        rate_limit.get_rate_limiter()
+    rate_limit.validate_limits(5, 5)
+
+
+def test_guard_replies_with_wait_and_stops_handlers(monkeypatch):
+    replies: list[str] = []
+
+    async def reply_text(text):
+        replies.append(text)
+
+    limiter = RateLimiter(fakeredis.FakeAsyncRedis(decode_responses=True), per_user_per_minute=3, global_per_minute=600)
+    monkeypatch.setattr(rate_limit, "get_rate_limiter", lambda: limiter)
+    message = SimpleNamespace(text="¿Le duele?", reply_text=reply_text)
+    update = SimpleNamespace(
+        effective_user=SimpleNamespace(id=77),
+        effective_message=message,
+        callback_query=None,
+        poll_answer=None,
+    )
+    context = SimpleNamespace(user_data={SESSION_KEY: 1})
+
+    async def scenario():
+        await rate_limit_guard(update, context)
+        with pytest.raises(ApplicationHandlerStop):
+            await rate_limit_guard(update, context)
+
+    asyncio.run(scenario())
+
+    assert len(replies) == 1
+    assert "espera" in replies[0].lower()
+
+
+def test_guard_explains_when_the_global_limit_is_hit(monkeypatch):
+    replies: list[str] = []
+
+    async def reply_text(text):
+        replies.append(text)
+
+    async def check(user_id, cost):
+        return rate_limit.RateDecision(allowed=False, retry_after=3, scope="global")
+
+    monkeypatch.setattr(rate_limit, "get_rate_limiter", lambda: SimpleNamespace(check=check))
+    update = SimpleNamespace(
+        effective_user=SimpleNamespace(id=78),
+        effective_message=SimpleNamespace(text="/start", reply_text=reply_text),
+        callback_query=None,
+        poll_answer=None,
+    )
+
+    with pytest.raises(ApplicationHandlerStop):
+        asyncio.run(rate_limit_guard(update, SimpleNamespace(user_data={})))
+
+    assert replies == [STRINGS.RATE_LIMITED_GLOBAL.format(seconds=3)]
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from types import SimpleNamespace
+
+import fakeredis
+
+from bot.features import ai_patient, response_cache
+from bot.features.ai_patient import SESSION_KEY, handle_patient_message
+from bot.features.response_cache import ResponseCache, normalize_question
+from bot.history import ConversationSummary
+from bot.i18n_es import STRINGS
+
+
+def _cache(**overrides) -> ResponseCache:
+    options = {"ttl_seconds": 60, "max_entries": 10, "max_variants": 1, "rng": random.Random(3)}
+    options.update(overrides)
+    return ResponseCache(fakeredis.FakeAsyncRedis(decode_responses=True), **options)
+
+
+def test_questions_are_normalised_into_the_same_key():
+    cache = _cache()
+
+    assert normalize_question("¿Qué EDAD tiene?") == "que edad tiene"
+    assert cache.key("sofia", 2, "¿Qué edad tiene?", 0) == cache.key("sofia", 2, "que edad tiene", 0)
+    assert cache.key("sofia", 2, "¿Qué edad tiene?", 0) != cache.key("sofia", 3, "¿Qué edad tiene?", 0)
+    assert cache.key("sofia", 2, "¿Qué edad tiene?", 0) != cache.key("sofia", 2, "¿Qué edad tiene?", 8)
+
+
+def test_follow_ups_are_keyed_on_the_preceding_turns():
+    cache = _cache()
+    headache = ["¿Le duele la cabeza?", "Sí, desde el lunes."]
+    fever = ["¿Ha tenido fiebre?", "Sí, 39 grados anoche."]
+
+    assert cache.key("sofia", 1, "¿Y desde cuándo?", 8, ["Hola", *headache]) != cache.key(
+        "sofia", 1, "¿Y desde cuándo?", 8, ["Hola", *fever]
+    )
+    assert cache.key("sofia", 1, "¿Y desde cuándo?", 8, ["Hola", *headache]) == cache.key(
+        "sofia", 1, "¿y desde cuando?", 8, ["Buenas", "¿le duele la cabeza", "Sí desde el lunes"]
+    )
+
+
+def test_cache_collects_variants_evicts_lru_and_reports_hit_rate():
+    async def scenario():
+        cache = _cache(max_entries=2, max_variants=2)
+        first, second, third = (cache.key("sofia", 1, question, 0) for question in ("edad", "dolor", "fiebre"))
+        misses = [await cache.get(first)]
+        await cache.put(first, "Tengo 24 años.", 2.0)
+        await cache.put(first, "Veinticuatro años.", 2.0)
+        answers = {await cache.get(first) for _ in range(20)}
+        await cache.put(second, "Desde ayer.", 2.0)
+        await cache.get(first)
+        await cache.put(third, "No he tenido fiebre.", 2.0)
+        misses.append(await cache.get(second))
+        return misses, answers, await cache.get(first), await cache.stats()
+
+    misses, answers, survivor, stats = asyncio.run(scenario())
+
+    assert misses == [None, None]
+    assert answers == {"Tengo 24 años.", "Veinticuatro años."}
+    assert survivor in answers
+    assert stats.hits == 22 and stats.misses == 2
+    assert round(stats.hit_rate, 2) == 0.92
+    assert stats.saved_seconds == 22 * 2.0
+
+
+def test_repeated_question_is_served_from_cache(monkeypatch):
+    replies: list[str] = []
+    calls: list[dict] = []
+    logs: list[tuple] = []
+
+    class DummyMessage:
+        text = "¿Qué edad tiene?"
+
+        async def reply_text(self, text: str, reply_markup=None) -> None:
+            replies.append(text)
+
+    async def fake_fetch(context):
+        return {"id": 1, "slug": "sofia", "display_name": "Sofía", "summary": "", "persona": {}, "version": 4}
+
+    async def fake_append(*args, **kwargs):
+        logs.append(args)
+
+    async def fake_history(*args, **kwargs):
+        return []
+
+    async def fake_summary(*args, **kwargs):
+        return ConversationSummary()
+
+    async def fake_call_llm(payload):
+        calls.append(payload)
+        return "Tengo 24 años."
+
+    cache = _cache()
+    monkeypatch.setattr(response_cache, "_cache", cache)
+    monkeypatch.setattr(ai_patient.settings, "response_cache_enabled", True)
+    monkeypatch.setattr(ai_patient.settings, "llm_streaming", False)
+    monkeypatch.setattr(ai_patient, "_fetch_patient", fake_fetch)
+    monkeypatch.setattr(ai_patient, "_append_log", fake_append)
+    monkeypatch.setattr(ai_patient, "_load_history", fake_history)
+    monkeypatch.setattr(ai_patient, "_load_summary", fake_summary)
+    monkeypatch.setattr(ai_patient, "_call_llm", fake_call_llm)
+
+    async def scenario():
+        for session_id in (5, 6):
+            update = SimpleNamespace(message=DummyMessage())
+            await handle_patient_message(update, SimpleNamespace(user_data={SESSION_KEY: session_id}))
+        return await cache.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert replies == [f"{STRINGS.AI_DISCLAIMER}\n\nTengo 24 años."] * 2
+    assert logs[-1] == (6, "patient", "Tengo 24 años.", {"cached": True})
+    assert stats.hits == 1 and stats.misses == 1
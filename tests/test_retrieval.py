@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+
+from bot.features.ai_patient import _build_system_prompt, _retrieve_passages
+from common.retrieval import PassageIndex, build_bm25_index
+from common.text import estimate_tokens, tokenize
+from scripts.seed_patient_from_pdf import chunk_sections, iter_pages, parse_sections
+
+NOTE = """Datos generales
+Sofía Hernández, mujer de 24 años, estudiante de medicina.
+Antecedentes
+Gastritis crónica diagnosticada a los 18 años. Sin cirugías previas.
+Alergias
+Alérgica a la penicilina, presenta urticaria.
+Hábitos
+Toma café tres veces al día y duerme cinco horas.
+Impresión diagnóstica
+Dispepsia funcional.
+"""
+
+
+def test_tokenize_folds_accents_and_drops_stopwords():
+    assert tokenize("¿Eres alérgica a la Penicilina?") == ["eres", "alergica", "penicilina"]
+    assert estimate_tokens("abcdefgh") == 2
+
+
+def test_bm25_retrieves_relevant_passages_within_budget():
+    index = PassageIndex.from_payload(build_bm25_index(chunk_sections(parse_sections(NOTE))))
+
+    allergy = index.top_passages("¿Tienes alergia a la penicilina?", k=2, token_budget=200)
+    habits = index.top_passages("¿Cuánto café tomas?", k=1, token_budget=200)
+
+    assert allergy[0].startswith("Alergias:")
+    assert habits == ["Hábitos: Toma café tres veces al día y duerme cinco horas."]
+    assert index.top_passages("café", k=3, token_budget=5) == []
+    assert index.search("radiografía", k=3) == []
+    assert not any("Dispepsia" in passage for passage in index.passages)
+
+
+def test_system_prompt_includes_retrieved_fragments():
+    sections = parse_sections(iter_pages(Path("data/patient_notes/sofia_case.txt")))
+    index = PassageIndex.from_payload(build_bm25_index(chunk_sections(sections)))
+    patient = {"persona": {"demografia": "Sofía"}, "retriever": index}
+
+    passages = _retrieve_passages(patient, "¿Qué medicamentos tomas?")
+    prompt = _build_system_prompt(patient["persona"], passages)
+
+    assert _retrieve_passages({"persona": {}}, "hola") == []
+    assert passages and prompt.endswith(passages[-1])
+    assert "Fragmentos de la historia clínica" in prompt
+
+
+def test_postings_score_like_the_dense_matrix():
+    payload = build_bm25_index(chunk_sections(parse_sections(iter_pages(Path("data/patient_notes/sofia_case.txt")))))
+    index = PassageIndex.from_payload(payload)
+    dense = np.zeros((len(payload["passages"]), len(payload["vocab"])), dtype=np.float32)
+    for row, entries in enumerate(payload["weights"]):
+        for column, weight in entries:
+            dense[row, column] = weight
+    positions = {term: column for column, term in enumerate(payload["vocab"])}
+
+    for query in ("¿Qué medicamentos tomas?", "dolor abdominal después de comer", "alergias"):
+        columns = sorted({positions[term] for term in tokenize(query) if term in positions})
+        scores = dense[:, columns].sum(axis=1)
+        expected = [int(i) for i in np.argsort(-scores, kind="stable")[:3] if scores[i] > 0]
+        assert index.search(query, k=3) == expected
+    assert sum(len(rows) for rows, _ in index._postings.values()) == sum(len(row) for row in payload["weights"])
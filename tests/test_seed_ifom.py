@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import json
+
+import pytest
+from sqlalchemy import select
+
+from common.db import IFOM_BANK_VERSION_KEY, IFOMItem, Setting
+from scripts.seed_ifom import SeedSummary, adapt_case, iter_cases, iter_json_array, persist_items, stream_items
+
+
+def _item(external_id: str, stem: str = "Caso") -> dict:
+    return {
+        "id": external_id,
+        "stem": stem,
+        "options": ["A", "B"],
+        "answer_index": 0,
+        "explanation": "",
+        "tags": ["cardio"],
+    }
+
+
+def test_reseed_only_touches_changed_items(sqlite_get_session):
+    async def scenario():
+        first = await persist_items(
+            [_item("a"), _item("b"), _item("c")], batch_size=2, session_factory=sqlite_get_session
+        )
+        second = await persist_items(
+            [_item("a"), _item("b", stem="Caso corregido"), _item("d")],
+            batch_size=2,
+            prune=True,
+            session_factory=sqlite_get_session,
+        )
+        unchanged = await persist_items(
+            [_item("a"), _item("b", stem="Caso corregido"), _item("d")], session_factory=sqlite_get_session
+        )
+        async with sqlite_get_session() as session:
+            rows = (await session.scalars(select(IFOMItem).order_by(IFOMItem.external_id))).all()
+            stamp = await session.get(Setting, IFOM_BANK_VERSION_KEY)
+        return first, second, unchanged, rows, stamp.value["version"]
+
+    first, second, unchanged, rows, version = asyncio.run(scenario())
+
+    assert first == SeedSummary(inserted=3)
+    assert second == SeedSummary(inserted=1, updated=1, unchanged=1, deleted=1)
+    assert unchanged == SeedSummary(unchanged=3)
+    assert [(row.external_id, row.stem) for row in rows] == [("a", "Caso"), ("b", "Caso corregido"), ("d", "Caso")]
+    assert all(row.content_hash for row in rows)
+    assert version == 2
+
+
+def _case(external_id: str) -> dict:
+    return {"id": external_id, "stem": "¿Diagnóstico?", "options": [{"text": "A", "is_correct": True}, {"text": "B"}]}
+
+
+def test_iter_json_array_streams_cases_across_chunk_boundaries():
+    document = json.dumps(
+        {"meta": {"note": "\"cases\": [] en texto"}, "cases": [_case("a"), _case("b"), _case("c")], "extra": 1},
+        ensure_ascii=False,
+        indent=2,
+    )
+
+    cases = list(iter_json_array(io.StringIO(document), "cases", chunk_size=7))
+
+    assert [case["id"] for case in cases] == ["a", "b", "c"]
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 21))
+def test_iter_json_array_keeps_scalars_split_across_chunks(chunk_size):
+    document = '{"version": 123456, "ratio": 1.5e10, "draft": true, "owner": null, "cases": [{"id": "a"}, {"id": "b"}]}'
+
+    cases = list(iter_json_array(io.StringIO(document), "cases", chunk_size=chunk_size))
+
+    assert cases == [{"id": "a"}, {"id": "b"}]
+
+
+def test_stream_items_bumps_version_with_each_committed_batch(sqlite_get_session):
+    def interrupted():
+        yield _item("a")
+        yield _item("b")
+        raise RuntimeError("proceso interrumpido")
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await stream_items(interrupted(), batch_size=2, session_factory=sqlite_get_session)
+        async with sqlite_get_session() as session:
+            stamp = await session.get(Setting, IFOM_BANK_VERSION_KEY)
+            count = len((await session.scalars(select(IFOMItem.id))).all())
+        return stamp, count
+
+    stamp, count = asyncio.run(scenario())
+
+    assert count == 2
+    assert stamp is not None and stamp.value["version"] == 1
+
+
+def test_stream_items_reads_jsonl_in_batches(tmp_path, sqlite_get_session):
+    path = tmp_path / "bank.jsonl"
+    path.write_text("\n".join(json.dumps(_case(str(i))) for i in range(5)) + "\n", encoding="utf-8")
+    progress = []
+
+    async def scenario():
+        items = (adapt_case(case, idx) for idx, case in enumerate(iter_cases(path), start=1))
+        summary = await stream_items(
+            items,
+            batch_size=2,
+            session_factory=sqlite_get_session,
+            progress=lambda processed, _: progress.append(processed),
+        )
+        async with sqlite_get_session() as session:
+            count = len((await session.scalars(select(IFOMItem.id))).all())
+        return summary, count
+
+    summary, count = asyncio.run(scenario())
+
+    assert summary == SeedSummary(inserted=5)
+    assert count == 5
+    assert progress == [2, 4, 5]
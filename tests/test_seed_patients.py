@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import asyncio
+
+from sqlalchemy import select
+
+from common.db import Patient
+from scripts.seed_patient_from_pdf import seed_directory
+
+
+def _note(name: str, complaint: str) -> str:
+    return f"Datos generales\n{name}\nMotivo de consulta\n{complaint}\n"
+
+
+def test_seed_directory_skips_unchanged_notes(tmp_path, sqlite_get_session):
+    notes = tmp_path / "notes"
+    notes.mkdir()
+    (notes / "ana.txt").write_text(_note("Ana Pérez, 34 años", "Cefalea"), encoding="utf-8")
+    (notes / "luis.txt").write_text(_note("Luis Gómez, 58 años", "Disnea"), encoding="utf-8")
+
+    async def scenario():
+        first = await seed_directory(notes, max_workers=2, session_factory=sqlite_get_session)
+        (notes / "luis.txt").write_text(_note("Luis Gómez, 59 años", "Tos"), encoding="utf-8")
+        second = await seed_directory(notes, max_workers=2, session_factory=sqlite_get_session)
+        third = await seed_directory(notes, max_workers=2, session_factory=sqlite_get_session)
+        async with sqlite_get_session() as session:
+            patients = (await session.scalars(select(Patient).order_by(Patient.slug))).all()
+        return first, second, third, patients
+
+    first, second, third, patients = asyncio.run(scenario())
+
+    assert sorted(persona.slug for persona in first) == ["ana", "luis"]
+    assert [persona.slug for persona in second] == ["luis"]
+    assert third == []
+    assert [(patient.slug, patient.summary) for patient in patients] == [("ana", "Cefalea"), ("luis", "Tos")]
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+from contextlib import closing
+from functools import partial
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import event, func, select
+from telegram import Update
+
+from bot.update_processor import ChatOrderedUpdateProcessor
+from common import db
+from common.db import Setting, current_unit_of_work, get_session, release_connection, unit_of_work
+
+
+@pytest.fixture
+def engine(sqlite_sessionmaker):
+    engine = sqlite_sessionmaker.kw["bind"]
+    event.listen(engine.sync_engine, "before_cursor_execute", db._count_query)
+    yield engine
+    event.remove(engine.sync_engine, "before_cursor_execute", db._count_query)
+
+
+async def _count_settings(sessionmaker) -> int:
+    async with sessionmaker() as session:
+        return await session.scalar(select(func.count()).select_from(Setting))
+
+
+def test_helpers_share_one_session_and_commit_once(engine, sqlite_sessionmaker):
+    async def helper(key: str) -> None:
+        async with get_session() as session:
+            session.add(Setting(key=key, value={}))
+            await session.commit()
+
+    async def scenario():
+        async with unit_of_work(bind=engine) as unit:
+            async with get_session() as first, get_session() as second:
+                assert first is second is unit.session
+            await helper("a")
+            await helper("b")
+            visible_before_end = await _count_settings(sqlite_sessionmaker)
+        return unit, visible_before_end, await _count_settings(sqlite_sessionmaker)
+
+    unit, before, after = asyncio.run(scenario())
+
+    assert before == 0
+    assert after == 2
+    assert unit.queries >= 2
+
+
+def test_failed_update_rolls_back_everything(engine, sqlite_sessionmaker):
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            async with unit_of_work(bind=engine):
+                async with get_session() as session:
+                    session.add(Setting(key="a", value={}))
+                    await session.commit()
+                raise RuntimeError("handler roto")
+        return await _count_settings(sqlite_sessionmaker)
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_background_tasks_do_not_borrow_the_update_session(engine):
+    async def scenario():
+        async with unit_of_work(bind=engine) as unit:
+            async def background():
+                return current_unit_of_work()
+
+            assert current_unit_of_work() is unit
+            return await asyncio.create_task(background())
+
+    assert asyncio.run(scenario()) is None
+
+
+def test_release_connection_commits_pending_work(engine, sqlite_sessionmaker):
+    async def scenario():
+        async with unit_of_work(bind=engine) as unit:
+            async with get_session() as session:
+                session.add(Setting(key="a", value={}))
+                await session.commit()
+            await release_connection()
+            assert not unit.session.in_transaction()
+            return await _count_settings(sqlite_sessionmaker)
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_processor_records_queries_per_update(engine):
+    update = Update.de_json(
+        {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": 3, "type": "private"},
+                "text": "hola",
+            },
+        },
+        None,
+    )
+
+    async def handler() -> None:
+        async with get_session() as session:
+            await session.scalar(select(func.count()).select_from(Setting))
+            await session.get(Setting, "x")
+
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(
+            2, max_pending_per_chat=5, unit_of_work_factory=partial(unit_of_work, bind=engine)
+        )
+        await processor.process_update(update, handler())
+        return processor
+
+    processor = asyncio.run(scenario())
+
+    assert list(processor.query_counts) == [2]
+
+
+def _visibility_probe(engine, table: str, seen: list):
+    def probe(row_id: int) -> None:
+        with closing(sqlite3.connect(engine.url.database)) as connection:
+            row = connection.execute(f"SELECT 1 FROM {table} WHERE id = ?", (row_id,)).fetchone()
+        seen.append((row_id, row is not None))
+
+    return probe
+
+
+def test_after_commit_callbacks_wait_for_the_real_commit(engine):
+    calls: list[str] = []
+
+    async def scenario():
+        async with unit_of_work(bind=engine):
+            db.after_commit(lambda: calls.append("hecho"))
+            assert calls == []
+        db.after_commit(lambda: calls.append("sin unidad"))
+
+    asyncio.run(scenario())
+
+    assert calls == ["hecho", "sin unidad"]
+
+
+def test_uploaded_document_is_visible_when_the_indexer_runs(monkeypatch, tmp_path, engine, sqlite_sessionmaker):
+    from bot.features import syllabus_grades
+    from common.db import Document
+
+    seen: list = []
+    monkeypatch.setattr(
+        syllabus_grades,
+        "get_document_indexer",
+        lambda: SimpleNamespace(enqueue=_visibility_probe(engine, Document.__tablename__, seen)),
+    )
+    monkeypatch.setattr(syllabus_grades.settings, "syllabus_dir", str(tmp_path))
+
+    async def download_to_drive(custom_path):
+        Path(custom_path).write_bytes(b"%PDF-1.4")
+
+    async def get_file(file_id):
+        return SimpleNamespace(download_to_drive=download_to_drive)
+
+    async def reply_text(*args, **kwargs):
+        return None
+
+    document = SimpleNamespace(mime_type="application/pdf", file_name="guia.pdf", file_id="f", file_unique_id="u")
+    update = SimpleNamespace(
+        message=SimpleNamespace(document=document, reply_text=reply_text),
+        effective_user=SimpleNamespace(id=1),
+        callback_query=None,
+    )
+    context = SimpleNamespace(bot=SimpleNamespace(get_file=get_file))
+
+    async def scenario():
+        async with unit_of_work(bind=engine):
+            await syllabus_grades.handle_document_upload(update, context)
+        return seen
+
+    assert asyncio.run(scenario()) == [(1, True)]
+
+
+def test_new_broadcast_is_visible_when_delivery_starts(monkeypatch, engine, sqlite_sessionmaker):
+    from bot.features import broadcast
+    from common.db import Broadcast
+
+    seen: list = []
+    probe = _visibility_probe(engine, Broadcast.__tablename__, seen)
+    monkeypatch.setattr(broadcast, "start_broadcast", lambda bot, broadcast_id: probe(broadcast_id))
+
+    async def reply_text(*args, **kwargs):
+        return None
+
+    user = SimpleNamespace(id=1, first_name="Ana", last_name=None, username=None, language_code="es")
+    update = SimpleNamespace(message=SimpleNamespace(reply_text=reply_text), effective_user=user, callback_query=None)
+    context = SimpleNamespace(args=["Aviso", "|", "Mañana", "no", "hay", "clase"], bot=None)
+
+    async def scenario():
+        async with unit_of_work(bind=engine):
+            await broadcast.handle_broadcast_command(update, context)
+        return seen
+
+    assert asyncio.run(scenario()) == [(1, True)]
+
+
+def test_evaluation_job_is_visible_when_the_worker_wakes(monkeypatch, engine, sqlite_sessionmaker):
+    from bot.features import ai_patient
+    from common.db import EvaluationJob, Patient, SimSession, User
+
+    seen: list = []
+    probe = _visibility_probe(engine, EvaluationJob.__tablename__, seen)
+
+    async def fake_fetch(context):
+        return {"id": 1, "slug": "dummy", "persona": {}}
+
+    async def fake_append(*args, **kwargs):
+        return None
+
+    async def reply_text(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(ai_patient, "_fetch_patient", fake_fetch)
+    monkeypatch.setattr(ai_patient, "_append_log", fake_append)
+    monkeypatch.setattr(ai_patient, "notify_evaluation_worker", lambda: probe(1))
+
+    update = SimpleNamespace(
+        message=SimpleNamespace(reply_text=reply_text),
+        callback_query=None,
+        effective_chat=SimpleNamespace(id=9),
+        effective_user=None,
+    )
+    context = SimpleNamespace(user_data={ai_patient.SESSION_KEY: 4})
+
+    async def scenario():
+        async with sqlite_sessionmaker() as session:
+            session.add(User(id=1, role="student"))
+            session.add(Patient(id=1, slug="dummy", display_name="Paciente", persona={}))
+            session.add(SimSession(id=4, user_id=1, patient_id=1))
+            await session.commit()
+        async with unit_of_work(bind=engine):
+            await ai_patient.handle_patient_termination(update, context)
+        return seen
+
+    assert asyncio.run(scenario()) == [(1, True)]
+
+
+def test_handler_error_rolls_back_the_update(engine, sqlite_sessionmaker):
+    from telegram import User
+    from telegram.ext import ApplicationBuilder, ExtBot, TypeHandler
+
+    from bot.update_processor import rollback_on_error
+
+    class OfflineBot(ExtBot):
+        async def get_me(self, *args, **kwargs):
+            return User(id=99, is_bot=True, first_name="CISEC", username="cisec_bot")
+
+    handled: list[int] = []
+
+    async def failing_handler(update, context):
+        async with get_session() as session:
+            session.add(Setting(key="parcial", value={}))
+            await session.commit()
+        handled.append(update.update_id)
+        raise RuntimeError("handler roto")
+
+    application = ApplicationBuilder().bot(OfflineBot("123:abc")).build()
+    application.add_handler(TypeHandler(Update, failing_handler))
+    application.add_error_handler(rollback_on_error)
+    update = Update.de_json(
+        {"update_id": 5, "message": {"message_id": 1, "date": 0, "chat": {"id": 3, "type": "private"}}}, None
+    )
+
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(
+            2, max_pending_per_chat=5, unit_of_work_factory=partial(unit_of_work, bind=engine)
+        )
+        await application.initialize()
+        try:
+            await processor.process_update(update, application.process_update(update))
+        finally:
+            await application.shutdown()
+        return await _count_settings(sqlite_sessionmaker)
+
+    assert asyncio.run(scenario()) == 0
+    assert handled == [5]
+
+
+def test_connection_is_released_before_folding_history(monkeypatch, engine):
+    from datetime import datetime, timedelta
+
+    from bot.features import ai_patient
+    from bot.history import ConversationSummary, HistoryBuffer, HistoryEntry
+
+    in_transaction: list[bool] = []
+    start = datetime(2024, 1, 1)
+    entries = [
+        HistoryEntry("student", f"pregunta larga número {index} " * 20, start + timedelta(minutes=index))
+        for index in range(6)
+    ]
+
+    async def fake_history(session_id):
+        async with get_session() as session:
+            await session.get(Setting, "x")
+        return entries
+
+    async def fake_summary(session_id):
+        return ConversationSummary()
+
+    async def fake_call_llm(payload):
+        in_transaction.append(current_unit_of_work().session.in_transaction())
+        return "Resumen"
+
+    monkeypatch.setattr(
+        ai_patient, "_history_buffer", HistoryBuffer(ai_patient.MAX_HISTORY_MESSAGES, max_sessions=10)
+    )
+    monkeypatch.setattr(ai_patient, "_load_history", fake_history)
+    monkeypatch.setattr(ai_patient, "_load_summary", fake_summary)
+    monkeypatch.setattr(ai_patient, "_call_llm", fake_call_llm)
+    monkeypatch.setattr(ai_patient.settings, "history_token_budget", 100)
+
+    async def scenario():
+        async with unit_of_work(bind=engine):
+            await ai_patient._build_conversation(1, wait=True)
+
+    asyncio.run(scenario())
+
+    assert in_transaction == [False]
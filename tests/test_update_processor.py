@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from itertools import count
+
+from telegram import Update
+
+from bot.update_processor import ChatOrderedUpdateProcessor, ordering_key
+
+_ids = count(1)
+
+
+def _message(chat_id: int) -> Update:
+    update_id = next(_ids)
+    return Update.de_json(
+        {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": chat_id, "is_bot": False, "first_name": "Ana"},
+                "text": f"mensaje {update_id}",
+            },
+        },
+        None,
+    )
+
+
+def _poll_answer(user_id: int) -> Update:
+    return Update.de_json(
+        {
+            "update_id": next(_ids),
+            "poll_answer": {
+                "poll_id": "p1",
+                "user": {"id": user_id, "is_bot": False, "first_name": "Ana"},
+                "option_ids": [0],
+            },
+        },
+        None,
+    )
+
+
+def test_ordering_key_uses_chat_then_user():
+    assert ordering_key(_message(10)) == 10
+    assert ordering_key(_poll_answer(11)) == 11
+    assert ordering_key(object()) is None
+
+
+def test_updates_run_in_order_per_chat_and_concurrently_across_chats():
+    events: list[tuple[int, int]] = []
+    running = 0
+    peak = 0
+
+    async def handler(chat_id: int, index: int, delay: float) -> None:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(delay)
+        running -= 1
+        events.append((chat_id, index))
+
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(4, max_pending_per_chat=10)
+        tasks = []
+        for index in range(5):
+            for chat_id in (1, 2, 3):
+                delay = 0.03 if index == 0 else 0.005
+                tasks.append(
+                    asyncio.create_task(processor.process_update(_message(chat_id), handler(chat_id, index, delay)))
+                )
+        await asyncio.gather(*tasks)
+        return processor
+
+    processor = asyncio.run(scenario())
+
+    for chat_id in (1, 2, 3):
+        assert [index for chat, index in events if chat == chat_id] == list(range(5))
+    assert peak == 3
+    assert processor.processed == 15 and processor.active_chats == 0
+
+
+def test_slow_chat_does_not_block_other_chats():
+    finished: list[str] = []
+
+    async def slow() -> None:
+        await asyncio.sleep(0.2)
+        finished.append("lento")
+
+    async def fast() -> None:
+        finished.append("rápido")
+
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(8, max_pending_per_chat=10)
+        slow_task = asyncio.create_task(processor.process_update(_message(1), slow()))
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        await processor.process_update(_message(2), fast())
+        elapsed = time.monotonic() - started
+        await slow_task
+        return elapsed
+
+    elapsed = asyncio.run(scenario())
+
+    assert finished == ["rápido", "lento"]
+    assert elapsed < 0.1
+
+
+def test_throughput_scales_with_concurrency():
+    async def handler() -> None:
+        await asyncio.sleep(0.02)
+
+    async def run(concurrency: int) -> float:
+        processor = ChatOrderedUpdateProcessor(concurrency, max_pending_per_chat=10)
+        started = time.monotonic()
+        await asyncio.gather(*(processor.process_update(_message(chat_id), handler()) for chat_id in range(16)))
+        return time.monotonic() - started
+
+    serial = asyncio.run(run(1))
+    parallel = asyncio.run(run(8))
+
+    assert parallel * 3 < serial
+
+
+def test_backlog_beyond_limit_is_dropped():
+    handled: list[int] = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def first() -> None:
+            await release.wait()
+            handled.append(0)
+
+        async def later(index: int) -> None:
+            handled.append(index)
+
+        processor = ChatOrderedUpdateProcessor(4, max_pending_per_chat=2)
+        head = asyncio.create_task(processor.process_update(_message(5), first()))
+        await asyncio.sleep(0)
+        for index in range(1, 5):
+            await processor.process_update(_message(5), later(index))
+        release.set()
+        await head
+        return processor
+
+    processor = asyncio.run(scenario())
+
+    assert handled == [0, 1, 2]
+    assert processor.dropped == 2
+
+
+def test_dropped_and_abandoned_updates_are_reported():
+    dropped: list[int] = []
+
+    async def on_drop(update) -> None:
+        dropped.append(update.update_id)
+
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(4, max_pending_per_chat=1, on_drop=on_drop)
+        updates = [_message(5) for _ in range(3)]
+        first = asyncio.create_task(processor.process_update(updates[0], asyncio.sleep(0.5)))
+        await asyncio.sleep(0)
+        await processor.process_update(updates[1], asyncio.sleep(0))
+        await processor.process_update(updates[2], asyncio.sleep(0))
+        await processor.shutdown()
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        return [update.update_id for update in updates]
+
+    ids = asyncio.run(scenario())
+
+    assert dropped == [ids[2], ids[1]]
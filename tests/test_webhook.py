@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import fakeredis
+from fastapi.testclient import TestClient
+
+from bot import webhook, worker
+from bot.update_processor import ChatOrderedUpdateProcessor
+from bot.webhook import (
+    WEBHOOK_PATH,
+    create_webhook_app,
+    enqueue_update,
+    processing_queue_key,
+    shard_for,
+    update_queue_key,
+)
+
+
+def _message_update(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": 1,
+            "date": 0,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Ana"},
+            "text": "Hola",
+        },
+    }
+
+
+def test_enqueue_update_deduplicates_retried_deliveries():
+    async def scenario():
+        redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+        payload = _message_update(100, 42)
+        first = await enqueue_update(redis, payload, shards=4, dedup_ttl=60)
+        retry = await enqueue_update(redis, payload, shards=4, dedup_ttl=60)
+        queued = await redis.lrange(update_queue_key(shard_for(payload, 4)), 0, -1)
+        return first, retry, queued
+
+    first, retry, queued = asyncio.run(scenario())
+
+    assert (first, retry) == (True, False)
+    assert [json.loads(item)["update_id"] for item in queued] == [100]
+
+
+def test_updates_from_same_chat_share_a_shard():
+    callback = {"update_id": 2, "callback_query": {"id": "x", "from": {"id": 42}, "message": {"chat": {"id": 42}}}}
+    assert shard_for(_message_update(1, 42), 4) == shard_for(callback, 4)
+
+
+def test_webhook_rejects_wrong_secret(monkeypatch):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(webhook, "get_redis", lambda: redis)
+    monkeypatch.setattr(webhook.settings, "webhook_secret", "s3cret")
+
+    with TestClient(create_webhook_app()) as client:
+        rejected = client.post(WEBHOOK_PATH, json=_message_update(5, 1))
+        accepted = client.post(
+            WEBHOOK_PATH, json=_message_update(5, 1), headers={"X-Telegram-Bot-Api-Secret-Token": "s3cret"}
+        )
+
+    assert rejected.status_code == 403
+    assert accepted.json() == {"ok": True, "queued": True}
+
+
+class _ShardApplication:
+    def __init__(self, handler):
+        self.bot = None
+        self.update_processor = SimpleNamespace(process_update=self._process_update)
+        self._handler = handler
+        self.tasks: list[asyncio.Task] = []
+
+    async def _process_update(self, update, coroutine):
+        await coroutine
+
+    async def process_update(self, update):
+        await self._handler(update)
+
+    def create_task(self, coroutine, update=None):
+        task = asyncio.create_task(coroutine)
+        self.tasks.append(task)
+        return task
+
+
+def test_shard_worker_keeps_updates_until_they_are_handled(monkeypatch):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(worker, "get_redis", lambda: redis)
+    release = asyncio.Event()
+    handled: list[int] = []
+
+    async def handler(update):
+        await release.wait()
+        handled.append(update.update_id)
+
+    async def scenario():
+        application = _ShardApplication(handler)
+        await redis.lpush(update_queue_key(0), json.dumps(_message_update(7, 4)))
+        consumer = asyncio.create_task(worker.consume_shard(application, 0))
+        await asyncio.sleep(0.05)
+        in_flight = await redis.lrange(processing_queue_key(0), 0, -1)
+        release.set()
+        await asyncio.gather(*application.tasks)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        return in_flight, await redis.llen(processing_queue_key(0))
+
+    in_flight, remaining = asyncio.run(scenario())
+
+    assert [json.loads(item)["update_id"] for item in in_flight] == [7]
+    assert handled == [7]
+    assert remaining == 0
+
+
+def test_shard_worker_replays_updates_left_by_a_crash(monkeypatch):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(worker, "get_redis", lambda: redis)
+    handled: list[int] = []
+
+    async def handler(update):
+        handled.append(update.update_id)
+
+    async def scenario():
+        application = _ShardApplication(handler)
+        await redis.lpush(processing_queue_key(1), json.dumps(_message_update(1, 5)), json.dumps(_message_update(2, 5)))
+        await redis.lpush(update_queue_key(1), json.dumps(_message_update(3, 5)))
+        consumer = asyncio.create_task(worker.consume_shard(application, 1))
+        await asyncio.sleep(0.05)
+        await asyncio.gather(*application.tasks)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        return await redis.llen(processing_queue_key(1))
+
+    remaining = asyncio.run(scenario())
+
+    assert handled == [1, 2, 3]
+    assert remaining == 0
+
+
+def test_shard_worker_releases_updates_dropped_by_the_processor(monkeypatch):
+    redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(worker, "get_redis", lambda: redis)
+    release = asyncio.Event()
+    handled: list[int] = []
+
+    async def handler(update):
+        await release.wait()
+        handled.append(update.update_id)
+
+    async def scenario():
+        application = _ShardApplication(handler)
+        application.update_processor = ChatOrderedUpdateProcessor(4, max_pending_per_chat=1)
+        for update_id in range(1, 5):
+            await redis.lpush(update_queue_key(2), json.dumps(_message_update(update_id, 9)))
+        consumer = asyncio.create_task(worker.consume_shard(application, 2))
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(*application.tasks)
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        return application.update_processor.dropped, await redis.llen(processing_queue_key(2))
+
+    dropped, remaining = asyncio.run(scenario())
+
+    assert handled == [1, 2]
+    assert dropped == 2
+    assert remaining == 0